@@ -0,0 +1,245 @@
+"""
+Benchmark pipeline chụp ảnh không cần DVR:
+quẹt thẻ -> chọn ảnh (CaptureWorker) -> lưu file (FileManager) -> ghi DB (tùy chọn)
+Đo độ trễ từng bước và CPU trên mỗi camera, chạy được trên máy Linux bất kỳ.
+
+Cách chạy:
+    python benchmark.py --cameras 4 --swipes 20
+    python benchmark.py --source "file:///data/cong.mp4?fps=25" --multiprocess
+    python benchmark.py --db      (ghi phiên BENCH-* vào DB trong config.json, chỉ dùng DB thử nghiệm)
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from PyQt5.QtCore import QCoreApplication, QTimer
+
+from camera_manager import CameraManager
+from camera_stats import RollingHistogram, format_stats
+from capture_worker import CaptureWorker
+from config_manager import ConfigManager
+from file_manager import FileManager
+from image_writer import ImageWriter
+from logger import ParkingLogger
+
+
+def process_cpu_seconds(pid: int):
+    """Tổng CPU (user + system, giây) của một process con đọc từ /proc (Linux), None nếu không đọc được"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PipelineBenchmark:
+    """Chạy N camera giả lập và quẹt thẻ định kỳ, ghi nhận độ trễ từng bước"""
+
+    def __init__(self, args):
+        self.args = args
+        self.app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+        self.config_manager = ConfigManager(args.config)
+        camera_cfg = self.config_manager.config.setdefault("camera", {})
+        camera_cfg["multiprocess"] = args.multiprocess
+        camera_cfg["preview_fps"] = args.preview_fps
+        self.camera_cfg = self.config_manager.get_camera_config()
+
+        self.save_directory = args.save_dir or tempfile.mkdtemp(prefix="parking-bench-")
+        self.logger = ParkingLogger(os.path.join(self.save_directory, "benchmark.log"))
+        storage_cfg = self.config_manager.get_storage_config()
+        self.file_manager = FileManager(self.save_directory, self.logger,
+                                        ImageWriter(workers=storage_cfg["writer_threads"],
+                                                    queue_size=storage_cfg["write_queue_size"],
+                                                    jpeg_quality=storage_cfg["jpeg_quality"],
+                                                    fsync_interval=storage_cfg["fsync_interval"],
+                                                    pack_mode=storage_cfg["backend"] == "pack",
+                                                    thumbnail_width=storage_cfg["thumbnail_width"]
+                                                    if storage_cfg["thumbnail_on_save"] else 0,
+                                                    logger=self.logger))
+        self.db = None
+        if args.db:
+            from database import ParkingDatabase
+            self.db = ParkingDatabase(self.config_manager.get_database_config(),
+                                      pool_config=self.config_manager.get_database_pool_config())
+
+        self.manager = CameraManager(self.config_manager, self.logger)
+        self.lanes = []
+        buffer_size = self.manager.window_buffer_size()
+        for index in range(0, args.cameras, 2):
+            front = self.manager.create_camera_thread(args.source, f"cam{index}", args.preview_fps, buffer_size)
+            rear = None
+            if index + 1 < args.cameras:
+                rear = self.manager.create_camera_thread(args.source, f"cam{index + 1}", args.preview_fps,
+                                                         buffer_size)
+            self.lanes.append((f"LANE{index // 2}", front, rear))
+        self.threads = [t for _, front, rear in self.lanes for t in (front, rear) if t is not None]
+        for thread in self.threads:
+            # Lấy frame preview như CameraWidget (có tính chi phí chuyển đổi QImage)
+            thread.frame_ready.connect(thread.take_preview_frame)
+
+        self.select_ms = RollingHistogram(float("inf"))
+        self.save_ms = RollingHistogram(float("inf"))
+        self.db_ms = RollingHistogram(float("inf"))
+        self.total_ms = RollingHistogram(float("inf"))
+        self.workers = set()
+        self.swipes = 0
+        self.done = 0
+        self.errors = []
+
+    def run(self):
+        for thread in self.threads:
+            thread.start()
+        print(f"{len(self.threads)} camera, nguồn {self.args.source}, lưu ảnh tại {self.save_directory}")
+        print(f"Chờ {self.args.warmup:.0f}s cho camera ổn định...")
+
+        QTimer.singleShot(int(self.args.warmup * 1000), self._start_measuring)
+        self.app.exec_()
+
+        for thread in self.threads:
+            thread.request_stop()
+        for thread in self.threads:
+            thread.stop()
+        write_start = time.monotonic()
+        self.file_manager.close()
+        self.flush_seconds = time.monotonic() - write_start
+        self._report()
+
+    def _start_measuring(self):
+        self.cpu_start = os.times()
+        self.children_start = self._children_cpu()
+        self.wall_start = time.monotonic()
+        self.swipe_timer = QTimer()
+        self.swipe_timer.timeout.connect(self._swipe)
+        self.swipe_timer.start(int(self.args.interval * 1000))
+        self._swipe()
+
+    def _swipe(self):
+        if self.swipes >= self.args.swipes:
+            self.swipe_timer.stop()
+            return
+        lane, front, rear = self.lanes[self.swipes % len(self.lanes)]
+        card_code = f"BENCH-{int(time.time())}-{self.swipes}"
+        self.swipes += 1
+        worker = CaptureWorker(lane, card_code, front, rear,
+                               pre_trigger=self.camera_cfg["pre_trigger"],
+                               post_trigger=self.camera_cfg["post_trigger"],
+                               budget=self.camera_cfg["selection_budget_ms"] / 1000.0,
+                               analysis_width=self.camera_cfg["analysis_width"],
+                               max_skew=self.camera_cfg["max_pair_skew_ms"] / 1000.0,
+                               max_age=self.camera_cfg["max_frame_age_ms"] / 1000.0)
+        worker.capture_done.connect(self._on_capture_done)
+        worker.finished.connect(lambda w=worker: self.workers.discard(w))
+        self.workers.add(worker)
+        worker.start()
+
+    def _on_capture_done(self, lane, card_code, trigger, front, rear, error):
+        """Giống MainWindow.on_capture_done: chuyển QImage -> lưu file -> ghi DB"""
+        selected = time.monotonic()
+        if error and (front is None or rear is None):
+            self._finish_swipe(f"{card_code}: {error}")
+            return
+        success, path_front, path_rear = self.file_manager.save_capture(lane, card_code,
+                                                                        front[0] if front else None,
+                                                                        rear[0] if rear else None)
+        saved = time.monotonic()
+        if not success:
+            self._finish_swipe(f"{card_code}: lỗi lưu file")
+            return
+
+        committed = saved
+        if self.db is not None:
+            ok, msg = self.db.check_in(card_code, path_front, path_rear)
+            committed = time.monotonic()
+            if not ok:
+                self.errors.append(f"{card_code}: {msg}")
+
+        self.select_ms.add((selected - trigger) * 1000.0)
+        self.save_ms.add((saved - selected) * 1000.0)
+        if self.db is not None:
+            self.db_ms.add((committed - saved) * 1000.0)
+        self.total_ms.add((committed - trigger) * 1000.0)
+        self._finish_swipe(f"{card_code}: {error}" if error else None)
+
+    def _finish_swipe(self, error):
+        if error:
+            self.errors.append(error)
+        self.done += 1
+        if self.done >= self.args.swipes:
+            self.wall_end = time.monotonic()
+            self.cpu_end = os.times()
+            self.children_end = self._children_cpu()
+            self.app.quit()
+
+    def _children_cpu(self):
+        """CPU của process decode từng camera (chế độ multiprocess): {camera: (pid, giây)}"""
+        usage = {}
+        for thread in self.threads:
+            process = getattr(thread, "process", None)
+            if process is not None and process.pid:
+                usage[thread.camera_key] = (process.pid, process_cpu_seconds(process.pid) or 0.0)
+        return usage
+
+    def _report(self):
+        if not self.done:
+            print("Không có lượt quẹt nào hoàn tất")
+            return
+        wall = self.wall_end - self.wall_start
+        cpu = (self.cpu_end.user + self.cpu_end.system) - (self.cpu_start.user + self.cpu_start.system)
+        decode_percent = {}
+        for key, (pid, seconds) in self.children_end.items():
+            start_pid, start_seconds = self.children_start.get(key, (None, 0.0))
+            # Process decode bị khởi động lại giữa chừng (pid mới): tính từ lúc process mới chạy
+            decode_percent[key] = (seconds - (start_seconds if start_pid == pid else 0.0)) / wall * 100.0
+        cpu += sum(decode_percent.values()) * wall / 100.0
+        cpu_percent = cpu / wall * 100.0
+
+        print(f"\n=== {self.done} lượt quẹt trong {wall:.1f}s ===")
+        rows = [("Chọn ảnh (quẹt -> có ảnh)", self.select_ms), ("Lưu file", self.save_ms)]
+        if self.db is not None:
+            rows.append(("Ghi DB", self.db_ms))
+        rows.append(("Tổng (quẹt -> lưu xong)", self.total_ms))
+        print(f"{'Bước':<28}{'p50':>9}{'p95':>9}{'max':>9}  (ms)")
+        for name, histogram in rows:
+            summary = histogram.summary()
+            print(f"{name:<28}{summary['p50']:>9.1f}{summary['p95']:>9.1f}{summary['max']:>9.1f}")
+        writer = self.file_manager.writer
+        print(f"Ghi ảnh nền: {writer.written} file, {writer.failed} lỗi, "
+              f"{writer.thumbnail_failed} lỗi ảnh thu nhỏ, ghi nốt hàng đợi khi dừng {self.flush_seconds * 1000:.0f} ms")
+        print(f"CPU: {cpu_percent:.1f}% tổng, trung bình {cpu_percent / len(self.threads):.1f}% / camera")
+        if decode_percent:
+            print("CPU process decode: " + ", ".join(f"{key} {percent:.1f}%"
+                                                     for key, percent in decode_percent.items()))
+        if self.db is not None:
+            print(self.db.pool.format_stats())
+
+        print("\nTelemetry camera:")
+        for thread in self.threads:
+            print("  " + format_stats(thread.camera_key, thread.stats.snapshot()))
+        if self.errors:
+            print(f"\n{len(self.errors)} lỗi:")
+            for error in self.errors[:20]:
+                print("  " + error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline quẹt thẻ -> lưu ảnh -> DB")
+    parser.add_argument("--cameras", type=int, default=4, help="Số camera (2 camera / làn)")
+    parser.add_argument("--source", default="synthetic://?fps=25&size=1920x1080&period=6&duration=3",
+                        help="Nguồn frame: file://, images://, synthetic:// hoặc RTSP")
+    parser.add_argument("--swipes", type=int, default=20, help="Số lượt quẹt thẻ")
+    parser.add_argument("--interval", type=float, default=1.0, help="Khoảng cách giữa 2 lượt quẹt (giây)")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Thời gian chờ camera ổn định (giây)")
+    parser.add_argument("--preview-fps", type=float, default=15, help="FPS preview mỗi camera")
+    parser.add_argument("--multiprocess", action="store_true", help="Decode mỗi camera trong process riêng")
+    parser.add_argument("--save-dir", default="", help="Thư mục lưu ảnh (mặc định: thư mục tạm)")
+    parser.add_argument("--db", action="store_true", help="Ghi check-in vào DB trong config.json")
+    parser.add_argument("--config", default="config.json", help="File cấu hình")
+    args = parser.parse_args()
+    PipelineBenchmark(args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Quản lý camera theo cấu hình làn xe (topology trong config.json)
+Tạo thread/widget cho từng camera, định tuyến camera trước/sau khi chụp, chia tài nguyên decode
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+from camera_stats import format_stats
+from camera_thread import CameraThread, ProcessCameraThread
+from camera_widget import CameraWidget
+from config_manager import ConfigManager
+from connection_supervisor import ConnectionSupervisor
+from motion_gate import MotionGate
+from logger import ParkingLogger
+
+
+class CameraManager:
+    """Tạo và quản lý CameraThread/CameraWidget cho mọi làn"""
+
+    def __init__(self, config_manager: ConfigManager, logger: ParkingLogger):
+        self.config_manager = config_manager
+        self.logger = logger
+        self.camera_cfg = config_manager.get_camera_config()
+        # Dùng chung cho mọi camera: camera cùng DVR được đánh thức kết nối lại cùng lúc
+        self.supervisor = ConnectionSupervisor(base_delay=self.camera_cfg["reconnect_base_delay"],
+                                               max_delay=self.camera_cfg["reconnect_max_delay"],
+                                               jitter=self.camera_cfg["reconnect_jitter"],
+                                               open_timeout=self.camera_cfg["open_timeout"],
+                                               read_timeout=self.camera_cfg["read_timeout"])
+
+        self.camera_threads: Dict[str, CameraThread] = {}
+        self.capture_threads: Dict[str, CameraThread] = {}  # Main stream chụp ảnh bằng chứng (dual-stream)
+        self.camera_widgets: Dict[str, CameraWidget] = {}
+        self.stuck_threads: List[CameraThread] = []  # Thread không dừng được khi tắt (giữ tham chiếu, xem stop)
+        self.lane_cameras: Dict[str, List[dict]] = {}
+
+    def build(self, lanes: List[dict], parent=None):
+        """
+        Tạo widget và thread cho mọi camera khai báo trong các làn
+
+        Args:
+            lanes: Danh sách làn từ ConfigManager.get_lanes()
+            parent: Widget cha của các CameraWidget
+        """
+        streams = {}
+        for lane in lanes:
+            self.lane_cameras[lane["key"]] = lane["cameras"]
+            for camera in lane["cameras"]:
+                urls = self.config_manager.get_camera_urls(camera["key"])
+                if urls["preview"]:
+                    streams[camera["key"]] = urls
+
+        preview_fps, buffer_size = self._budget(len(streams))
+        if streams:
+            self.logger.info(f"Camera: {len(streams)} luồng, preview {preview_fps:.1f} FPS/camera, "
+                             f"ring buffer {buffer_size} frame/camera")
+
+        for lane in lanes:
+            for camera in lane["cameras"]:
+                key = camera["key"]
+                widget = CameraWidget(key, camera["label"], parent)
+                self.camera_widgets[key] = widget
+
+                urls = streams.get(key)
+                if not urls:
+                    continue
+                thread = self.create_camera_thread(urls["preview"], key, preview_fps, buffer_size)
+                self.camera_threads[key] = thread
+                self._init_motion_gate(thread, key, preview_fps)
+                if urls["capture"]:
+                    self._init_capture_stream(thread, key, urls, buffer_size)
+                widget.set_camera_thread(thread)
+
+    def window_buffer_size(self) -> int:
+        """
+        Số frame ring buffer cần giữ: buffer_size, tăng lên nếu chưa chứa hết cửa sổ chọn ảnh
+        (stream_fps x (pre_trigger + post_trigger), cộng 2 frame dự phòng trong lúc CaptureWorker đọc)
+        """
+        window = self.camera_cfg["pre_trigger"] + self.camera_cfg["post_trigger"]
+        window_frames = math.ceil(self.camera_cfg["stream_fps"] * window) + 2
+        return max(self.camera_cfg["buffer_size"], window_frames)
+
+    def _budget(self, camera_count: int) -> Tuple[float, int]:
+        """Chia tổng FPS hiển thị và RAM ring buffer cho số camera đang cấu hình"""
+        preview_fps = self.camera_cfg["preview_fps"]
+        buffer_size = self.window_buffer_size()
+        if camera_count == 0:
+            return preview_fps, buffer_size
+
+        total_fps = self.camera_cfg["total_preview_fps"]
+        if total_fps:
+            preview_fps = min(preview_fps, total_fps / camera_count)
+
+        memory_mb = self.camera_cfg["frame_memory_mb"]
+        if memory_mb:
+            frame_bytes = self.camera_cfg["max_width"] * self.camera_cfg["max_height"] * 3
+            frames_per_camera = int(memory_mb * 1024 * 1024 / camera_count / frame_bytes)
+            if frames_per_camera < buffer_size:
+                self.logger.warning(f"Camera: frame_memory_mb chỉ đủ {frames_per_camera} frame/camera, "
+                                    f"ít hơn cửa sổ chọn ảnh ({buffer_size} frame)")
+            buffer_size = max(2, min(buffer_size, frames_per_camera))
+        return preview_fps, buffer_size
+
+    def create_camera_thread(self, url: str, key: str, preview_fps: float, buffer_size: int,
+                             idle_timeout: float = 0) -> CameraThread:
+        """Tạo thread camera: decode ngay trong process GUI hoặc trong process riêng"""
+        if self.camera_cfg["multiprocess"]:
+            return ProcessCameraThread(url, key,
+                                       buffer_size=buffer_size,
+                                       preview_fps=preview_fps,
+                                       idle_timeout=idle_timeout,
+                                       stats_window=self.camera_cfg["stats_window"],
+                                       max_width=self.camera_cfg["max_width"],
+                                       max_height=self.camera_cfg["max_height"],
+                                       open_timeout=self.camera_cfg["open_timeout"] * 2,
+                                       supervisor=self.supervisor)
+        return CameraThread(url, key,
+                            buffer_size=buffer_size,
+                            preview_fps=preview_fps,
+                            decode_mode=self.camera_cfg["decode_mode"],
+                            idle_timeout=idle_timeout,
+                            stats_window=self.camera_cfg["stats_window"],
+                            supervisor=self.supervisor)
+
+    def _init_motion_gate(self, thread: CameraThread, key: str, preview_fps: float):
+        """Giảm tốc độ decode preview của camera khi làn trống (ngưỡng riêng từng camera)"""
+        motion_cfg = self.config_manager.get_motion_config(key)
+        if not motion_cfg["motion_gate"] or preview_fps <= 0:
+            return
+        thread.set_motion_gate(MotionGate(preview_fps,
+                                          idle_fps=min(preview_fps, motion_cfg["idle_fps"]),
+                                          idle_after=motion_cfg["idle_after"],
+                                          pixel_threshold=motion_cfg["motion_pixel_threshold"],
+                                          area_ratio=motion_cfg["motion_area_ratio"]))
+
+    def _init_capture_stream(self, preview_thread: CameraThread, key: str, urls: dict, buffer_size: int):
+        """
+        Tạo thread main stream để chụp ảnh độ phân giải cao:
+        - warm: luôn mở, chỉ grab() (không decode) cho tới khi quẹt thẻ
+        - on_demand: chỉ mở khi quẹt thẻ, tự đóng sau capture_idle_timeout giây
+        """
+        on_demand = urls["capture_mode"] == "on_demand"
+        idle_timeout = self.camera_cfg["capture_idle_timeout"] if on_demand else 0
+        capture_thread = self.create_camera_thread(urls["capture"], f"{key}_capture", 0, buffer_size, idle_timeout)
+        capture_thread.error_occurred.connect(lambda msg: self.logger.error(msg))
+        preview_thread.set_capture_source(capture_thread, on_demand, self.camera_cfg["capture_open_timeout"])
+        self.capture_threads[key] = capture_thread
+
+    def get_lane_widgets(self, lane_key: str) -> List[CameraWidget]:
+        """Các CameraWidget của một làn (theo thứ tự khai báo)"""
+        return [self.camera_widgets[c["key"]] for c in self.lane_cameras.get(lane_key, [])]
+
+    def get_capture_threads(self, lane_key: str) -> Tuple[Optional[CameraThread], Optional[CameraThread]]:
+        """Thread camera dùng để chụp ảnh trước/sau của một làn (theo role trong config)"""
+        front = rear = None
+        for camera in self.lane_cameras.get(lane_key, []):
+            if camera["role"] == "front" and front is None:
+                front = self.camera_threads.get(camera["key"])
+            elif camera["role"] == "rear" and rear is None:
+                rear = self.camera_threads.get(camera["key"])
+        return front, rear
+
+    def get_stats(self) -> Dict[str, dict]:
+        """Số liệu telemetry của mọi luồng (kể cả main stream chụp ảnh, key có hậu tố _capture)"""
+        stats = {key: thread.stats.snapshot() for key, thread in self.camera_threads.items()}
+        for key, thread in self.capture_threads.items():
+            stats[f"{key}_capture"] = thread.stats.snapshot()
+        return stats
+
+    def log_stats(self):
+        """Ghi số liệu telemetry của từng luồng ra log"""
+        for key, stats in self.get_stats().items():
+            self.logger.info(format_stats(key, stats), key.upper().replace("_", " "))
+
+    def start(self):
+        """Khởi động mọi thread camera (main stream on_demand chỉ mở khi chụp)"""
+        for thread in self.camera_threads.values():
+            thread.start()
+        for key, thread in self.capture_threads.items():
+            if not self.camera_threads[key].capture_on_demand:
+                thread.start()
+
+    def stop(self) -> List[str]:
+        """
+        Dừng mọi thread camera (báo dừng tất cả trước rồi mới chờ, để các thread thoát song song)
+
+        Thread quá stop_timeout chưa dừng (thường là treo trong FFMPEG): kill process decode nếu có,
+        chờ thêm một lần rồi giữ tham chiếu trong stuck_threads, vì hủy QThread đang chạy làm Qt abort.
+        Trả về: tên các camera vẫn chưa dừng; người gọi dọn dẹp xong thì phải thoát bằng os._exit
+        """
+        threads = list(self.camera_threads.values()) + list(self.capture_threads.values())
+        for thread in threads:
+            thread.request_stop()
+        stuck = [thread for thread in threads if not thread.stop()]
+        for thread in stuck:
+            if isinstance(thread, ProcessCameraThread):
+                thread.kill_decoder()
+            thread.wait(int(self.supervisor.stop_timeout * 1000))
+        self.stuck_threads = [thread for thread in stuck if thread.isRunning()]
+        for thread in self.stuck_threads:
+            self.logger.error(f"Camera {thread.camera_key}: thread không dừng được khi tắt ứng dụng")
+        return [thread.camera_key for thread in self.stuck_threads]
@@ -0,0 +1,352 @@
+"""
+Decode camera trong process riêng, trao đổi frame qua multiprocessing.shared_memory
+Module này không import PyQt5 để process con khởi động nhẹ (spawn trên Windows)
+"""
+import queue
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from connection_supervisor import capture_open_params, compute_backoff
+from frame_source import open_capture
+
+# Trạng thái process decode (ghi trong header shared memory)
+STATUS_CONNECTING = 0
+STATUS_CONNECTED = 1
+STATUS_DISCONNECTED = 2
+STATUS_STOPPED = 3
+
+HEADER_DTYPE = np.dtype([
+    ("latest_seq", "i8"),       # Sequence frame mới nhất đã publish (-1 = chưa có)
+    ("status", "i8"),
+    ("burst_until", "f8"),      # GUI yêu cầu decode mọi frame tới thời điểm này
+    ("preview_interval", "f8"),  # Chu kỳ preview hiện tại do GUI đặt (giảm khi khung hình tĩnh, -1 = mặc định)
+])
+SLOT_DTYPE = np.dtype([
+    ("seq", "i8"),              # -1 khi slot đang được ghi
+    ("timestamp", "f8"),        # time.monotonic() lúc grab (đồng hồ chung toàn hệ thống)
+    ("height", "i8"),
+    ("width", "i8"),
+])
+
+
+class SharedFrameChannel:
+    """
+    Bố cục shared memory: header | metadata N slot | N slot frame (BGR, liên tục)
+    Ghi/đọc theo kiểu seqlock: slot.seq = -1 trong lúc ghi, đọc xong kiểm tra lại seq
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int, max_width: int, max_height: int):
+        self.shm = shm
+        self.slots = slots
+        self.max_width = max_width
+        self.max_height = max_height
+        self.slot_bytes = max_width * max_height * 3
+
+        meta_offset = HEADER_DTYPE.itemsize
+        frames_offset = self._align(meta_offset + SLOT_DTYPE.itemsize * slots)
+        self.header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)
+        self.meta = np.ndarray((slots,), dtype=SLOT_DTYPE, buffer=shm.buf, offset=meta_offset)
+        self.frames = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=shm.buf, offset=frames_offset)
+
+    @staticmethod
+    def _align(offset: int, alignment: int = 64) -> int:
+        return (offset + alignment - 1) // alignment * alignment
+
+    @classmethod
+    def required_size(cls, slots: int, max_width: int, max_height: int) -> int:
+        """Dung lượng shared memory cần cấp phát"""
+        frames_offset = cls._align(HEADER_DTYPE.itemsize + SLOT_DTYPE.itemsize * slots)
+        return frames_offset + slots * max_width * max_height * 3
+
+    @classmethod
+    def create(cls, slots: int, max_width: int, max_height: int) -> "SharedFrameChannel":
+        """Tạo shared memory mới (phía GUI)"""
+        size = cls.required_size(slots, max_width, max_height)
+        channel = cls(shared_memory.SharedMemory(create=True, size=size), slots, max_width, max_height)
+        channel.header["latest_seq"] = -1
+        channel.header["status"] = STATUS_CONNECTING
+        channel.header["burst_until"] = 0.0
+        channel.header["preview_interval"] = -1.0
+        channel.meta["seq"] = -1
+        return channel
+
+    @classmethod
+    def attach(cls, name: str, slots: int, max_width: int, max_height: int) -> "SharedFrameChannel":
+        """Gắn vào shared memory đã có (phía process decode)"""
+        return cls(shared_memory.SharedMemory(name=name), slots, max_width, max_height)
+
+    # --- Trạng thái & điều khiển ---
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def latest_seq(self) -> int:
+        return int(self.header["latest_seq"][0])
+
+    @property
+    def status(self) -> int:
+        return int(self.header["status"][0])
+
+    def set_status(self, status: int):
+        self.header["status"] = status
+
+    @property
+    def burst_until(self) -> float:
+        return float(self.header["burst_until"][0])
+
+    @property
+    def preview_interval(self) -> float:
+        return float(self.header["preview_interval"][0])
+
+    def set_preview_interval(self, interval: float):
+        self.header["preview_interval"] = interval
+
+    def request_burst(self, until: float):
+        self.header["burst_until"] = max(float(self.header["burst_until"][0]), until)
+
+    # --- Ghi frame (process decode) ---
+    def slot_view(self, seq: int, height: int, width: int) -> Optional[np.ndarray]:
+        """View (h, w, 3) liên tục của slot dành cho sequence seq, None nếu frame quá lớn"""
+        if height * width * 3 > self.slot_bytes:
+            return None
+        return self.frames[seq % self.slots, :height * width * 3].reshape(height, width, 3)
+
+    def begin_write(self, seq: int):
+        self.meta["seq"][seq % self.slots] = -1
+
+    def publish(self, seq: int, timestamp: float, height: int, width: int):
+        idx = seq % self.slots
+        self.meta["timestamp"][idx] = timestamp
+        self.meta["height"][idx] = height
+        self.meta["width"][idx] = width
+        self.meta["seq"][idx] = seq
+        self.header["latest_seq"] = seq
+
+    # --- Đọc frame (GUI) ---
+    def timestamp_of(self, seq: int) -> float:
+        """Timestamp của frame seq (0.0 nếu slot đã bị ghi đè)"""
+        idx = seq % self.slots
+        timestamp = float(self.meta["timestamp"][idx])
+        return timestamp if int(self.meta["seq"][idx]) == seq else 0.0
+
+    def read(self, seq: int, dst: Optional[np.ndarray] = None) -> Optional[Tuple[np.ndarray, float]]:
+        """
+        Copy frame có sequence seq ra ngoài (vào dst nếu cùng kích thước)
+        Trả về None nếu slot đã bị ghi đè trong lúc đọc
+        """
+        idx = seq % self.slots
+        if int(self.meta["seq"][idx]) != seq:
+            return None
+        height = int(self.meta["height"][idx])
+        width = int(self.meta["width"][idx])
+        timestamp = float(self.meta["timestamp"][idx])
+        view = self.frames[idx, :height * width * 3].reshape(height, width, 3)
+        if dst is not None and dst.shape == view.shape and dst.dtype == view.dtype:
+            np.copyto(dst, view)
+            out = dst
+        else:
+            out = view.copy()
+        if int(self.meta["seq"][idx]) != seq:
+            return None
+        return out, timestamp
+
+    def close(self, unlink: bool = False):
+        # Bỏ tham chiếu tới buffer trước khi đóng, nếu không shm.close() báo BufferError
+        self.header = self.meta = self.frames = None
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def run_decoder(url: str, shm_name: str, slots: int, max_width: int, max_height: int,
+                preview_fps: float, reconnect: dict, stop_event, frame_event, error_queue):
+    """
+    Entry point của process decode: grab() theo tốc độ stream, chỉ retrieve()
+    theo preview_fps hoặc khi GUI yêu cầu (burst / chụp ảnh), rồi publish vào shared memory
+
+    reconnect: ConnectionSupervisor.settings() (timeout mở/đọc, backoff có jitter)
+    """
+    channel = SharedFrameChannel.attach(shm_name, slots, max_width, max_height)
+    if channel.preview_interval < 0:
+        channel.set_preview_interval(1.0 / preview_fps if preview_fps > 0 else 0)
+    next_preview = 0.0
+    seq = max(channel.latest_seq + 1, 0)
+    cap = None
+    open_params = capture_open_params(reconnect["open_timeout"], reconnect["read_timeout"])
+    backoff = (reconnect["base_delay"], reconnect["max_delay"], reconnect["jitter"])
+    attempt = 0
+    slot = frame = None
+
+    try:
+        while not stop_event.is_set():
+            channel.set_status(STATUS_CONNECTING)
+            cap = open_capture(url, open_params)
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            if not cap.isOpened():
+                channel.set_status(STATUS_DISCONNECTED)
+                _report_error(error_queue, f"Không thể mở RTSP: {url}")
+                cap.release()
+                attempt += 1
+                stop_event.wait(compute_backoff(attempt, *backoff))
+                continue
+
+            channel.set_status(STATUS_CONNECTED)
+            attempt = 0
+            shape = None
+            while not stop_event.is_set():
+                if not cap.grab():
+                    break
+                now = time.monotonic()
+                burst_until = channel.burst_until
+                preview_interval = channel.preview_interval
+                if next_preview - now > preview_interval:
+                    next_preview = now  # GUI vừa tăng tốc độ preview (có chuyển động / quẹt thẻ)
+                preview_due = bool(preview_interval) and now >= next_preview
+                if not (preview_due or now <= burst_until):
+                    continue
+                if preview_due:
+                    next_preview += preview_interval
+                    if next_preview <= now:
+                        next_preview = now + preview_interval
+
+                channel.begin_write(seq)
+                slot = channel.slot_view(seq, *shape) if shape else None
+                ret, frame = cap.retrieve(slot) if slot is not None else cap.retrieve()
+                if not ret or frame is None:
+                    break
+                if frame is not slot:
+                    frame = _fit_frame(frame, max_width, max_height)
+                    shape = frame.shape[:2]
+                    np.copyto(channel.slot_view(seq, *shape), frame)
+                channel.publish(seq, now, *shape)
+                frame_event.set()
+                seq += 1
+
+            cap.release()
+            cap = None
+            if not stop_event.is_set():
+                channel.set_status(STATUS_DISCONNECTED)
+                attempt += 1
+                stop_event.wait(compute_backoff(attempt, *backoff))
+    except Exception as e:
+        _report_error(error_queue, f"Lỗi process decode: {str(e)}")
+    finally:
+        if cap is not None:
+            cap.release()
+        channel.set_status(STATUS_STOPPED)
+        frame_event.set()
+        # slot / frame có thể đang trỏ vào shm.buf, còn tham chiếu thì shm.close() báo BufferError
+        slot = frame = None
+        channel.close()
+
+
+def _fit_frame(frame: np.ndarray, max_width: int, max_height: int) -> np.ndarray:
+    """Thu nhỏ frame nếu vượt kích thước slot shared memory"""
+    h, w = frame.shape[:2]
+    if w <= max_width and h <= max_height:
+        return frame
+    scale = min(max_width / w, max_height / h)
+    return cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+
+def _report_error(error_queue, message: str):
+    try:
+        error_queue.put_nowait(message)
+    except queue.Full:
+        pass
+
+
+class SharedMemoryCapture:
+    """
+    Giả lập giao diện cv2.VideoCapture (isOpened/grab/retrieve/read/release)
+    trên shared memory, để CameraThread chạy nguyên vẹn ở chế độ đa process
+    """
+
+    def __init__(self, channel: SharedFrameChannel, frame_event, stop_event,
+                 open_timeout: float = 10.0, read_timeout: float = 5.0, process=None):
+        self.channel = channel
+        self.process = process  # Process decode: chết thì grab() trả False ngay, không chờ read_timeout
+        self.frame_event = frame_event
+        self.stop_event = stop_event
+        self.read_timeout = read_timeout
+        self.frame_timestamp = 0.0
+        self.missed_frames = 0
+        self._grabbed_seq = -1
+        self._last_seq = channel.latest_seq
+        self._opened = self._wait_connected(open_timeout)
+
+    def _wait_connected(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.stop_event.is_set():
+            status = self.channel.status
+            if status == STATUS_CONNECTED:
+                return True
+            if status == STATUS_STOPPED or time.monotonic() > deadline:
+                return False
+            if self.process is not None and not self.process.is_alive():
+                return False
+            self.frame_event.wait(0.1)
+            self.frame_event.clear()
+        return False
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def grab(self) -> bool:
+        """Chờ frame mới do process decode publish"""
+        deadline = time.monotonic() + self.read_timeout
+        while self._opened and not self.stop_event.is_set():
+            latest = self.channel.latest_seq
+            if latest > self._last_seq:
+                if self._last_seq >= 0:
+                    self.missed_frames += latest - self._last_seq - 1
+                self._grabbed_seq = latest
+                self._last_seq = latest
+                self.frame_timestamp = self.channel.timestamp_of(latest)
+                return True
+            if self.channel.status != STATUS_CONNECTED or time.monotonic() > deadline:
+                break
+            if self.process is not None and not self.process.is_alive():
+                break
+            self.frame_event.wait(0.05)
+            self.frame_event.clear()
+        self._opened = False
+        return False
+
+    def take_missed_frames(self) -> int:
+        """Số frame bị bỏ qua kể từ lần gọi trước"""
+        missed, self.missed_frames = self.missed_frames, 0
+        return missed
+
+    def retrieve(self, image: Optional[np.ndarray] = None):
+        """Copy frame vừa grab ra khỏi shared memory (vào image nếu cùng kích thước)"""
+        for seq in (self._grabbed_seq, self.channel.latest_seq):
+            if seq < 0:
+                continue
+            result = self.channel.read(seq, image)
+            if result is not None:
+                self.frame_timestamp = result[1]
+                return True, result[0]
+        return False, None
+
+    def read(self, image: Optional[np.ndarray] = None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, prop_id: int) -> float:
+        return 0.0
+
+    def set(self, prop_id: int, value) -> bool:
+        return False
+
+    def release(self):
+        self._opened = False
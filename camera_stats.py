@@ -0,0 +1,138 @@
+"""
+Số liệu vận hành của luồng camera (telemetry)
+FPS decode, thời gian decode/chuyển đổi, tuổi frame khi chụp, frame bị bỏ, số lần reconnect
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class RollingHistogram:
+    """Phân bố giá trị trong cửa sổ thời gian trượt (giây), tính các percentile khi đọc"""
+
+    def __init__(self, window: float = 60.0, max_samples: int = 4096):
+        self.window = window
+        self._samples = deque(maxlen=max_samples)  # (timestamp monotonic, giá trị)
+
+    def add(self, value: float, now: Optional[float] = None):
+        self._samples.append((time.monotonic() if now is None else now, value))
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def count(self, now: Optional[float] = None) -> int:
+        self._expire(time.monotonic() if now is None else now)
+        return len(self._samples)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """Số mẫu mỗi giây trong cửa sổ (dùng để tính FPS)"""
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        if not self._samples:
+            return 0.0
+        span = max(1.0, min(self.window, now - self._samples[0][0]))
+        return len(self._samples) / span
+
+    def summary(self, now: Optional[float] = None) -> Dict[str, float]:
+        """{"count", "mean", "p50", "p95", "max"} của các mẫu còn trong cửa sổ"""
+        self._expire(time.monotonic() if now is None else now)
+        values = sorted(v for _, v in self._samples)
+        if not values:
+            return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        n = len(values)
+        return {
+            "count": n,
+            "mean": sum(values) / n,
+            "p50": values[n // 2],
+            "p95": values[min(n - 1, int(n * 0.95))],
+            "max": values[-1],
+        }
+
+
+class StreamStats:
+    """Telemetry của một luồng camera, ghi từ thread camera và đọc từ GUI"""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._lock = threading.Lock()
+        self.decode_ms = RollingHistogram(window)      # Thời gian retrieve()/read() một frame
+        self.convert_ms = RollingHistogram(window)     # Thời gian scale + tạo QImage preview
+        self.capture_age_ms = RollingHistogram(window)  # Tuổi frame so với lúc quẹt thẻ
+        self.grabbed = 0
+        self.decoded = 0
+        self.dropped = 0          # Frame đã decode nhưng không dùng (preview bị thay, slot shm bị ghi đè)
+        self.read_errors = 0
+        self.reconnects = 0
+        self.disconnected_seconds = 0.0
+        self._disconnected_since: Optional[float] = time.monotonic()
+        self._ever_connected = False
+
+    def record_grab(self):
+        self.grabbed += 1
+
+    def record_decode(self, elapsed: float, now: Optional[float] = None):
+        with self._lock:
+            self.decoded += 1
+            self.decode_ms.add(elapsed * 1000.0, now)
+
+    def record_convert(self, elapsed: float):
+        with self._lock:
+            self.convert_ms.add(elapsed * 1000.0)
+
+    def record_dropped(self, count: int = 1):
+        self.dropped += count
+
+    def record_read_error(self):
+        self.read_errors += 1
+
+    def record_capture_age(self, age: float):
+        with self._lock:
+            self.capture_age_ms.add(max(0.0, age) * 1000.0)
+
+    def record_status(self, status: str):
+        """Theo dõi thời gian mất kết nối và số lần kết nối lại"""
+        now = time.monotonic()
+        with self._lock:
+            if status == "connected":
+                if self._disconnected_since is not None:
+                    self.disconnected_seconds += now - self._disconnected_since
+                    self._disconnected_since = None
+                if self._ever_connected:
+                    self.reconnects += 1
+                self._ever_connected = True
+            elif self._disconnected_since is None:
+                self._disconnected_since = now
+
+    def snapshot(self) -> Dict[str, object]:
+        """Bản chụp số liệu hiện tại (dict thuần, an toàn để log/serialize)"""
+        now = time.monotonic()
+        with self._lock:
+            disconnected = self.disconnected_seconds
+            if self._disconnected_since is not None:
+                disconnected += now - self._disconnected_since
+            return {
+                "fps": self.decode_ms.rate(now),
+                "decode_ms": self.decode_ms.summary(now),
+                "convert_ms": self.convert_ms.summary(now),
+                "capture_age_ms": self.capture_age_ms.summary(now),
+                "grabbed": self.grabbed,
+                "decoded": self.decoded,
+                "dropped": self.dropped,
+                "read_errors": self.read_errors,
+                "reconnects": self.reconnects,
+                "disconnected_seconds": disconnected,
+            }
+
+
+def format_stats(key: str, stats: Dict[str, object]) -> str:
+    """Định dạng 1 dòng log ngắn gọn cho số liệu của một camera"""
+    decode = stats["decode_ms"]
+    convert = stats["convert_ms"]
+    age = stats["capture_age_ms"]
+    return (f"{key}: {stats['fps']:.1f} FPS, decode p50/p95 {decode['p50']:.1f}/{decode['p95']:.1f} ms, "
+            f"convert p95 {convert['p95']:.1f} ms, tuổi ảnh chụp p95 {age['p95']:.0f} ms, "
+            f"bỏ {stats['dropped']} frame, lỗi đọc {stats['read_errors']}, "
+            f"reconnect {stats['reconnects']}, mất kết nối {stats['disconnected_seconds']:.0f}s")
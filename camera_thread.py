@@ -1,30 +1,64 @@
 """
 QThread xử lý RTSP stream từ camera
-Tự động reconnect khi mất kết nối, emit frame và status signals
+Tự động reconnect khi mất kết nối (backoff qua ConnectionSupervisor), emit frame và status signals
 """
 import cv2
+import multiprocessing
+import queue
+import threading
 import time
+import numpy as np
 from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtGui import QImage
-from typing import Optional
+from typing import List, Optional, Tuple
+
+from camera_process import SharedFrameChannel, SharedMemoryCapture, run_decoder
+from camera_stats import StreamStats
+from connection_supervisor import ConnectionSupervisor
+from frame_buffer import FrameRingBuffer
+from frame_source import open_capture
+from motion_gate import MotionGate
+
+
+def bgr_to_qimage(frame: np.ndarray) -> Optional[QImage]:
+    """
+    Chuyển frame OpenCV (BGR) sang QImage (RGB) sở hữu dữ liệu riêng.
+    rgbSwapped() vừa đổi kênh màu vừa copy nên không cần cvtColor/buffer tạm.
+    """
+    if frame is None or frame.size == 0:
+        return None
+    if not frame.flags['C_CONTIGUOUS']:
+        frame = np.ascontiguousarray(frame)
+    h, w = frame.shape[:2]
+    return QImage(frame.data, w, h, frame.strides[0], QImage.Format_RGB888).rgbSwapped()
 
 
 class CameraThread(QThread):
     """Thread xử lý video stream từ camera RTSP"""
     
     # Signals
-    frame_ready = pyqtSignal(QImage)  # Emit frame khi có ảnh mới
+    frame_ready = pyqtSignal()  # Báo có frame preview mới, widget lấy bằng take_preview_frame()
     status_changed = pyqtSignal(str)  # Emit trạng thái: "connecting", "connected", "disconnected", "error"
     error_occurred = pyqtSignal(str)  # Emit thông báo lỗi
     
-    def __init__(self, rtsp_url: str, camera_key: str = "", reconnect_delay: int = 3):
+    def __init__(self, rtsp_url: str, camera_key: str = "", reconnect_delay: int = 3,
+                 buffer_size: int = 8, preview_fps: float = 15, decode_mode: str = "grab",
+                 idle_timeout: float = 0, stats_window: float = 60,
+                 supervisor: Optional[ConnectionSupervisor] = None):
         """
         Khởi tạo CameraThread
         
         Args:
             rtsp_url: Đường dẫn RTSP
             camera_key: Tên camera (để log)
-            reconnect_delay: Thời gian chờ trước khi reconnect (giây)
+            reconnect_delay: Thời gian chờ trước khi reconnect lần đầu (giây), khi không có supervisor
+            buffer_size: Số frame thô giữ lại trong ring buffer
+            preview_fps: Tốc độ chuyển đổi frame để hiển thị (0 = không hiển thị)
+            decode_mode: "grab" = grab() mọi frame, chỉ retrieve() theo preview/khi chụp;
+                         "read" = decode mọi frame như cũ
+            idle_timeout: Tự dừng stream sau N giây không có yêu cầu chụp (0 = chạy liên tục)
+            stats_window: Cửa sổ thời gian (giây) của số liệu telemetry
+            supervisor: Điều phối timeout/backoff dùng chung giữa các camera (None = tạo riêng)
         """
         super().__init__()
         self.rtsp_url = rtsp_url
@@ -33,46 +67,65 @@ class CameraThread(QThread):
         self.running = False
         self.cap: Optional[cv2.VideoCapture] = None
         self.current_status = "disconnected"
-        self.last_frame: Optional[QImage] = None
+        self.frame_buffer = FrameRingBuffer(buffer_size)
+        self.stats = StreamStats(stats_window)
+        self.preview_interval = 1.0 / preview_fps if preview_fps > 0 else 0
+        self._next_preview = 0.0
+        self.motion_gate: Optional[MotionGate] = None  # None = preview luôn ở preview_fps
+        self.decode_mode = decode_mode
+        
+        # Preview: scale trong thread camera, chỉ giữ 1 frame chờ hiển thị (frame mới nhất thắng)
+        self._preview_size: Optional[Tuple[int, int]] = None
+        self._preview_lock = threading.Lock()
+        self._pending_preview: Optional[QImage] = None
+        self._preview_signalled = False
+        
+        # Báo có frame mới cho thread đang chờ frame
+        self._capture_cond = threading.Condition()
+        self._burst_until = 0.0  # Decode mọi frame tới thời điểm này (cửa sổ sau quẹt thẻ)
+        self.idle_timeout = idle_timeout
+        self._last_capture_request = 0.0
+        
+        # Nguồn chụp độ phân giải cao (main stream), None = chụp từ chính stream preview
+        self.capture_source: Optional["CameraThread"] = None
+        self.capture_on_demand = False
+        self.capture_open_timeout = 3.0
+        
+        # Kết nối lại: chờ có thể ngắt được (stop() hoặc camera cùng DVR đã kết nối lại)
+        self.supervisor = supervisor or ConnectionSupervisor(base_delay=reconnect_delay,
+                                                             max_delay=max(30.0, reconnect_delay))
+        self._supervisor_key = camera_key or rtsp_url
+        self._wake_event = threading.Event()
+        self.supervisor.register(self._supervisor_key, rtsp_url, self._wake_event)
     
     def run(self):
         """Chạy thread, kết nối và đọc frame từ RTSP"""
         self.running = True
+        self._wake_event.clear()
+        self._last_capture_request = time.monotonic()
         
         while self.running:
             try:
                 # Kết nối RTSP
                 self._update_status("connecting")
-                self.cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
-                
-                # Cấu hình buffer nhỏ để giảm độ trễ
-                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                self.cap = self._open_capture()
                 
                 if not self.cap.isOpened():
                     self._update_status("error")
                     self.error_occurred.emit(f"Không thể mở RTSP: {self.rtsp_url}")
-                    time.sleep(self.reconnect_delay)
+                    self.cap.release()
+                    self.cap = None
+                    self._wait_reconnect()
                     continue
                 
                 self._update_status("connected")
+                self.supervisor.report_success(self._supervisor_key)
                 
                 # Đọc frame liên tục
-                while self.running and self.cap.isOpened():
-                    ret, frame = self.cap.read()
-                    
-                    if not ret:
-                        # Mất kết nối
-                        self._update_status("disconnected")
-                        break
-                    
-                    # Chuyển đổi frame sang QImage
-                    qimage = self._cv2_to_qimage(frame)
-                    if qimage:
-                        self.last_frame = qimage
-                        self.frame_ready.emit(qimage)
-                    
-                    # Điều chỉnh tốc độ đọc frame (khoảng 30 FPS)
-                    time.sleep(0.033)
+                if self.decode_mode == "read":
+                    self._read_loop()
+                else:
+                    self._grab_loop()
                 
                 # Đóng kết nối
                 if self.cap:
@@ -82,7 +135,7 @@ class CameraThread(QThread):
                 # Nếu đang chạy nhưng mất kết nối, chờ và reconnect
                 if self.running:
                     self._update_status("disconnected")
-                    time.sleep(self.reconnect_delay)
+                    self._wait_reconnect()
             
             except Exception as e:
                 self._update_status("error")
@@ -94,54 +147,512 @@ class CameraThread(QThread):
                     except:
                         pass
                     self.cap = None
-                time.sleep(self.reconnect_delay)
+                self._wait_reconnect()
+        
+        self._update_status("disconnected")
+    
+    def _wait_reconnect(self):
+        """Chờ backoff trước khi kết nối lại, thoát ngay khi stop() hoặc DVR đã lên lại"""
+        if not self.running:
+            return
+        delay = self.supervisor.report_failure(self._supervisor_key)
+        self.supervisor.wait_retry(self._supervisor_key, delay)
+    
+    def _open_capture(self):
+        """
+        Mở nguồn video (cv2.VideoCapture, hoặc nguồn giả lập file://, images://, synthetic://).
+        Timeout mở/đọc giới hạn để thread luôn kiểm tra được cờ dừng.
+        """
+        cap = open_capture(self.rtsp_url, self.supervisor.open_params())
+        # Cấu hình buffer nhỏ để giảm độ trễ
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+    
+    def _frame_timestamp(self) -> float:
+        """Thời điểm (monotonic) nhận frame vừa grab/read"""
+        return time.monotonic()
     
     def _update_status(self, status: str):
         """Cập nhật trạng thái và emit signal"""
         if self.current_status != status:
             self.current_status = status
+            self.stats.record_status(status)
             self.status_changed.emit(status)
     
-    def _cv2_to_qimage(self, frame):
-        """Chuyển đổi OpenCV frame (BGR) sang QImage (RGB)"""
-        try:
-            if frame is None or frame.size == 0:
-                return None
+    def _grab_loop(self):
+        """
+        grab() liên tục theo tốc độ stream để xả buffer RTSP (không decode),
+        chỉ retrieve() khi tới lượt preview hoặc có yêu cầu chụp
+        """
+        while self.running and self.cap.isOpened():
+            if not self.cap.grab():
+                self.stats.record_read_error()
+                self._update_status("disconnected")
+                break
+            self.stats.record_grab()
             
-            # Chuyển BGR sang RGB
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_frame.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            return qt_image
-        except Exception as e:
-            return None
+            grab_time = self._frame_timestamp()
+            if self._idle_expired(grab_time):
+                break
+            
+            preview_due = self._preview_due(grab_time)
+            if not (preview_due or self._capture_pending(grab_time)):
+                continue
+            
+            ret, frame = self._decode_into_buffer(self.cap.retrieve, grab_time)
+            if not ret:
+                self._update_status("disconnected")
+                break
+            if preview_due:
+                self._track_motion(frame, grab_time)
+                self._emit_preview(frame)
     
-    def stop(self):
-        """Dừng thread"""
-        self.running = False
+    def _read_loop(self):
+        """Decode mọi frame, giữ nhịp theo FPS của stream (deadline cố định, không trôi)"""
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        frame_interval = 1.0 / fps if 0 < fps <= 120 else 0.033
+        next_deadline = time.monotonic()
         
-        # Đóng camera capture trước
-        if self.cap:
-            try:
-                self.cap.release()
-            except:
-                pass
-            self.cap = None
+        while self.running and self.cap.isOpened():
+            ret, frame = self._decode_into_buffer(self.cap.read, self._frame_timestamp())
+            if not ret:
+                self._update_status("disconnected")
+                break
+            
+            now = time.monotonic()
+            if self._idle_expired(now):
+                break
+            if self._preview_due(now):
+                self._track_motion(frame, now)
+                self._emit_preview(frame)
+            
+            next_deadline += frame_interval
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -frame_interval:
+                # Trễ quá một frame: bắt nhịp lại thay vì đọc dồn
+                next_deadline = time.monotonic()
+    
+    def _decode_into_buffer(self, decode, timestamp: float) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Decode frame thẳng vào slot kế tiếp của ring buffer (không cấp phát mới)
+        
+        Args:
+            decode: self.cap.read hoặc self.cap.retrieve
+            timestamp: Thời điểm (monotonic) nhận frame từ stream
+        """
+        slot = self.frame_buffer.begin_write()
+        start = time.perf_counter()
+        ret, frame = decode(slot) if slot is not None else decode()
+        if not ret or frame is None:
+            self.stats.record_read_error()
+            return False, None
+        self.stats.record_decode(time.perf_counter() - start)
+        
+        if frame is slot:
+            self.frame_buffer.commit(timestamp)
+        else:
+            # Frame đầu tiên hoặc đổi độ phân giải: cấp phát lại buffer
+            self.frame_buffer.push(frame, timestamp)
+        
+        # Báo cho thread đang chờ frame mới
+        with self._capture_cond:
+            self._capture_cond.notify_all()
+        return True, frame
+    
+    def _idle_expired(self, now: float) -> bool:
+        """Stream mở theo yêu cầu: dừng thread khi quá idle_timeout không có yêu cầu chụp"""
+        if self.idle_timeout and now - self._last_capture_request > self.idle_timeout:
+            self.running = False
+            return True
+        return False
+    
+    def _capture_pending(self, grab_time: float) -> bool:
+        """Frame vừa grab có nằm trong cửa sổ burst sau quẹt thẻ không (cần decode để chọn ảnh)"""
+        return grab_time <= self._burst_until
+    
+    def _current_preview_interval(self, now: float) -> float:
+        """Chu kỳ preview hiện tại: preview_interval, hoặc chậm hơn khi khung hình tĩnh"""
+        if self.motion_gate is None or not self.preview_interval:
+            return self.preview_interval
+        return self.motion_gate.interval(now)
+    
+    def _preview_due(self, now: float) -> bool:
+        """Kiểm tra tới lượt preview, lịch preview tính theo deadline để không bị trôi"""
+        interval = self._current_preview_interval(now)
+        if not interval:
+            return False
+        if self._next_preview - now > interval:
+            # Vừa trở lại tốc độ đầy đủ: không chờ hết chu kỳ chậm
+            self._next_preview = now
+        if now < self._next_preview:
+            return False
+        self._next_preview += interval
+        if self._next_preview <= now:
+            self._next_preview = now + interval
+        return True
+    
+    def _track_motion(self, frame: np.ndarray, now: float):
+        """So sánh frame preview với frame trước để điều chỉnh tốc độ decode"""
+        if self.motion_gate is not None:
+            self.motion_gate.update(frame, now)
+    
+    def _emit_preview(self, frame: np.ndarray):
+        """
+        Scale frame theo kích thước widget và chuyển sang QImage ngay trong thread camera.
+        Chỉ emit khi GUI đã lấy frame trước đó, nên hàng đợi GUI không bao giờ dồn frame.
+        """
+        start = time.perf_counter()
+        try:
+            qimage = bgr_to_qimage(self._scale_for_preview(frame))
+        except Exception:
+            return
+        if not qimage:
+            return
+        self.stats.record_convert(time.perf_counter() - start)
         
-        # Chờ thread kết thúc với timeout (3 giây)
-        if self.isRunning():
-            self.wait(3000)  # Timeout 3 giây
-            if self.isRunning():
-                # Nếu thread vẫn chạy sau timeout, terminate nó
-                self.terminate()
-                self.wait(1000)  # Chờ thêm 1 giây để terminate hoàn tất
+        with self._preview_lock:
+            if self._pending_preview is not None:
+                # GUI chưa kịp lấy frame trước: frame đó bị thay thế
+                self.stats.record_dropped()
+            self._pending_preview = qimage
+            if self._preview_signalled:
+                return
+            self._preview_signalled = True
+        self.frame_ready.emit()
+    
+    def _scale_for_preview(self, frame: np.ndarray) -> np.ndarray:
+        """Thu nhỏ frame vừa khung hiển thị (giữ tỉ lệ)"""
+        size = self._preview_size
+        if not size:
+            return frame
+        target_w, target_h = size
+        h, w = frame.shape[:2]
+        scale = min(target_w / w, target_h / h)
+        new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+        if (new_w, new_h) == (w, h):
+            return frame
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        return cv2.resize(frame, (new_w, new_h), interpolation=interpolation)
+    
+    def set_preview_size(self, width: int, height: int):
+        """Đặt kích thước khung hiển thị (gọi từ GUI khi widget đổi kích thước)"""
+        self._preview_size = (width, height) if width > 0 and height > 0 else None
+    
+    def take_preview_frame(self) -> Optional[QImage]:
+        """Lấy frame preview đang chờ (gọi từ GUI thread khi nhận frame_ready)"""
+        with self._preview_lock:
+            qimage = self._pending_preview
+            self._pending_preview = None
+            self._preview_signalled = False
+        return qimage
+    
+    def stop(self) -> bool:
+        """
+        Dừng thread: ngắt thời gian chờ reconnect và để thread tự thoát.
+        cap do chính thread camera đóng; open/read đều có timeout nên không cần terminate().
+        
+        Returns:
+            False nếu thread vẫn chạy sau stop_timeout: người gọi phải giữ tham chiếu tới thread
+            (hủy QThread đang chạy làm Qt dừng cả process), xem CameraManager.stop()
+        """
+        self.request_stop()
+        if self.isRunning() and not self.wait(int(self.supervisor.stop_timeout * 1000)):
+            self.error_occurred.emit(f"Camera {self.camera_key}: thread chưa dừng sau "
+                                     f"{self.supervisor.stop_timeout:.0f}s")
+            return False
+        return True
+    
+    def request_stop(self):
+        """Báo thread dừng mà không chờ (dùng khi dừng nhiều camera song song)"""
+        self.running = False
+        self._wake_event.set()
+        with self._capture_cond:
+            self._capture_cond.notify_all()
     
     def get_last_frame(self) -> Optional[QImage]:
-        """Lấy frame cuối cùng (để chụp ảnh)"""
-        return self.last_frame
+        """Lấy frame cuối cùng dạng QImage (để chụp ảnh), chỉ chuyển đổi khi được gọi"""
+        latest = self.frame_buffer.latest()
+        if latest is None:
+            return None
+        return bgr_to_qimage(latest[0])
+    
+    def get_last_raw_frame(self) -> Optional[Tuple[np.ndarray, float]]:
+        """Lấy bản copy frame thô (BGR) mới nhất và timestamp monotonic"""
+        latest = self.frame_buffer.latest()
+        if latest is None:
+            return None
+        return latest[0], latest[1]
+    
+    def set_motion_gate(self, gate: Optional[MotionGate]):
+        """Bật giảm tốc độ preview khi khung hình tĩnh (None = tắt)"""
+        self.motion_gate = gate
+    
+    def _wake_motion(self):
+        """Quẹt thẻ: trở lại tốc độ preview đầy đủ ngay"""
+        if self.motion_gate is not None:
+            self.motion_gate.wake(time.monotonic())
+    
+    def set_capture_source(self, source: "CameraThread", on_demand: bool = False, open_timeout: float = 3.0):
+        """
+        Dùng stream khác (thường là main stream độ phân giải cao) để chụp ảnh bằng chứng
+        
+        Args:
+            source: CameraThread của main stream (preview_fps=0, chỉ grab)
+            on_demand: True = chỉ mở stream khi có yêu cầu chụp (source cần idle_timeout > 0)
+            open_timeout: Thời gian chờ tối đa khi phải mở stream theo yêu cầu (giây)
+        """
+        self.capture_source = source
+        self.capture_on_demand = on_demand
+        self.capture_open_timeout = open_timeout
+    
+    def request_burst(self, until: float):
+        """
+        Decode mọi frame nhận được tới thời điểm until (monotonic) để có đủ ứng viên
+        chọn ảnh nét nhất sau khi quẹt thẻ. Áp dụng cho cả capture_source nếu có.
+        """
+        source = self.capture_source
+        if source is not None:
+            source_until = until
+            if self.capture_on_demand and (not source.running or source.get_status() != "connected"):
+                # Main stream đang mở: giữ burst tới khi mở xong để có frame sau quẹt thẻ (wait_capture_source)
+                source_until += self.capture_open_timeout
+                if not source.isRunning():
+                    source.running = True  # Đang khởi động, không phải đang dừng (xem restart_capture_source)
+                    source.start()
+                # Thread đang tự dừng (idle_timeout) thì chưa start lại được: CaptureWorker gọi restart_capture_source
+            source.request_burst(source_until)
+        self._last_capture_request = time.monotonic()
+        self._burst_until = max(self._burst_until, until)
+        self._wake_motion()
+    
+    def wait_for_frame(self, since: float, timeout: float) -> Optional[float]:
+        """Chờ frame có timestamp >= since, trả về timestamp đó hoặc None nếu hết timeout"""
+        with self._capture_cond:
+            self._capture_cond.wait_for(lambda: (self.frame_buffer.latest_timestamp() or 0.0) >= since,
+                                        max(0.0, timeout))
+        timestamp = self.frame_buffer.latest_timestamp()
+        return timestamp if timestamp is not None and timestamp >= since else None
+    
+    def restart_capture_source(self, trigger: float):
+        """
+        Main stream on_demand đang tự dừng (hết idle_timeout) đúng lúc quẹt thẻ: chờ thread thoát hẳn
+        rồi mở lại, tối đa capture_open_timeout tính từ trigger. Có thể chờ: gọi ngoài GUI thread
+        """
+        source = self.capture_source
+        if source is None or not self.capture_on_demand or source.running:
+            return
+        timeout = trigger + self.capture_open_timeout - time.monotonic()
+        if source.isRunning() and not source.wait(max(0, int(timeout * 1000))):
+            return
+        if not source.running and not source.isRunning():
+            source.running = True
+            source.start()
+
+    def wait_capture_source(self, trigger: float) -> Optional[float]:
+        """
+        Main stream mở theo yêu cầu (on_demand): chờ frame đầu tiên sau lúc quẹt thẻ,
+        tối đa capture_open_timeout tính từ trigger
+
+        Returns:
+            Timestamp frame đó, None nếu không dùng on_demand hoặc main stream chưa mở kịp
+        """
+        if self.capture_source is None or not self.capture_on_demand:
+            return None
+        timeout = trigger + self.capture_open_timeout - time.monotonic()
+        return self.capture_source.wait_for_frame(trigger, timeout)
+    
+    def get_frame_window(self, since: float, until: float) -> Tuple[FrameRingBuffer, List[Tuple[float, int]]]:
+        """
+        Các frame trong khoảng [since, until] (cũ -> mới), ưu tiên main stream nếu có frame trong khoảng đó
+
+        Returns:
+            (ring buffer chứa frame, danh sách (timestamp, sequence)), đọc frame bằng buffer.read(seq)
+        """
+        if self.capture_source is not None:
+            buffer = self.capture_source.frame_buffer
+            frames = buffer.window(since, until)
+            if frames:
+                return buffer, frames
+        return self.frame_buffer, self.frame_buffer.window(since, until)
+    
+    def get_frame_age(self) -> Optional[float]:
+        """Tuổi (giây) của frame mới nhất, None nếu chưa có frame"""
+        timestamp = self.frame_buffer.latest_timestamp()
+        if timestamp is None:
+            return None
+        return time.monotonic() - timestamp
     
     def get_status(self) -> str:
         """Lấy trạng thái hiện tại"""
         return self.current_status
 
+
+class ProcessCameraThread(CameraThread):
+    """
+    CameraThread decode trong process riêng (tránh tranh GIL với GUI).
+    Process con publish frame vào shared memory, thread này đọc qua SharedMemoryCapture
+    nên signals (frame_ready, status_changed, error_occurred) giữ nguyên như CameraThread.
+    """
+    
+    def __init__(self, rtsp_url: str, camera_key: str = "", reconnect_delay: int = 3,
+                 buffer_size: int = 8, preview_fps: float = 15, idle_timeout: float = 0,
+                 max_width: int = 1920, max_height: int = 1080, shm_slots: int = 3,
+                 open_timeout: float = 10.0, stats_window: float = 60,
+                 supervisor: Optional[ConnectionSupervisor] = None):
+        """
+        Args:
+            max_width, max_height: Kích thước frame tối đa của slot shared memory
+                                   (frame lớn hơn sẽ được thu nhỏ trong process con)
+            shm_slots: Số slot frame trong shared memory
+            open_timeout: Thời gian chờ process con kết nối xong RTSP (giây)
+            Các tham số còn lại giống CameraThread
+        """
+        super().__init__(rtsp_url, camera_key, reconnect_delay, buffer_size, preview_fps,
+                         decode_mode="grab", idle_timeout=idle_timeout, stats_window=stats_window,
+                         supervisor=supervisor)
+        self.max_width = max_width
+        self.max_height = max_height
+        self.shm_slots = shm_slots
+        self.open_timeout = open_timeout
+        self.channel: Optional[SharedFrameChannel] = None
+        # GUI thread (request_burst) ghi vào channel trong khi _stop_decoder có thể đóng nó
+        self._channel_lock = threading.Lock()
+        self.process = None
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._stop_event = None
+        self._frame_event = None
+        self._error_queue = None
+    
+    def run(self):
+        """Khởi động process decode, chạy vòng đọc của CameraThread, dọn dẹp khi dừng"""
+        try:
+            self._start_decoder()
+        except Exception as e:
+            self._update_status("error")
+            self.error_occurred.emit(f"Lỗi camera {self.camera_key}: không tạo được process decode ({str(e)})")
+            return
+        try:
+            super().run()
+        finally:
+            self._stop_decoder()
+    
+    def _start_decoder(self):
+        channel = SharedFrameChannel.create(self.shm_slots, self.max_width, self.max_height)
+        # Burst yêu cầu trước khi process chạy (mở main stream on_demand lúc quẹt thẻ)
+        channel.request_burst(self._burst_until)
+        with self._channel_lock:
+            self.channel = channel
+        self._stop_event = self._mp_context.Event()
+        self._frame_event = self._mp_context.Event()
+        self._error_queue = self._mp_context.Queue(maxsize=100)
+        preview_fps = 1.0 / self.preview_interval if self.preview_interval else 0
+        self.process = self._mp_context.Process(
+            target=run_decoder,
+            args=(self.rtsp_url, self.channel.name, self.shm_slots, self.max_width, self.max_height,
+                  preview_fps, self.supervisor.settings(), self._stop_event, self._frame_event,
+                  self._error_queue),
+            name=f"decode-{self.camera_key}",
+            daemon=True
+        )
+        self.process.start()
+    
+    def _stop_decoder(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+        if self.process is not None:
+            self.process.join(3)
+            if self.process.is_alive():
+                # Process con có thể bị kill an toàn (khác với terminate QThread)
+                self.process.kill()
+                self.process.join(1)
+            self.process = None
+        with self._channel_lock:
+            channel, self.channel = self.channel, None
+            if channel is not None:
+                channel.close(unlink=True)
+    
+    def _decoder_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+    
+    def _open_capture(self):
+        self._forward_errors()
+        if self.channel is None:
+            raise RuntimeError("chưa có process decode")
+        # Process con đã chết thì không chờ open_timeout, để _wait_reconnect khởi động lại ngay
+        open_timeout = self.open_timeout if self._decoder_alive() else 0
+        return SharedMemoryCapture(self.channel, self._frame_event, self._stop_event,
+                                   open_timeout=open_timeout,
+                                   read_timeout=self.supervisor.read_timeout,
+                                   process=self.process)
+    
+    def _wait_reconnect(self):
+        if not self.running:
+            return
+        if self._decoder_alive():
+            # Process con tự backoff khi kết nối lại, ở đây chỉ chờ ngắn rồi theo dõi tiếp shared memory
+            self._wake_event.wait(0.1)
+            self._wake_event.clear()
+            return
+        # Process con chết (crash trong decoder, bị kill...): chờ backoff của supervisor rồi tạo lại
+        self._forward_errors()
+        exitcode = self.process.exitcode if self.process is not None else None
+        self.error_occurred.emit(f"Lỗi camera {self.camera_key}: process decode đã dừng "
+                                 f"(exitcode={exitcode}), khởi động lại")
+        self._stop_decoder()
+        super()._wait_reconnect()
+        if not self.running:
+            return
+        try:
+            self._start_decoder()
+        except Exception as e:
+            self.error_occurred.emit(f"Lỗi camera {self.camera_key}: không tạo được process decode ({str(e)})")
+    
+    def _frame_timestamp(self) -> float:
+        # Timestamp lúc process con grab frame (time.monotonic dùng chung đồng hồ hệ thống)
+        self._forward_errors()
+        missed = self.cap.take_missed_frames()
+        if missed:
+            # Process con publish nhanh hơn tốc độ đọc, slot bị ghi đè trước khi kịp đọc
+            self.stats.record_dropped(missed)
+        return self.cap.frame_timestamp or time.monotonic()
+    
+    def _preview_due(self, now: float) -> bool:
+        # Báo chu kỳ preview hiện tại (có thể đã giảm do khung hình tĩnh) cho process con
+        interval = self._current_preview_interval(now)
+        with self._channel_lock:
+            channel = self.channel
+            if channel is not None and channel.preview_interval != interval:
+                channel.set_preview_interval(interval)
+        # Process con đã giữ nhịp preview, cho dung sai nửa chu kỳ để không bỏ frame vì jitter
+        return super()._preview_due(now + interval / 2)
+    
+    def _forward_errors(self):
+        """Chuyển lỗi từ process con thành signal error_occurred"""
+        if self._error_queue is None:
+            return
+        while True:
+            try:
+                message = self._error_queue.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                return
+            self.error_occurred.emit(f"Lỗi camera {self.camera_key}: {message}")
+    
+    def request_burst(self, until: float):
+        with self._channel_lock:
+            if self.channel is not None:
+                self.channel.request_burst(until)
+        super().request_burst(until)
+    
+    def kill_decoder(self):
+        """Dừng cưỡng bức process con (thread không dừng kịp): vòng đọc shared memory thấy process chết và thoát"""
+        process = self.process
+        if process is not None and process.is_alive():
+            process.kill()
+    
+    def request_stop(self):
+        """Dừng process con trước để vòng đọc shared memory thoát ngay"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+        super().request_stop()
@@ -42,19 +42,23 @@ class CameraWidget(QLabel):
     def set_camera_thread(self, thread: CameraThread):
         """Gán camera thread và kết nối signals"""
         self.camera_thread = thread
+        thread.set_preview_size(self.contentsRect().width(), self.contentsRect().height())
         thread.frame_ready.connect(self.update_frame)
         thread.status_changed.connect(self.update_status)
     
-    def update_frame(self, qimage: QImage):
-        """Cập nhật frame hiển thị"""
+    def update_frame(self):
+        """Cập nhật frame hiển thị (ảnh đã được scale sẵn trong thread camera)"""
+        if not self.camera_thread:
+            return
+        qimage = self.camera_thread.take_preview_frame()
         if qimage:
-            # Scale ảnh để vừa với widget
-            scaled_pixmap = QPixmap.fromImage(qimage).scaled(
-                self.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            self.setPixmap(scaled_pixmap)
+            self.setPixmap(QPixmap.fromImage(qimage))
+    
+    def resizeEvent(self, event):
+        """Báo kích thước mới cho thread camera để scale frame đúng khung"""
+        super().resizeEvent(event)
+        if self.camera_thread:
+            self.camera_thread.set_preview_size(self.contentsRect().width(), self.contentsRect().height())
     
     def update_status(self, status: str):
         """Cập nhật trạng thái kết nối"""
@@ -79,12 +83,6 @@ class CameraWidget(QLabel):
             self.clicked.emit()
         super().mousePressEvent(event)
     
-    def get_current_frame(self):
-        """Lấy frame hiện tại (để chụp ảnh)"""
-        if self.camera_thread:
-            return self.camera_thread.get_last_frame()
-        return None
-    
     def get_status(self) -> str:
         """Lấy trạng thái hiện tại"""
         return self.status
@@ -0,0 +1,105 @@
+"""
+QThread chọn ảnh chụp khi quẹt thẻ (chạy ngoài GUI thread)
+Gom frame trước/sau thời điểm quẹt thẻ, chọn cặp ảnh trước/sau nét nhất và cùng thời điểm
+"""
+import time
+from PyQt5.QtCore import QThread, pyqtSignal
+from typing import Optional
+
+from camera_thread import CameraThread
+from frame_selector import score_window, select_pair
+
+
+class CaptureWorker(QThread):
+    """Thread chọn cặp ảnh tốt nhất của 1 làn trong cửa sổ ±thời gian quanh lúc quẹt thẻ"""
+
+    # Signal: (làn, mã thẻ, thời điểm quẹt thẻ, kết quả camera trước, kết quả camera sau, lỗi)
+    # Kết quả mỗi camera: (frame BGR, timestamp monotonic, điểm) hoặc None
+    # Lỗi: "" nếu cặp ảnh hợp lệ, ngược lại là mô tả (mất ảnh, ảnh cũ, lệch thời gian)
+    capture_done = pyqtSignal(str, str, float, object, object, str)
+
+    def __init__(self, lane: str, card_code: str,
+                 front_thread: Optional[CameraThread], rear_thread: Optional[CameraThread],
+                 pre_trigger: float = 0.3, post_trigger: float = 0.3,
+                 budget: float = 0.08, analysis_width: int = 320,
+                 max_skew: float = 0.15, max_age: float = 1.0):
+        """
+        Khởi tạo CaptureWorker (gọi ngay lúc quẹt thẻ để lấy đúng thời điểm)
+
+        Args:
+            lane: Tên làn ("VAO"/"RA")
+            card_code: Mã thẻ
+            front_thread, rear_thread: CameraThread của camera trước/sau (None nếu không có)
+            pre_trigger: Lấy frame từ bao nhiêu giây trước lúc quẹt thẻ
+            post_trigger: Chờ thêm bao nhiêu giây sau lúc quẹt thẻ
+            budget: Tổng thời gian chấm điểm tối đa cho cả 2 camera (giây)
+            analysis_width: Độ rộng ảnh dùng để chấm điểm
+            max_skew: Độ lệch tối đa giữa ảnh trước và sau (giây)
+            max_age: Độ lệch tối đa của ảnh so với lúc quẹt thẻ (giây)
+        """
+        super().__init__()
+        self.trigger = time.monotonic()
+        self.lane = lane
+        self.card_code = card_code
+        self.front_thread = front_thread
+        self.rear_thread = rear_thread
+        self.pre_trigger = pre_trigger
+        self.post_trigger = post_trigger
+        self.budget = budget
+        self.analysis_width = analysis_width
+        self.max_skew = max_skew
+        self.max_age = max_age
+        self.until = self.trigger + post_trigger  # Cuối cửa sổ chọn ảnh (kéo dài khi chờ main stream on_demand)
+
+        # Bắt đầu decode dày đặc ngay lập tức, trước khi thread được lên lịch
+        for thread in (front_thread, rear_thread):
+            if thread is not None:
+                thread.request_burst(self.trigger + post_trigger)
+
+    def run(self):
+        """Chờ hết cửa sổ sau quẹt thẻ rồi chọn ảnh cho từng camera"""
+        for thread in (self.front_thread, self.rear_thread):
+            if thread is not None:
+                thread.restart_capture_source(self.trigger)
+        self._sleep_until(self.until)
+
+        # Main stream on_demand chỉ mở lúc quẹt thẻ: chờ frame đầu tiên rồi gom thêm post_trigger giây,
+        # chấp nhận ảnh muộn hơn max_age đúng bằng thời gian mở stream
+        for thread in (self.front_thread, self.rear_thread):
+            if thread is not None:
+                first = thread.wait_capture_source(self.trigger)
+                if first is not None:
+                    self.until = max(self.until, first + self.post_trigger)
+        self._sleep_until(self.until)
+        max_age = self.max_age + (self.until - self.trigger - self.post_trigger)
+
+        front = self._score(self.front_thread)
+        rear = self._score(self.rear_thread)
+        best_front, best_rear, error = select_pair(front, rear, self.trigger, self.max_skew, max_age)
+        for thread, best in ((self.front_thread, best_front), (self.rear_thread, best_rear)):
+            if thread is not None and best is not None:
+                thread.stats.record_capture_age(self.trigger - best[1])
+        self.capture_done.emit(self.lane, self.card_code, self.trigger, best_front, best_rear, error or "")
+
+    @staticmethod
+    def _sleep_until(deadline: float):
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _score(self, thread: Optional[CameraThread]):
+        """
+        Chấm điểm các frame của một camera trong cửa sổ quanh lúc quẹt thẻ.
+        Không có frame trong cửa sổ (vừa mất kết nối) thì lấy frame mới nhất
+        để select_pair báo ảnh cũ thay vì lưu âm thầm.
+        """
+        if thread is None:
+            return []
+        buffer, frames = thread.get_frame_window(self.trigger - self.pre_trigger, self.until)
+        if not frames:
+            latest = thread.get_last_raw_frame()
+            if latest is None:
+                return []
+            return [(latest[0], latest[1], 0.0)]
+        # Budget tính cả thời gian copy frame khỏi ring buffer, không chỉ phần chấm điểm
+        return score_window(frames, buffer.read, self.trigger, self.budget / 2, self.analysis_width)
@@ -0,0 +1,108 @@
+"""
+Đọc file thẻ tháng CSV để nhập hàng loạt bằng COPY (xem ParkingDatabase.import_from_csv)
+- Định dạng xuất từ phần mềm cũ (thethang.csv, không header, 11 cột):
+  mã thẻ, phòng, số thứ tự, trạng thái (1/0), loại thẻ, ngày bắt đầu, ngày kết thúc, biển số, người tạo, ...
+- Vẫn nhận file cũ chỉ có cột mã thẻ: chỉ kích hoạt thẻ, giữ nguyên biển số / chủ thẻ / thời hạn trong DB
+"""
+import csv
+import io
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+# Vị trí cột trong thethang.csv
+COL_CARD_ID = 0
+COL_ROOM = 1
+COL_STATUS = 3
+COL_VALID_FROM = 5
+COL_VALID_TO = 6
+COL_PLATE = 7
+
+# Cột của bảng tạm nhận COPY (line_no: dòng sau cùng thắng khi 1 thẻ xuất hiện nhiều lần)
+STAGING_COLUMNS = ("line_no", "card_id", "has_details", "plate_number", "customer_name",
+                   "is_active", "valid_from", "valid_to")
+# Cột nhận NULL: csv.writer ghi None thành "" (có ngoặc kép), COPY cần FORCE_NULL để hiểu là NULL
+NULL_COLUMNS = ("valid_from", "valid_to")
+
+
+class CardCsvError(ValueError):
+    """Dòng CSV không hợp lệ (mã thẻ quá dài, ngày sai định dạng...)"""
+
+
+def _cell(row: List[str], index: int) -> str:
+    return row[index].strip() if index < len(row) else ""
+
+
+def _parse_date(value: str, line_no: int) -> Optional[str]:
+    if not value:
+        return None
+    text = value[:10]
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise CardCsvError(f"Dòng {line_no}: ngày không hợp lệ '{value}'")
+
+
+def read_card_rows(csv_path: str) -> Iterator[tuple]:
+    """
+    Đọc lần lượt từng dòng (không nạp cả file vào RAM), trả về tuple theo STAGING_COLUMNS.
+    Bỏ qua dòng trống / không có mã thẻ.
+    """
+    # utf-8-sig: file xuất từ Excel/phần mềm cũ có BOM ở đầu
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.reader(f), start=1):
+            card_id = _cell(row, COL_CARD_ID)
+            if not card_id:
+                continue
+            if len(card_id) > 50:
+                raise CardCsvError(f"Dòng {line_no}: mã thẻ quá dài '{card_id[:20]}...'")
+            if len(row) <= COL_PLATE:
+                yield (line_no, card_id, "f", "", "", "t", None, None)
+                continue
+            room = _cell(row, COL_ROOM)
+            yield (line_no, card_id, "t",
+                   _cell(row, COL_PLATE)[:20],
+                   f"Phòng {room}" if room else "",
+                   "f" if _cell(row, COL_STATUS) == "0" else "t",
+                   _parse_date(_cell(row, COL_VALID_FROM), line_no),
+                   _parse_date(_cell(row, COL_VALID_TO), line_no))
+
+
+class CopyStream(io.RawIOBase):
+    """
+    File-like cho cursor.copy_expert: sinh dữ liệu CSV theo từng khối khi PostgreSQL đọc.
+    Chuỗi được đặt trong ngoặc kép, None cũng thành "" (chuỗi rỗng):
+    COPY phải có FORCE_NULL với NULL_COLUMNS để các cột đó nhận NULL.
+    """
+
+    def __init__(self, rows: Iterator[tuple]):
+        super().__init__()
+        self._rows = rows
+        self._buffer = b""
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _next_chunk(self, rows_per_chunk: int = 1000) -> bytes:
+        out = io.StringIO()
+        writer = csv.writer(out, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+        for row in self._rows:
+            writer.writerow(row)
+            self.count += 1
+            if self.count % rows_per_chunk == 0:
+                break
+        return out.getvalue().encode("utf-8")
@@ -0,0 +1,256 @@
+"""
+Danh sách thẻ tháng trong bộ nhớ: phân loại xe tháng / vãng lai khi quẹt thẻ không cần truy vấn DB
+- Nạp toàn bộ lúc khởi động, sau đó chỉ tải các thẻ có updated_at mới hơn
+- LISTEN cards_changed (trigger trên bảng cards, xem db_migrations.py) để cập nhật ngay sau khi
+  nhập CSV / sửa thẻ; kiểm tra định kỳ phòng khi mất thông báo
+- Thẻ có thời hạn (valid_from/valid_to) chỉ là xe tháng trong khoảng đó
+"""
+import select
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import psycopg2
+
+from connection_supervisor import compute_backoff
+
+CARDS_CHANNEL = "cards_changed"
+FULL_RELOAD_PAYLOAD = "full"  # Trigger gửi khi xóa thẻ: incremental không thấy được dòng đã xóa
+UPDATED_AT_OVERLAP = timedelta(seconds=60)  # Transaction dài commit muộn vẫn được tải lại
+
+CardInfo = namedtuple("CardInfo", "is_active valid_from valid_to plate_number customer_name")
+
+
+class CardRegistry:
+    """Bảng băm mã thẻ -> thông tin thẻ tháng, đọc từ mọi thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cards: Dict[str, CardInfo] = {}
+        self.loaded = False
+        self.last_updated: Optional[datetime] = None  # updated_at lớn nhất (giờ server) đã tải
+        self.hits = 0       # Quẹt thẻ tháng còn hiệu lực
+        self.misses = 0     # Quẹt thẻ không có / hết hạn / đã khóa -> vãng lai
+        self.refreshes = 0
+
+    def is_monthly(self, card_id: str, today: Optional[date] = None) -> bool:
+        """Thẻ tháng còn hiệu lực hôm nay (O(1), không truy vấn DB)"""
+        info = self._cards.get(card_id)
+        today = today or date.today()
+        monthly = (info is not None and info.is_active
+                   and (info.valid_from is None or info.valid_from <= today)
+                   and (info.valid_to is None or today <= info.valid_to))
+        if monthly:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return monthly
+
+    def classify(self, card_id: str) -> Optional[bool]:
+        """Như is_monthly, nhưng None khi chưa nạp được danh sách (chưa biết thẻ tháng hay vãng lai)"""
+        if not self.loaded:
+            return None
+        return self.is_monthly(card_id)
+
+    def get(self, card_id: str) -> Optional[CardInfo]:
+        return self._cards.get(card_id)
+
+    @staticmethod
+    def _info(row: dict) -> CardInfo:
+        return CardInfo(bool(row["is_active"]), _as_date(row.get("valid_from")), _as_date(row.get("valid_to")),
+                        row.get("plate_number") or "", row.get("customer_name") or "")
+
+    def replace(self, rows: List[dict]):
+        """Thay toàn bộ danh sách (nạp đầy đủ)"""
+        cards = {row["card_id"]: self._info(row) for row in rows}
+        with self._lock:
+            self._cards = cards
+            self.last_updated = _max_updated(rows, None)
+            self.loaded = True
+            self.refreshes += 1
+
+    def apply(self, rows: List[dict]) -> int:
+        """Cập nhật các thẻ thay đổi (nạp tăng dần), trả về số thẻ thực sự khác trước"""
+        changed = 0
+        with self._lock:
+            cards = dict(self._cards)  # Copy-on-write: thread quẹt thẻ đọc không cần khóa
+            for row in rows:
+                info = self._info(row)
+                if cards.get(row["card_id"]) != info:
+                    cards[row["card_id"]] = info
+                    changed += 1
+            self._cards = cards
+            self.last_updated = _max_updated(rows, self.last_updated)
+            self.refreshes += 1
+        return changed
+
+    def snapshot(self) -> List[dict]:
+        """Danh sách thẻ dạng dict (lưu vào spool để khởi động khi mất kết nối DB)"""
+        return [{"card_id": card_id, "is_active": info.is_active,
+                 "valid_from": info.valid_from.isoformat() if info.valid_from else None,
+                 "valid_to": info.valid_to.isoformat() if info.valid_to else None,
+                 "plate_number": info.plate_number, "customer_name": info.customer_name}
+                for card_id, info in self._cards.items()]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "count": len(self._cards),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "refreshes": self.refreshes,
+            "last_updated": self.last_updated,
+        }
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        return (f"Thẻ tháng: {s['count']} thẻ, {s['hits']} lượt xe tháng / {s['misses']} vãng lai "
+                f"({s['hit_rate'] * 100:.0f}%), {s['refreshes']} lần tải")
+
+
+class CardRegistryRefresher(threading.Thread):
+    """Thread giữ CardRegistry khớp với bảng cards (LISTEN/NOTIFY + kiểm tra định kỳ)"""
+
+    def __init__(self, db, registry: CardRegistry, refresh_interval: float = 60.0,
+                 full_refresh_interval: float = 3600.0, on_change=None):
+        """
+        Args:
+            db: ParkingDatabase (fetch_cards, pool.params cho kết nối LISTEN)
+            refresh_interval: Chu kỳ tải thẻ thay đổi khi không nhận được thông báo (giây)
+            full_refresh_interval: Chu kỳ nạp lại toàn bộ (giây)
+            on_change: Gọi sau mỗi lần danh sách thay đổi (ví dụ lưu vào spool)
+        """
+        super().__init__(name="card-registry", daemon=True)
+        self.db = db
+        self.registry = registry
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.on_change = on_change
+        self._stop_event = threading.Event()
+        self._pending = threading.Event()  # Có thông báo / yêu cầu tải lại
+        self._full_pending = True
+        self._listen_conn = None
+        self._failures = 0
+
+    def refresh_soon(self, full: bool = False):
+        """Yêu cầu tải lại ngay (sau khi nhập CSV trên chính máy này)"""
+        if full:
+            self._full_pending = True
+        self._pending.set()
+
+    def run(self):
+        next_full = 0.0
+        next_poll = 0.0
+        next_listen = 0.0
+        while not self._stop_event.is_set():
+            if self._listen_conn is None and time.monotonic() >= next_listen:
+                self._listen_conn = self._listen()
+                # Mất kết nối DB: thử LISTEN lại theo chu kỳ kiểm tra, không liên tục
+                next_listen = time.monotonic() + self.refresh_interval
+            self._wait_notifications(max(0.0, min(next_full, next_poll) - time.monotonic()))
+            if self._stop_event.is_set():
+                break
+
+            now = time.monotonic()
+            full = self._full_pending or now >= next_full or not self.registry.loaded
+            if not (full or self._pending.is_set() or now >= next_poll):
+                continue
+            self._pending.clear()
+            if self._refresh(full):
+                self._failures = 0
+                if full:
+                    self._full_pending = False
+                    next_full = now + self.full_refresh_interval
+                next_poll = now + self.refresh_interval
+            else:
+                self._failures += 1
+                next_poll = now + compute_backoff(self._failures, 1.0, self.refresh_interval, 0.3)
+                next_full = min(next_full, next_poll)
+        self._close_listen()
+
+    def _refresh(self, full: bool) -> bool:
+        since = None if full else (self.registry.last_updated - UPDATED_AT_OVERLAP
+                                   if self.registry.last_updated else None)
+        success, rows = self.db.fetch_cards(since)
+        if not success:
+            print(f"Card Registry Error: {rows}")
+            return False
+        if since is None:
+            self.registry.replace(rows)
+            changed = True
+        else:
+            changed = self.registry.apply(rows) > 0
+        if changed and self.on_change:
+            self.on_change(self.registry.snapshot())
+        return True
+
+    def _listen(self):
+        """Kết nối riêng (autocommit) chỉ để nhận NOTIFY, None nếu không kết nối được"""
+        try:
+            conn = psycopg2.connect(**self.db.pool.params)
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CARDS_CHANNEL}")
+            # Có thể đã lỡ thông báo trong lúc mất kết nối
+            self._full_pending = True
+            return conn
+        except Exception as e:
+            print(f"Card Registry Error: không LISTEN được ({e}), chỉ kiểm tra định kỳ")
+            return None
+
+    def _wait_notifications(self, timeout: float):
+        """Chờ NOTIFY hoặc refresh_soon() tối đa timeout giây"""
+        deadline = time.monotonic() + timeout
+        while not self._stop_event.is_set() and not self._pending.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self._listen_conn is None:
+                self._pending.wait(min(remaining, 1.0))
+                continue
+            try:
+                # Chia nhỏ thời gian chờ để stop()/refresh_soon() có hiệu lực nhanh
+                if select.select([self._listen_conn], [], [], min(remaining, 1.0))[0]:
+                    self._listen_conn.poll()
+                    while self._listen_conn.notifies:
+                        notify = self._listen_conn.notifies.pop(0)
+                        if notify.payload == FULL_RELOAD_PAYLOAD:
+                            self._full_pending = True
+                        self._pending.set()
+            except (OSError, ValueError, psycopg2.Error):
+                self._close_listen()
+                return
+
+    def _close_listen(self):
+        if self._listen_conn is not None:
+            try:
+                self._listen_conn.close()
+            except Exception:
+                pass
+            self._listen_conn = None
+
+    def stop(self, timeout: float = 3.0):
+        self._stop_event.set()
+        self._pending.set()
+        self.join(timeout)
+
+
+def _as_date(value) -> Optional[date]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _max_updated(rows: List[dict], current: Optional[datetime]) -> Optional[datetime]:
+    for row in rows:
+        updated = row.get("updated_at")
+        if updated is not None and (current is None or updated > current):
+            current = updated
+    return current
@@ -22,16 +22,207 @@ class ConfigManager:
         return self.config.get(key, default)
         
     def get_rtsp_url(self, camera_key):
-        urls = self.config.get("rtsp_urls", {})
-        return urls.get(camera_key)
+        """Lấy URL stream dùng để xem trực tiếp (preview)"""
+        return self.get_camera_urls(camera_key)["preview"]
+
+    def get_camera_urls(self, camera_key):
+        """
+        Lấy cấu hình stream của camera. Mỗi camera có thể khai báo:
+        - Một chuỗi URL: dùng chung cho xem trực tiếp và chụp ảnh
+        - Một object: {"preview": substream, "capture": main stream,
+                       "capture_mode": "warm" | "on_demand"}
+        """
+        entry = self.config.get("rtsp_urls", {}).get(camera_key)
+        if not isinstance(entry, dict):
+            return {"preview": entry, "capture": None, "capture_mode": "warm"}
+        preview_url = entry.get("preview") or entry.get("capture")
+        capture_url = entry.get("capture")
+        if capture_url == preview_url:
+            capture_url = None
+        return {
+            "preview": preview_url,
+            "capture": capture_url,
+            "capture_mode": entry.get("capture_mode", "warm")
+        }
         
     def get_save_directory(self):
         # Mặc định lưu D:\DuLieuBaiXe nếu config không có
         return self.config.get("save_directory", r"D:\DuLieuBaiXe")
     
+    def get_storage_config(self):
+        """Lấy cấu hình ghi ảnh (thread ghi nền, hàng đợi, JPEG, fsync) và bảo trì kho ảnh"""
+        default_storage = {
+            "backend": "files",       # "files" = file JPEG rời, "pack" = gộp vào images.pack mỗi ngày
+            "writer_threads": 2,      # Số thread encode/ghi ảnh
+            "write_queue_size": 32,   # Số ảnh tối đa chờ ghi
+            "jpeg_quality": 85,
+            "fsync_interval": 1.0,    # fsync theo lô mỗi N giây (0 = tắt)
+            "recompress_after_days": 30,  # Nén lại ảnh cũ hơn N ngày (0 = tắt)
+            "recompress_quality": 60,     # Chất lượng JPEG khi nén lại
+            "recompress_max_width": 1280, # Thu nhỏ ảnh khi nén lại (0 = giữ kích thước)
+            "retention_days": 365,        # Xóa ảnh cũ hơn N ngày (0 = giữ mãi)
+            "min_free_gb": 10,            # Dung lượng trống tối thiểu, thiếu thì xóa ngày cũ nhất (0 = tắt)
+            "maintenance_interval_minutes": 60,  # Chu kỳ chạy bảo trì
+            "maintenance_files_per_second": 20,  # Giới hạn tốc độ nén lại (0 = không giới hạn)
+            "thumbnail_width": 320,       # Chiều rộng ảnh thu nhỏ để tra cứu
+            "thumbnail_on_save": True,    # Tạo ảnh thu nhỏ ngay khi lưu (False = tạo khi xem lần đầu)
+            "thumbnail_cache_mb": 64      # RAM tối đa cho cache ảnh thu nhỏ
+        }
+        storage_cfg = dict(default_storage)
+        storage_cfg.update(self.config.get("storage", {}))
+        return storage_cfg
+
+    def get_spool_config(self):
+        """Lấy cấu hình spool cục bộ (SQLite) cho check-in/check-out khi PostgreSQL mất kết nối"""
+        default_spool = {
+            "enabled": True,
+            "path": "spool.db",           # File SQLite (WAL) cạnh ứng dụng
+            "batch_size": 200,            # Số sự kiện tối đa mỗi lần đồng bộ
+            "sync_interval": 2.0,         # Chu kỳ đồng bộ (giây), thử lại chậm dần khi mất kết nối
+            "keep_days": 7                # Giữ sự kiện đã đồng bộ trong spool N ngày
+        }
+        spool_cfg = dict(default_spool)
+        spool_cfg.update(self.config.get("spool", {}))
+        return spool_cfg
+
+    def get_card_registry_config(self):
+        """Lấy cấu hình danh sách thẻ tháng trong bộ nhớ"""
+        default_cards = {
+            "refresh_interval": 60,         # Kiểm tra thẻ thay đổi mỗi N giây (ngoài thông báo LISTEN/NOTIFY)
+            "full_refresh_interval": 3600   # Nạp lại toàn bộ mỗi N giây
+        }
+        cards_cfg = dict(default_cards)
+        cards_cfg.update(self.config.get("cards", {}))
+        return cards_cfg
+
+    def get_report_config(self):
+        """Lấy cấu hình xuất báo cáo (thư mục, định dạng, ca làm việc)"""
+        default_report = {
+            "directory": r"D:\BaoCao",   # Không có ổ D: thì lưu vào thư mục hiện tại/BaoCao
+            "format": "xlsx",             # "xlsx" hoặc "csv"
+            "fetch_size": 2000,           # Số dòng đọc mỗi lô từ DB
+            "shifts": [                   # Ca làm việc (end <= start: ca qua đêm)
+                {"name": "Ca ngày", "start": "06:00", "end": "18:00"},
+                {"name": "Ca đêm", "start": "18:00", "end": "06:00"}
+            ]
+        }
+        report_cfg = dict(default_report)
+        report_cfg.update(self.config.get("report", {}))
+        return report_cfg
+
     def get_log_file(self):
         return self.config.get("log_file", "app.log")
 
+    def get_camera_config(self):
+        """Lấy cấu hình xử lý frame camera (ring buffer, tốc độ hiển thị)"""
+        default_camera = {
+            "buffer_size": 12,         # Tối thiểu, tự tăng để chứa đủ stream_fps x (pre_trigger + post_trigger)
+            "stream_fps": 25,          # FPS danh định của camera (tính kích thước ring buffer)
+            "preview_fps": 15,
+            "decode_mode": "grab",     # "grab" hoặc "read"
+            "multiprocess": False,     # Decode mỗi camera trong process riêng (shared memory)
+            "max_width": 1920,         # Kích thước frame tối đa khi chạy đa process
+            "max_height": 1080,
+            "total_preview_fps": 0,    # Tổng FPS hiển thị chia đều cho mọi camera (0 = không giới hạn)
+            "frame_memory_mb": 0,      # Tổng RAM cho ring buffer mọi camera (0 = không giới hạn)
+            "stats_window": 60,        # Cửa sổ thời gian (giây) của số liệu telemetry
+            "stats_log_interval": 300,  # Ghi telemetry ra log mỗi N giây (0 = tắt)
+            "capture_open_timeout": 3.0,  # Chờ mở main stream khi capture_mode = on_demand
+            "capture_idle_timeout": 30,   # Đóng main stream on_demand sau N giây không chụp
+            "open_timeout": 5.0,          # Thời gian tối đa mở RTSP (giây), tránh treo khi DVR không phản hồi
+            "read_timeout": 5.0,          # Thời gian tối đa chờ 1 frame trước khi coi là mất kết nối
+            "reconnect_base_delay": 1.0,  # Backoff kết nối lại: chờ sau lần lỗi đầu, nhân đôi mỗi lần
+            "reconnect_max_delay": 30.0,  # Thời gian chờ kết nối lại tối đa
+            "reconnect_jitter": 0.3,      # Rút ngắn ngẫu nhiên tới 30% để các camera không kết nối dồn cùng lúc
+            "pre_trigger": 0.3,           # Cửa sổ chọn ảnh: số giây trước lúc quẹt thẻ
+            "post_trigger": 0.3,          # Cửa sổ chọn ảnh: số giây sau lúc quẹt thẻ
+            "selection_budget_ms": 80,    # Thời gian chấm điểm tối đa cho 1 lượt quẹt
+            "analysis_width": 320,        # Độ rộng ảnh thu nhỏ dùng để chấm điểm độ nét
+            "max_pair_skew_ms": 150,      # Lệch tối đa giữa ảnh camera trước và sau
+            "max_frame_age_ms": 1000,     # Lệch tối đa của ảnh so với lúc quẹt thẻ (quá thì báo ảnh cũ)
+            "motion_gate": True,          # Giảm tốc độ preview khi khung hình tĩnh (làn trống)
+            "idle_fps": 2,                # Tốc độ preview khi khung hình tĩnh
+            "idle_after": 10,             # Số giây không có chuyển động trước khi giảm tốc độ
+            "motion_pixel_threshold": 15,  # Chênh lệch độ sáng (0-255) để coi điểm ảnh là thay đổi
+            "motion_area_ratio": 0.005,   # Tỉ lệ điểm ảnh thay đổi để coi là có chuyển động
+            "motion_overrides": {}        # Ghi đè ngưỡng theo camera: {"ra_front": {"motion_area_ratio": 0.01}}
+        }
+        camera_cfg = dict(default_camera)
+        camera_cfg.update(self.config.get("camera", {}))
+        return camera_cfg
+
+    def get_motion_config(self, camera_key):
+        """
+        Ngưỡng phát hiện chuyển động của một camera: giá trị trong "camera",
+        ghi đè theo camera bằng "motion_overrides" (cùng tên khóa)
+        """
+        camera_cfg = self.get_camera_config()
+        overrides = camera_cfg["motion_overrides"].get(camera_key, {})
+        keys = ("motion_gate", "idle_fps", "idle_after", "motion_pixel_threshold", "motion_area_ratio")
+        return {key: overrides.get(key, camera_cfg[key]) for key in keys}
+
+    def get_lanes(self):
+        """
+        Lấy cấu hình các làn xe (topology). Mỗi làn gồm:
+        - key, title, color, hotkey ("Space", "Enter", "F1"...)
+        - direction: "in" (xe vào) hoặc "out" (xe ra)
+        - cameras: [{"key", "label", "role": "front" | "rear" | "view"}]
+        - readers: [{"port", "baud_rate"}]
+        Nếu config không có "lanes" thì dựng 2 làn RA/VÀO mặc định từ "serial" như trước.
+        """
+        lanes = self.config.get("lanes")
+        if not lanes:
+            lanes = self._default_lanes()
+
+        normalized = []
+        for lane in lanes:
+            key = str(lane["key"]).upper()
+            direction = lane.get("direction", "in")
+            cameras = []
+            for camera in lane.get("cameras", []):
+                if isinstance(camera, str):
+                    camera = {"key": camera}
+                cameras.append({
+                    "key": camera["key"],
+                    "label": camera.get("label", camera["key"].upper()),
+                    "role": camera.get("role", "view")
+                })
+            normalized.append({
+                "key": key,
+                "title": lane.get("title", f"LÀN {key}"),
+                "color": lane.get("color", "#4488FF" if direction == "in" else "#FF4444"),
+                "direction": direction,
+                "hotkey": lane.get("hotkey", ""),
+                "cameras": cameras,
+                "readers": [r for r in lane.get("readers", []) if r.get("port")]
+            })
+        return normalized
+
+    def _default_lanes(self):
+        """2 làn RA (trái) / VÀO (phải) như phiên bản cũ"""
+        serial_cfg = self.get_serial_config()
+        baud_rate = serial_cfg.get("baud_rate", 19200)
+        return [
+            {
+                "key": "RA", "title": "LÀN XE RA", "color": "#FF4444",
+                "direction": "out", "hotkey": "Space",
+                "cameras": [
+                    {"key": "ra_front", "label": "CAM TRƯỚC", "role": "front"},
+                    {"key": "ra_rear", "label": "CAM SAU", "role": "rear"}
+                ],
+                "readers": [{"port": serial_cfg.get("port_out"), "baud_rate": baud_rate}]
+            },
+            {
+                "key": "VAO", "title": "LÀN XE VÀO", "color": "#4488FF",
+                "direction": "in", "hotkey": "Enter",
+                "cameras": [
+                    {"key": "vao_front", "label": "CAM TRƯỚC", "role": "front"},
+                    {"key": "vao_rear", "label": "CAM SAU", "role": "rear"}
+                ],
+                "readers": [{"port": serial_cfg.get("port_in"), "baud_rate": baud_rate}]
+            }
+        ]
+
     def get_serial_config(self):
         default_serial = {"port_in": "COM3", "port_out": "COM1", "baud_rate": 19200}
         return self.config.get("serial", default_serial)
@@ -45,4 +236,20 @@ class ConfigManager:
             "password": "123",
             "dbname": "parking_db"
         }
-        return self.config.get("database", default_db)
\ No newline at end of file
+        return self.config.get("database", default_db)
+
+    def get_database_pool_config(self):
+        """Lấy cấu hình pool kết nối PostgreSQL và thời hạn chờ của giao diện"""
+        default_pool = {
+            "min_connections": 1,          # Số kết nối giữ sẵn
+            "max_connections": 6,          # Số kết nối đồng thời tối đa (mỗi hàng đợi DbService + đồng bộ nền)
+            "connect_timeout": 3,          # Thời gian tối đa mở kết nối (giây)
+            "statement_timeout_ms": 3000,  # Thời gian tối đa mỗi câu lệnh khi quẹt thẻ
+            "report_statement_timeout_ms": 120000,  # Thời gian tối đa câu lệnh báo cáo
+            "health_check_interval": 30,   # Kiểm tra kết nối rảnh quá N giây trước khi dùng
+            "request_timeout": 5.0,        # Giao diện chờ kết quả quẹt thẻ tối đa N giây
+            "query_timeout": 30.0          # Giao diện chờ kết quả tra cứu tối đa N giây
+        }
+        pool_cfg = dict(default_pool)
+        pool_cfg.update(self.config.get("database_pool", {}))
+        return pool_cfg
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+Điều phối kết nối RTSP cho mọi camera
+- Mở stream với timeout mở/đọc giới hạn (không block hàng chục giây khi DVR không phản hồi)
+- Kết nối lại theo backoff lũy thừa có jitter (các camera không dồn vào cùng một thời điểm)
+- Khi một camera của DVR kết nối lại được, đánh thức các camera cùng DVR thử lại ngay (song song)
+Module này không import PyQt5 để dùng được trong process decode.
+"""
+import random
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import cv2
+
+
+def compute_backoff(attempt: int, base_delay: float, max_delay: float, jitter: float) -> float:
+    """
+    Thời gian chờ trước lần thử thứ attempt (bắt đầu từ 1): base * 2^(attempt-1),
+    giới hạn max_delay, rồi nhân hệ số ngẫu nhiên trong [1 - jitter, 1] (không vượt quá max_delay)
+    """
+    delay = min(max_delay, base_delay * (2 ** min(max(0, attempt - 1), 16)))
+    return max(0.0, delay * random.uniform(1.0 - jitter, 1.0))
+
+
+def capture_open_params(open_timeout: float, read_timeout: float) -> List[int]:
+    """Tham số cv2.VideoCapture giới hạn thời gian mở và đọc stream (OpenCV >= 4.5.2)"""
+    params = []
+    if hasattr(cv2, "CAP_PROP_OPEN_TIMEOUT_MSEC"):
+        params += [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(open_timeout * 1000)]
+    if hasattr(cv2, "CAP_PROP_READ_TIMEOUT_MSEC"):
+        params += [cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(read_timeout * 1000)]
+    return params
+
+
+class ConnectionSupervisor:
+    """Quản lý backoff kết nối lại của nhiều camera, dùng chung giữa các CameraThread"""
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 30.0, jitter: float = 0.3,
+                 open_timeout: float = 5.0, read_timeout: float = 5.0):
+        """
+        Args:
+            base_delay: Thời gian chờ sau lần lỗi đầu tiên (giây)
+            max_delay: Thời gian chờ tối đa giữa 2 lần thử (giây)
+            jitter: Tỉ lệ ngẫu nhiên hóa thời gian chờ (0.3 = rút ngắn ngẫu nhiên tới 30%)
+            open_timeout: Thời gian tối đa để mở stream (giây)
+            read_timeout: Thời gian tối đa chờ một frame (giây)
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.open_timeout = open_timeout
+        self.read_timeout = read_timeout
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, str] = {}
+        self._attempts: Dict[str, int] = {}
+        self._wake_events: Dict[str, threading.Event] = {}
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Địa chỉ DVR/camera trong URL (các kênh cùng DVR dùng chung host)"""
+        try:
+            return urlparse(url).hostname or url
+        except ValueError:
+            return url
+
+    def register(self, key: str, url: str, wake_event: threading.Event):
+        """Đăng ký camera; wake_event được set khi cần thử lại ngay hoặc khi dừng thread"""
+        with self._lock:
+            self._hosts[key] = self.host_of(url)
+            self._attempts.setdefault(key, 0)
+            self._wake_events[key] = wake_event
+
+    def open_params(self) -> List[int]:
+        return capture_open_params(self.open_timeout, self.read_timeout)
+
+    def settings(self) -> Dict[str, float]:
+        """Tham số backoff/timeout dạng dict thuần (truyền sang process decode)"""
+        return {
+            "base_delay": self.base_delay,
+            "max_delay": self.max_delay,
+            "jitter": self.jitter,
+            "open_timeout": self.open_timeout,
+            "read_timeout": self.read_timeout,
+        }
+
+    @property
+    def stop_timeout(self) -> float:
+        """Thời gian tối đa một thread camera cần để thoát sau khi được yêu cầu dừng"""
+        return self.open_timeout + self.read_timeout + 1.0
+
+    def report_failure(self, key: str) -> float:
+        """Ghi nhận lỗi kết nối, trả về thời gian chờ trước lần thử tiếp theo"""
+        with self._lock:
+            attempt = self._attempts.get(key, 0) + 1
+            self._attempts[key] = attempt
+        return compute_backoff(attempt, self.base_delay, self.max_delay, self.jitter)
+
+    def report_success(self, key: str):
+        """Kết nối thành công: reset backoff và đánh thức các camera cùng DVR đang chờ"""
+        with self._lock:
+            self._attempts[key] = 0
+            host = self._hosts.get(key)
+            waiting = [self._wake_events[k] for k, h in self._hosts.items()
+                       if h == host and k != key and self._attempts.get(k, 0) > 0]
+        for event in waiting:
+            event.set()
+
+    def wait_retry(self, key: str, delay: float) -> bool:
+        """
+        Chờ trước khi kết nối lại, có thể bị ngắt sớm (DVR đã lên lại hoặc thread bị dừng)
+        Trả về True nếu bị đánh thức sớm
+        """
+        event: Optional[threading.Event] = self._wake_events.get(key)
+        if event is None:
+            return False
+        woken = event.wait(delay)
+        event.clear()
+        return woken
@@ -1,150 +1,310 @@
 import psycopg2
 from psycopg2.extras import DictCursor
 from datetime import datetime, date, timedelta
-import pandas as pd
 import os
 
+from card_import import NULL_COLUMNS, STAGING_COLUMNS, CopyStream, read_card_rows
+from card_registry import CardRegistry, CardRegistryRefresher
+from db_migrations import MigrationError, apply_migrations
+from db_pool import ConnectionPool
+from local_spool import LocalSpool, SpoolReplicator
+from report_engine import report_range, write_report
+
 class ParkingDatabase:
     """
     Lớp xử lý logic nghiệp vụ với PostgreSQL:
     - Quản lý thẻ tháng/ngày
     - Tính tiền
-    - Xuất báo cáo Excel
+    - Xuất báo cáo Excel/CSV theo ngày, tuần, tháng, ca (report_engine.py)
+    - Spool cục bộ (tùy chọn): check-in/check-out ghi vào SQLite trước, đồng bộ sang PostgreSQL ở nền
+    - Danh sách thẻ tháng trong bộ nhớ (CardRegistry): phân loại xe không cần truy vấn
     """
-    def __init__(self, db_config):
+    def __init__(self, db_config, spool_config=None, pool_config=None, card_config=None, report_config=None,
+                 logger=None):
         self.config = db_config
-        self.init_db()
-
-    def get_connection(self):
+        self.logger = logger
+        self.report_config = report_config or {}
+        pool_config = pool_config or {}
+        # Kết nối dùng lại giữa các lượt quẹt thẻ (xem db_pool.py)
+        self.pool = ConnectionPool(db_config,
+                                   min_connections=pool_config.get("min_connections", 1),
+                                   max_connections=pool_config.get("max_connections", 4),
+                                   connect_timeout=pool_config.get("connect_timeout", 3),
+                                   statement_timeout_ms=pool_config.get("statement_timeout_ms", 3000),
+                                   health_check_interval=pool_config.get("health_check_interval", 30))
+        self.report_statement_timeout_ms = pool_config.get("report_statement_timeout_ms", 120000)
         try:
-            conn = psycopg2.connect(**self.config)
-            return conn
-        except Exception as e:
-            print(f"Database Connect Error: {e}")
-            return None
+            self.init_db()
+        except MigrationError:
+            self.pool.close()
+            raise
+
+        self.card_registry = CardRegistry()
+        self.spool = None
+        self.replicator = None
+        if spool_config and spool_config.get("enabled"):
+            self.spool = LocalSpool(spool_config["path"], self.calculate_parking_fee, self.card_registry.classify)
+            # Khởi động khi mất kết nối DB: dùng danh sách thẻ đã lưu lần trước
+            saved_cards = self.spool.load_cards()
+            if saved_cards is not None:
+                self.card_registry.replace(saved_cards)
+            self.replicator = SpoolReplicator(self, self.spool,
+                                              batch_size=spool_config["batch_size"],
+                                              sync_interval=spool_config["sync_interval"],
+                                              keep_days=spool_config["keep_days"],
+                                              logger=logger)
+            self.replicator.start()
+
+        card_config = card_config or {}
+        self.card_refresher = CardRegistryRefresher(
+            self, self.card_registry,
+            refresh_interval=card_config.get("refresh_interval", 60),
+            full_refresh_interval=card_config.get("full_refresh_interval", 3600),
+            on_change=self.spool.save_cards if self.spool else None)
+        self.card_refresher.start()
+
+    def get_connection(self, operation="db", statement_timeout_ms=None):
+        """Lấy kết nối từ pool (None nếu không kết nối được), trả lại bằng release_connection"""
+        return self.pool.getconn(operation, statement_timeout_ms)
+
+    def release_connection(self, conn, discard=False):
+        self.pool.putconn(conn, discard)
+
+    def _run(self, operation, body, failure):
+        """
+        Chạy body(conn) trên kết nối từ pool, trả về kết quả của body hoặc failure(thông báo lỗi).
+        Kết nối lấy từ danh sách rảnh (chưa tới lúc kiểm tra) báo OperationalError/InterfaceError
+        (DB khởi động lại, mạng rớt lúc đang rảnh): hủy kết nối và chạy lại 1 lần trên kết nối mới
+        """
+        for attempt in range(2):
+            conn = self.pool.getconn(operation, fresh=attempt > 0)
+            if not conn: return failure("Mất kết nối DB")
+            retry = False
+            try:
+                return body(conn)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                retry = attempt == 0 and self.pool.is_reused(conn)
+                if not retry:
+                    return failure(str(e))
+                if self.logger:
+                    self.logger.warning(f"Kết nối DB rảnh đã hỏng ({operation}): {e}, thử lại trên kết nối mới")
+            except Exception as e:
+                return failure(str(e))
+            finally:
+                self.release_connection(conn, discard=retry)
 
     def init_db(self):
-        """Tạo bảng dữ liệu nếu chưa có"""
-        conn = self.get_connection()
+        """
+        Tạo bảng / nâng cấp schema lên phiên bản mới nhất (xem db_migrations.py).
+        Lỗi nâng cấp -> MigrationError (ứng dụng báo lỗi và không khởi động).
+        Không kết nối được DB thì bỏ qua, nâng cấp ở lần khởi động sau.
+        """
+        # Tạo index trên bảng lớn có thể lâu hơn statement_timeout khi quẹt thẻ
+        conn = self.get_connection("migrate", self.report_statement_timeout_ms)
         if not conn: return
         
-        with conn:
-            with conn.cursor() as cursor:
-                # Bảng Cards: Danh sách thẻ tháng
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS cards (
-                        card_id VARCHAR(50) PRIMARY KEY,
-                        plate_number VARCHAR(20),
-                        customer_name VARCHAR(100),
-                        is_active BOOLEAN DEFAULT TRUE,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-                
-                # Bảng Sessions: Lịch sử ra vào
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS sessions (
-                        id SERIAL PRIMARY KEY,
-                        card_id VARCHAR(50),
-                        vehicle_type VARCHAR(20) DEFAULT 'DAY', 
-                        checkin_time TIMESTAMP,
-                        checkin_img_front TEXT,
-                        checkin_img_rear TEXT,
-                        checkout_time TIMESTAMP,
-                        checkout_img_front TEXT,
-                        checkout_img_rear TEXT,
-                        price INTEGER DEFAULT 0,
-                        status INTEGER DEFAULT 1
-                    );
-                """)
-        conn.close()
-
-    def import_from_csv(self, csv_path):
+        try:
+            applied = apply_migrations(conn)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Lỗi nâng cấp cơ sở dữ liệu: {e}")
+            raise MigrationError(f"Không nâng cấp được cơ sở dữ liệu: {e}") from e
+        finally:
+            self.release_connection(conn)
+        if applied and self.logger:
+            self.logger.info(f"Cơ sở dữ liệu: đã nâng cấp lên phiên bản {applied[-1]}")
+
+    def import_from_csv(self, csv_path, deactivate_missing=False):
         """
-        Nhập danh sách thẻ tháng từ file CSV (Chỉ cần cột đầu tiên là mã thẻ).
+        Nhập danh sách thẻ tháng từ file CSV (thethang.csv hoặc file chỉ có cột mã thẻ, xem card_import.py):
+        COPY vào bảng tạm rồi gộp vào cards bằng 1 câu lệnh, trong 1 transaction.
+        - Thẻ không thay đổi thì không cập nhật (updated_at giữ nguyên, danh sách trong bộ nhớ không phải tải lại)
+        - deactivate_missing=True: khóa các thẻ đang hoạt động không có trong file (file là danh sách đầy đủ)
+        Trả về: (Success, Message có số thẻ thêm mới / cập nhật / khóa)
         """
-        conn = self.get_connection()
+        conn = self.get_connection("import_csv", self.report_statement_timeout_ms)
         if not conn: return False, "Lỗi kết nối DB"
         
         try:
-            # Đọc CSV không cần header, coi tất cả là string
-            df = pd.read_csv(csv_path, header=None, dtype=str)
-            
-            count = 0
+            stream = CopyStream(read_card_rows(csv_path))
             with conn:
                 with conn.cursor() as cursor:
-                    for index, row in df.iterrows():
-                        # Lấy mã thẻ ở cột đầu tiên
-                        if pd.isna(row[0]): continue
-                        c_id = str(row[0]).strip()
-                        if not c_id: continue
-
-                        # Các thông tin khác để trống (vì file csv chỉ có mã)
-                        plate = ""
-                        name = ""
-                        
-                        # Upsert: Nếu thẻ đã có thì cập nhật lại là Active
-                        cursor.execute("""
-                            INSERT INTO cards (card_id, plate_number, customer_name, is_active)
-                            VALUES (%s, %s, %s, TRUE)
-                            ON CONFLICT (card_id) 
-                            DO UPDATE SET is_active = TRUE,
-                                          updated_at = CURRENT_TIMESTAMP;
-                        """, (c_id, plate, name))
-                        count += 1
+                    cursor.execute("""
+                        CREATE TEMP TABLE cards_import (
+                            line_no INTEGER,
+                            card_id VARCHAR(50),
+                            has_details BOOLEAN,
+                            plate_number VARCHAR(20),
+                            customer_name VARCHAR(100),
+                            is_active BOOLEAN,
+                            valid_from DATE,
+                            valid_to DATE
+                        ) ON COMMIT DROP
+                    """)
+                    cursor.copy_expert(f"COPY cards_import ({', '.join(STAGING_COLUMNS)}) FROM STDIN "
+                                       f"WITH (FORMAT csv, FORCE_NULL ({', '.join(NULL_COLUMNS)}))",
+                                       stream)
+                    cursor.execute("ANALYZE cards_import")
+
+                    # File chỉ có mã thẻ (has_details = FALSE): giữ biển số / chủ thẻ / thời hạn đang có
+                    cursor.execute("""
+                        WITH src AS (
+                            SELECT DISTINCT ON (card_id) *
+                            FROM cards_import
+                            ORDER BY card_id, line_no DESC
+                        ), merged AS (
+                            SELECT c.card_id,
+                                   CASE WHEN s.has_details THEN s.plate_number ELSE c.plate_number END AS plate_number,
+                                   CASE WHEN s.has_details THEN s.customer_name ELSE c.customer_name END AS customer_name,
+                                   s.is_active,
+                                   CASE WHEN s.has_details THEN s.valid_from ELSE c.valid_from END AS valid_from,
+                                   CASE WHEN s.has_details THEN s.valid_to ELSE c.valid_to END AS valid_to
+                            FROM cards c JOIN src s ON s.card_id = c.card_id
+                            WHERE (c.plate_number, c.customer_name, c.is_active, c.valid_from, c.valid_to)
+                                  IS DISTINCT FROM
+                                  (CASE WHEN s.has_details THEN s.plate_number ELSE c.plate_number END,
+                                   CASE WHEN s.has_details THEN s.customer_name ELSE c.customer_name END,
+                                   s.is_active,
+                                   CASE WHEN s.has_details THEN s.valid_from ELSE c.valid_from END,
+                                   CASE WHEN s.has_details THEN s.valid_to ELSE c.valid_to END)
+                        ), updated AS (
+                            UPDATE cards c
+                            SET plate_number = m.plate_number,
+                                customer_name = m.customer_name,
+                                is_active = m.is_active,
+                                valid_from = m.valid_from,
+                                valid_to = m.valid_to
+                            FROM merged m
+                            WHERE c.card_id = m.card_id
+                            RETURNING 1
+                        ), inserted AS (
+                            INSERT INTO cards (card_id, plate_number, customer_name, is_active, valid_from, valid_to)
+                            SELECT card_id, plate_number, customer_name, is_active, valid_from, valid_to
+                            FROM src
+                            WHERE NOT EXISTS (SELECT 1 FROM cards c WHERE c.card_id = src.card_id)
+                            ON CONFLICT (card_id) DO NOTHING
+                            RETURNING 1
+                        ), deactivated AS (
+                            UPDATE cards c SET is_active = FALSE
+                            WHERE %s AND c.is_active
+                              AND NOT EXISTS (SELECT 1 FROM src WHERE src.card_id = c.card_id)
+                            RETURNING 1
+                        )
+                        SELECT (SELECT COUNT(*) FROM inserted),
+                               (SELECT COUNT(*) FROM updated),
+                               (SELECT COUNT(*) FROM deactivated)
+                    """, (deactivate_missing,))
+                    inserted, updated, deactivated = cursor.fetchone()
             
-            return True, f"Đã cập nhật {count} thẻ tháng vào hệ thống."
+            self.card_refresher.refresh_soon(full=deactivated > 0)
+            return True, (f"Đã đọc {stream.count} dòng: thêm mới {inserted}, cập nhật {updated}, "
+                          f"khóa {deactivated} thẻ tháng.")
             
         except Exception as e:
             return False, f"Lỗi nhập file: {str(e)}"
         finally:
-            conn.close()
+            self.release_connection(conn)
 
     def check_in(self, card_id, img_front, img_rear):
         """
-        Xử lý xe vào:
-        - Kiểm tra xem thẻ có đang ở trong bãi không (Anti-passback)
-        - Kiểm tra xem là thẻ tháng hay thẻ ngày
+        Xử lý xe vào (1 câu lệnh, 1 lượt gửi/nhận với DB):
+        - Kiểm tra xem thẻ có đang ở trong bãi không (Anti-passback): ràng buộc sessions_open_card_key,
+          2 lượt quẹt đồng thời chỉ 1 lượt tạo được phiên
+        - Kiểm tra xem là thẻ tháng hay thẻ ngày (danh sách trong bộ nhớ, truy vấn con khi chưa nạp được)
         """
-        conn = self.get_connection()
-        if not conn: return False, "Mất kết nối DB"
-        
-        try:
+        if self.spool:
+            result = self.spool.check_in(card_id, img_front, img_rear)
+            self.replicator.wake()  # Kể cả khi chưa nạp phiên mở: thử nạp ngay
+            return result
+
+        def run(conn):
+            vehicle_type = None
+            if self.card_registry.loaded:
+                vehicle_type = 'MONTH' if self.card_registry.is_monthly(card_id) else 'DAY'
+
             with conn:
                 with conn.cursor() as cursor:
-                    # 1. Anti-Passback
-                    cursor.execute("SELECT id FROM sessions WHERE card_id = %s AND status = 1", (card_id,))
-                    if cursor.fetchone():
-                        return False, f"Thẻ {card_id} chưa quẹt ra!"
-
-                    # 2. Kiểm tra Thẻ Tháng
-                    cursor.execute("SELECT card_id FROM cards WHERE card_id = %s AND is_active = TRUE", (card_id,))
-                    row = cursor.fetchone()
-                    
-                    vehicle_type = 'DAY'
-                    msg_extra = "VÃNG LAI"
-                    
-                    if row:
-                        vehicle_type = 'MONTH'
-                        msg_extra = "XE THÁNG"
-
-                    # 3. Lưu vào DB
                     cursor.execute("""
                         INSERT INTO sessions (card_id, vehicle_type, checkin_time, checkin_img_front, checkin_img_rear, status)
-                        VALUES (%s, %s, CURRENT_TIMESTAMP, %s, %s, 1)
-                    """, (card_id, vehicle_type, img_front, img_rear))
-            
+                        SELECT %(card_id)s,
+                               COALESCE(%(vehicle_type)s, CASE WHEN EXISTS (
+                                   SELECT 1 FROM cards
+                                   WHERE card_id = %(card_id)s AND is_active = TRUE
+                                     AND (valid_from IS NULL OR valid_from <= CURRENT_DATE)
+                                     AND (valid_to IS NULL OR valid_to >= CURRENT_DATE)
+                               ) THEN 'MONTH' ELSE 'DAY' END),
+                               LOCALTIMESTAMP, %(img_front)s, %(img_rear)s, 1
+                        ON CONFLICT (card_id) WHERE status = 1 DO NOTHING
+                        RETURNING vehicle_type
+                    """, {"card_id": card_id, "vehicle_type": vehicle_type,
+                          "img_front": img_front, "img_rear": img_rear})
+                    row = cursor.fetchone()
+
+            if not row:
+                return False, f"Thẻ {card_id} chưa quẹt ra!"
+            msg_extra = "XE THÁNG" if row[0] == 'MONTH' else "VÃNG LAI"
             return True, f"Mời vào ({msg_extra})"
-        except Exception as e:
-            return False, str(e)
-        finally:
-            conn.close()
+
+        return self._run("check_in", run, lambda msg: (False, msg))
+
+    def mark_image_error(self, image_path, error):
+        """
+        Đánh dấu phiên có ảnh ghi lỗi (ảnh check-in hoặc check-out)
+        Trả về: (Success, Message)
+        """
+        if self.spool:
+            # Đi theo thứ tự nhật ký: phiên chứa ảnh luôn được đồng bộ trước
+            result = self.spool.mark_image_error(image_path, error)
+            self.replicator.wake()
+            return result
+
+        def run(conn):
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE sessions SET img_error = %s
+                        WHERE checkin_img_front = %s OR checkin_img_rear = %s
+                           OR checkout_img_front = %s OR checkout_img_rear = %s
+                    """, (f"{image_path}: {error}", image_path, image_path, image_path, image_path))
+                    if cursor.rowcount == 0:
+                        return False, f"Không tìm thấy phiên có ảnh {image_path}"
+            return True, "Đã đánh dấu lỗi ảnh"
+
+        return self._run("mark_image_error", run, lambda msg: (False, msg))
+
+    def search_sessions(self, card_id=None, day=None, limit=200):
+        """
+        Tra cứu phiên gửi xe (mới nhất trước) theo mã thẻ và/hoặc ngày vào
+        Trả về: (Success, Danh sách dict phiên hoặc Message lỗi)
+        """
+        def run(conn):
+            conditions = []
+            params = []
+            if card_id:
+                conditions.append("card_id = %s")
+                params.append(card_id)
+            if day:
+                conditions.append("checkin_time >= %s AND checkin_time < %s")
+                params.extend([day, day + timedelta(days=1)])
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            with conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute(f"""
+                    SELECT id, card_id, vehicle_type, checkin_time, checkout_time,
+                           checkin_img_front, checkin_img_rear, checkout_img_front, checkout_img_rear,
+                           price, status, img_error
+                    FROM sessions {where}
+                    ORDER BY checkin_time DESC LIMIT %s
+                """, params + [limit])
+                return True, [dict(row) for row in cursor.fetchall()]
+
+        return self._run("search_sessions", run, lambda msg: (False, msg))
 
     def calculate_parking_fee(self, checkin_time, checkout_time, vehicle_type):
         """
         Logic tính tiền:
         - Tháng: 0đ
         - Ngày: 3000đ (trong ngày), 5000đ/đêm (qua đêm)
+        Sửa logic ở đây thì thêm phiên bản migration cập nhật hàm SQL parking_fee tương ứng
         """
         if vehicle_type == 'MONTH':
             return 0
@@ -162,142 +322,201 @@ class ParkingDatabase:
 
     def check_out(self, card_id, img_front, img_rear):
         """
-        Xử lý xe ra:
-        - Tính tiền
-        - Cập nhật giờ ra và ảnh ra
+        Xử lý xe ra (1 câu lệnh, 1 lượt gửi/nhận với DB):
+        - Tính tiền (hàm parking_fee trên server)
+        - Cập nhật giờ ra và ảnh ra; 2 lượt quẹt đồng thời chỉ 1 lượt đóng được phiên
         """
-        conn = self.get_connection()
-        if not conn: return False, "Mất kết nối DB", None
-        
-        try:
-            info = {}
+        if self.spool:
+            result = self.spool.check_out(card_id, img_front, img_rear)
+            self.replicator.wake()
+            return result
+
+        def run(conn):
             with conn:
                 with conn.cursor(cursor_factory=DictCursor) as cursor:
-                    # Tìm lượt xe đang gửi
-                    cursor.execute("""
-                        SELECT * FROM sessions 
-                        WHERE card_id = %s AND status = 1 
-                        ORDER BY checkin_time DESC LIMIT 1
-                    """, (card_id,))
-                    session = cursor.fetchone()
-                    
-                    if not session:
-                        return False, f"Thẻ {card_id} chưa check-in!", None
-                    
-                    sid = session['id']
-                    checkin_time = session['checkin_time']
-                    v_type = session['vehicle_type']
-                    now = datetime.now()
-                    
-                    # Tính tiền
-                    fee = self.calculate_parking_fee(checkin_time, now, v_type)
-                    
-                    # Cập nhật DB (Kết thúc phiên gửi xe)
+                    # Mỗi thẻ tối đa 1 phiên đang gửi (sessions_open_card_key). Lượt quẹt đến sau chờ khóa dòng,
+                    # thấy status đã = 0 nên không cập nhật gì
                     cursor.execute("""
-                        UPDATE sessions 
-                        SET checkout_time = %s,
+                        UPDATE sessions
+                        SET checkout_time = LOCALTIMESTAMP,
                             checkout_img_front = %s,
                             checkout_img_rear = %s,
-                            price = %s,
+                            price = parking_fee(checkin_time, LOCALTIMESTAMP, vehicle_type),
                             status = 0
-                        WHERE id = %s
-                    """, (now, img_front, img_rear, fee, sid))
-                    
-                    info = {
-                        "checkin_time": checkin_time.strftime("%d/%m %H:%M"),
-                        "price": fee,
-                        "type": v_type
-                    }
-            
+                        WHERE card_id = %s AND status = 1
+                        RETURNING checkin_time, vehicle_type, price
+                    """, (img_front, img_rear, card_id))
+                    session = cursor.fetchone()
+
+            if not session:
+                return False, f"Thẻ {card_id} chưa check-in!", None
+
+            info = {
+                "checkin_time": session['checkin_time'].strftime("%d/%m %H:%M"),
+                "price": session['price'],
+                "type": session['vehicle_type']
+            }
             msg = f"Phí: {info['price']}"
             return True, msg, info
-            
+
+        return self._run("check_out", run, lambda msg: (False, msg, None))
+
+    def fetch_open_sessions(self):
+        """
+        Các phiên đang gửi (để nạp vào spool lần đầu), gán mã sự kiện cho phiên tạo trước khi có spool
+        Trả về: (Success, Danh sách dict hoặc Message lỗi)
+        """
+        def run(conn):
+            with conn:
+                with conn.cursor(cursor_factory=DictCursor) as cursor:
+                    cursor.execute("""
+                        UPDATE sessions SET checkin_event_id = 'pg-' || id
+                        WHERE status = 1 AND checkin_event_id IS NULL
+                    """)
+                    cursor.execute("""
+                        SELECT card_id, vehicle_type, checkin_time, checkin_event_id
+                        FROM sessions WHERE status = 1
+                        ORDER BY checkin_time
+                    """)
+                    return True, [dict(row) for row in cursor.fetchall()]
+
+        return self._run("fetch_open_sessions", run, lambda msg: (False, msg))
+
+    def fetch_cards(self, since=None):
+        """
+        Danh sách thẻ tháng (tất cả, hoặc chỉ các thẻ có updated_at sau since)
+        Trả về: (Success, Danh sách dict hoặc Message lỗi)
+        """
+        def run(conn):
+            with conn.cursor(cursor_factory=DictCursor) as cursor:
+                query = """
+                    SELECT card_id, is_active, valid_from, valid_to, plate_number, customer_name, updated_at
+                    FROM cards
+                """
+                if since is None:
+                    cursor.execute(query)
+                else:
+                    cursor.execute(query + " WHERE updated_at > %s", (since,))
+                return True, [dict(row) for row in cursor.fetchall()]
+
+        return self._run("fetch_cards", run, lambda msg: (False, msg))
+
+    def replay_events(self, events):
+        """
+        Ghi lô sự kiện từ spool vào PostgreSQL trong 1 transaction (idempotent theo mã sự kiện).
+        events: [(id, kind, payload)] với kind = "in" | "out" | "img_error"
+        Trả về: (Success, Message, Lỗi dữ liệu?) - False ở cột cuối nghĩa là mất kết nối, nên thử lại
+        """
+        conn = self.get_connection("replay_events")
+        if not conn: return False, "Mất kết nối DB", False
+
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    for _, kind, payload in events:
+                        if kind == "in":
+                            # vehicle_type NULL: vào khi spool chưa có danh sách thẻ, phân loại theo bảng cards
+                            cursor.execute("""
+                                INSERT INTO sessions (card_id, vehicle_type, checkin_time, checkin_img_front,
+                                                      checkin_img_rear, status, checkin_event_id)
+                                SELECT %(card_id)s,
+                                       COALESCE(%(vehicle_type)s, CASE WHEN EXISTS (
+                                           SELECT 1 FROM cards
+                                           WHERE card_id = %(card_id)s AND is_active = TRUE
+                                             AND (valid_from IS NULL OR valid_from <= %(checkin_time)s::date)
+                                             AND (valid_to IS NULL OR valid_to >= %(checkin_time)s::date)
+                                       ) THEN 'MONTH' ELSE 'DAY' END),
+                                       %(checkin_time)s, %(img_front)s, %(img_rear)s, 1, %(event_id)s
+                                ON CONFLICT (checkin_event_id) DO NOTHING
+                            """, {"card_id": payload["card_id"], "vehicle_type": payload["vehicle_type"],
+                                  "checkin_time": datetime.fromisoformat(payload["checkin_time"]),
+                                  "img_front": payload["img_front"], "img_rear": payload["img_rear"],
+                                  "event_id": payload["event_id"]})
+                        elif kind == "out":
+                            cursor.execute("""
+                                UPDATE sessions
+                                SET checkout_time = %s,
+                                    checkout_img_front = %s,
+                                    checkout_img_rear = %s,
+                                    price = %s,
+                                    vehicle_type = COALESCE(%s, vehicle_type),
+                                    status = 0,
+                                    checkout_event_id = %s
+                                WHERE checkin_event_id = %s AND checkout_event_id IS NULL
+                            """, (datetime.fromisoformat(payload["checkout_time"]),
+                                  payload["img_front"], payload["img_rear"], payload["price"],
+                                  payload.get("vehicle_type"), payload["event_id"], payload["checkin_event_id"]))
+                            if cursor.rowcount == 0:
+                                # Phát lại lô đã ghi (mất phản hồi commit) thì bỏ qua, còn lại là thiếu phiên vào
+                                # (sự kiện "in" bị loại vì lỗi dữ liệu): báo lỗi để không mất phí gửi xe
+                                cursor.execute("SELECT 1 FROM sessions WHERE checkout_event_id = %s",
+                                               (payload["event_id"],))
+                                if not cursor.fetchone():
+                                    raise ValueError(f"Không có phiên vào {payload['checkin_event_id']} "
+                                                     f"cho lượt ra thẻ {payload.get('card_id', '')}, "
+                                                     f"phí {payload['price']}")
+                        elif kind == "img_error":
+                            image_path = payload["image_path"]
+                            cursor.execute("""
+                                UPDATE sessions SET img_error = %s
+                                WHERE checkin_img_front = %s OR checkin_img_rear = %s
+                                   OR checkout_img_front = %s OR checkout_img_rear = %s
+                            """, (f"{image_path}: {payload['error']}", image_path, image_path, image_path, image_path))
+            return True, f"Đã đồng bộ {len(events)} sự kiện", False
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            return False, str(e), False
         except Exception as e:
-            return False, str(e), None
+            return False, str(e), True
         finally:
-            conn.close()
+            self.release_connection(conn)
 
-    def export_daily_report(self):
+    def close(self):
+        """Dừng đồng bộ spool (sự kiện còn lại được đẩy tiếp ở lần chạy sau) và đóng các kết nối"""
+        self.card_refresher.stop()
+        if self.replicator:
+            self.replicator.stop()
+            self.spool.close()
+        self.pool.close()
+
+    def report_folder(self):
+        """Thư mục lưu báo cáo (mặc định D:\BaoCao hoặc thư mục hiện tại/BaoCao)"""
+        save_folder = self.report_config.get("directory") or r"D:\BaoCao"
+        if not os.path.exists(os.path.splitdrive(save_folder)[0] + os.sep):
+            save_folder = os.path.join(os.getcwd(), "BaoCao")
+        if not os.path.exists(save_folder):
+            os.makedirs(save_folder)
+        return save_folder
+
+    def export_report(self, kind, day, shift=None, fmt=None):
         """
-        Xuất báo cáo 2 Sheet (Doanh Thu & Lưu Lượng)
-        Lưu tại D:\BaoCao hoặc thư mục hiện tại/BaoCao
+        Xuất báo cáo 2 phần (Doanh Thu & Lưu Lượng) cho ngày / tuần / tháng / ca chứa ngày day
+        Trả về: (Success, Message)
         """
-        conn = self.get_connection()
+        conn = self.get_connection("report", self.report_statement_timeout_ms)
         if not conn: return False, "Mất kết nối DB"
 
         try:
-            # Xác định ngày báo cáo (Hôm qua nếu chạy lúc 0h sáng)
-            now = datetime.now()
-            if now.hour == 0 and now.minute <= 30: 
-                report_date = now.date() - timedelta(days=1)
-            else:
-                report_date = now.date()
-            
-            date_str = report_date.strftime("%d-%m-%Y")
-            
-            # Tạo đường dẫn lưu file
-            save_folder = r"D:\BaoCao"
-            if not os.path.exists("D:\\"):
-                save_folder = os.path.join(os.getcwd(), "BaoCao")
-            
-            if not os.path.exists(save_folder):
-                os.makedirs(save_folder)
-
-            file_path = os.path.join(save_folder, f"{date_str}.xlsx")
-
-            # --- SHEET 1: DOANH THU (Xe Ra) ---
-            query_out = """
-                SELECT 
-                    card_id as "Mã Thẻ",
-                    CASE WHEN vehicle_type = 'MONTH' THEN 'Xe Tháng' ELSE 'Vãng Lai' END as "Loại Xe",
-                    to_char(checkin_time, 'DD/MM/YYYY HH24:MI:SS') as "Giờ Vào",
-                    to_char(checkout_time, 'DD/MM/YYYY HH24:MI:SS') as "Giờ Ra",
-                    price as "Số Tiền"
-                FROM sessions
-                WHERE status = 0 
-                AND DATE(checkout_time) = %s
-                ORDER BY checkout_time ASC
-            """
-            df_out = pd.read_sql_query(query_out, conn, params=(report_date,))
-            
-            # Tính tổng tiền
-            if not df_out.empty:
-                total_money = df_out["Số Tiền"].sum()
-                row_total = pd.DataFrame([{
-                    "Mã Thẻ": "TỔNG CỘNG", 
-                    "Loại Xe": "", "Giờ Vào": "", "Giờ Ra": "", 
-                    "Số Tiền": total_money
-                }])
-                df_out = pd.concat([df_out, row_total], ignore_index=True)
-
-            # --- SHEET 2: LƯU LƯỢNG (Xe Vào) ---
-            query_in = """
-                SELECT 
-                    card_id as "Mã Thẻ",
-                    CASE WHEN vehicle_type = 'MONTH' THEN 'Xe Tháng' ELSE 'Vãng Lai' END as "Loại Xe",
-                    to_char(checkin_time, 'DD/MM/YYYY HH24:MI:SS') as "Giờ Vào",
-                    CASE WHEN status = 1 THEN 'Đang gửi' ELSE 'Đã ra' END as "Trạng Thái"
-                FROM sessions
-                WHERE DATE(checkin_time) = %s
-                ORDER BY checkin_time ASC
-            """
-            df_in = pd.read_sql_query(query_in, conn, params=(report_date,))
-
-            # Ghi ra Excel
-            with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-                if not df_out.empty:
-                    df_out.to_excel(writer, sheet_name='Xe Ra (Doanh Thu)', index=False)
-                else:
-                    pd.DataFrame({"Note": ["Không có dữ liệu"]}).to_excel(writer, sheet_name='Xe Ra (Doanh Thu)')
-                
-                if not df_in.empty:
-                    df_in.to_excel(writer, sheet_name='Xe Vào (Lưu Lượng)', index=False)
-                else:
-                    pd.DataFrame({"Note": ["Không có dữ liệu"]}).to_excel(writer, sheet_name='Xe Vào (Lưu Lượng)')
-            
-            return True, f"Đã xuất báo cáo: {file_path}"
-
+            fmt = fmt or self.report_config.get("format", "xlsx")
+            start, end, label = report_range(kind, day, shift)
+            file_path = os.path.join(self.report_folder(), f"{label}.{'csv' if fmt == 'csv' else 'xlsx'}")
+            result = write_report(conn, start, end, file_path, fmt,
+                                  fetch_size=self.report_config.get("fetch_size", 2000))
+            return True, (f"Đã xuất báo cáo: {', '.join(result['files'])} "
+                          f"({result['out']} xe ra, {result['in']} xe vào, doanh thu {result['revenue']:,})")
         except Exception as e:
-            return False, f"Lỗi xuất Excel: {str(e)}"
+            return False, f"Lỗi xuất báo cáo: {str(e)}"
         finally:
-            if conn: conn.close()
\ No newline at end of file
+            self.release_connection(conn)
+
+    def export_daily_report(self):
+        """
+        Xuất báo cáo ngày (tự động lúc 00:00)
+        Lưu tại D:\BaoCao hoặc thư mục hiện tại/BaoCao
+        """
+        # Xác định ngày báo cáo (Hôm qua nếu chạy lúc 0h sáng)
+        now = datetime.now()
+        if now.hour == 0 and now.minute <= 30: 
+            report_date = now.date() - timedelta(days=1)
+        else:
+            report_date = now.date()
+        return self.export_report("day", report_date)
@@ -0,0 +1,146 @@
+"""
+Nâng cấp schema PostgreSQL theo phiên bản (chạy khi khởi động, DB cũ được nâng cấp tại chỗ)
+- Bảng schema_migrations ghi các phiên bản đã áp dụng
+- Mỗi phiên bản chạy trong 1 transaction, khóa advisory tránh 2 máy nâng cấp cùng lúc
+- Chỉ thêm phiên bản mới vào cuối MIGRATIONS, không sửa phiên bản đã phát hành
+"""
+from typing import List, Tuple
+
+MIGRATION_LOCK_ID = 7410521  # Khóa advisory riêng của ứng dụng bãi xe
+
+
+class MigrationError(RuntimeError):
+    """Không nâng cấp được schema: ứng dụng không được chạy tiếp với schema cũ"""
+
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "Bảng thẻ tháng và phiên gửi xe", [
+        """
+        CREATE TABLE IF NOT EXISTS cards (
+            card_id VARCHAR(50) PRIMARY KEY,
+            plate_number VARCHAR(20),
+            customer_name VARCHAR(100),
+            is_active BOOLEAN DEFAULT TRUE,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id SERIAL PRIMARY KEY,
+            card_id VARCHAR(50),
+            vehicle_type VARCHAR(20) DEFAULT 'DAY',
+            checkin_time TIMESTAMP,
+            checkin_img_front TEXT,
+            checkin_img_rear TEXT,
+            checkout_time TIMESTAMP,
+            checkout_img_front TEXT,
+            checkout_img_rear TEXT,
+            price INTEGER DEFAULT 0,
+            status INTEGER DEFAULT 1
+        )
+        """,
+    ]),
+    (2, "Lỗi ghi file ảnh (báo bất đồng bộ từ thread ghi ảnh)", [
+        "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS img_error TEXT",
+    ]),
+    (3, "Mã sự kiện từ spool cục bộ (phát lại không tạo phiên trùng)", [
+        "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS checkin_event_id TEXT",
+        "ALTER TABLE sessions ADD COLUMN IF NOT EXISTS checkout_event_id TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS sessions_checkin_event_id_key ON sessions (checkin_event_id)",
+    ]),
+    (4, "Mỗi thẻ tối đa 1 phiên đang gửi + index cho chống quẹt 2 lần và báo cáo", [
+        # Phiên mở trùng do 2 lượt quẹt đồng thời trước khi có ràng buộc:
+        # giữ phiên mới nhất (check_out vẫn chọn phiên này), đóng các phiên cũ với status = 2
+        """
+        UPDATE sessions s SET status = 2
+        WHERE s.status = 1 AND EXISTS (
+            SELECT 1 FROM sessions newer
+            WHERE newer.card_id = s.card_id AND newer.status = 1
+              AND (newer.checkin_time, newer.id) > (s.checkin_time, s.id)
+        )
+        """,
+        # Index riêng phần phiên đang mở: vừa là ràng buộc vừa phục vụ tra cứu khi quẹt thẻ
+        "CREATE UNIQUE INDEX IF NOT EXISTS sessions_open_card_key ON sessions (card_id) WHERE status = 1",
+        "CREATE INDEX IF NOT EXISTS sessions_checkin_time_idx ON sessions (checkin_time)",
+        "CREATE INDEX IF NOT EXISTS sessions_checkout_time_idx ON sessions (checkout_time) WHERE status = 0",
+        "CREATE INDEX IF NOT EXISTS sessions_card_checkin_idx ON sessions (card_id, checkin_time DESC)",
+    ]),
+    (5, "Thời hạn thẻ tháng + thông báo thay đổi cho danh sách thẻ trong bộ nhớ", [
+        "ALTER TABLE cards ADD COLUMN IF NOT EXISTS valid_from DATE",
+        "ALTER TABLE cards ADD COLUMN IF NOT EXISTS valid_to DATE",
+        "CREATE INDEX IF NOT EXISTS cards_updated_at_idx ON cards (updated_at)",
+        # updated_at luôn đổi khi sửa thẻ (kể cả sửa tay bằng SQL) -> tải tăng dần không bỏ sót
+        """
+        CREATE OR REPLACE FUNCTION cards_touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := CURRENT_TIMESTAMP;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS cards_touch_updated_at ON cards",
+        """
+        CREATE TRIGGER cards_touch_updated_at BEFORE INSERT OR UPDATE ON cards
+        FOR EACH ROW EXECUTE PROCEDURE cards_touch_updated_at()
+        """,
+        # 1 thông báo mỗi câu lệnh (nhập CSV hàng nghìn dòng chỉ gửi 1 lần), xóa thẻ thì yêu cầu nạp lại toàn bộ
+        """
+        CREATE OR REPLACE FUNCTION cards_notify_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('cards_changed', CASE WHEN TG_OP IN ('DELETE', 'TRUNCATE') THEN 'full' ELSE '' END);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS cards_notify_changed ON cards",
+        """
+        CREATE TRIGGER cards_notify_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON cards
+        FOR EACH STATEMENT EXECUTE PROCEDURE cards_notify_changed()
+        """,
+    ]),
+    (6, "Hàm tính phí phía server (check-out 1 câu lệnh)", [
+        # Phải giống ParkingDatabase.calculate_parking_fee (spool cục bộ vẫn tính phí bằng Python)
+        """
+        CREATE OR REPLACE FUNCTION parking_fee(p_checkin TIMESTAMP, p_checkout TIMESTAMP, p_vehicle_type VARCHAR)
+        RETURNS INTEGER AS $$
+            SELECT CASE
+                WHEN p_vehicle_type = 'MONTH' THEN 0
+                WHEN p_checkout::date - p_checkin::date = 0 THEN 3000
+                ELSE 5000 * (p_checkout::date - p_checkin::date)
+            END
+        $$ LANGUAGE sql IMMUTABLE
+        """,
+    ]),
+]
+
+
+def apply_migrations(conn) -> List[int]:
+    """
+    Áp dụng các phiên bản chưa có trên DB, trả về danh sách phiên bản vừa áp dụng.
+    Lỗi ở phiên bản nào thì dừng tại đó (các phiên bản trước vẫn giữ) và ném exception.
+    """
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+                cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                if cursor.fetchone():
+                    continue
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                               (version, description))
+        print(f"Database Migration: đã áp dụng phiên bản {version} - {description}")
+        applied.append(version)
+    return applied
+
@@ -0,0 +1,215 @@
+"""
+Pool kết nối PostgreSQL dùng lại giữa các lượt quẹt thẻ (không bắt tay TCP + xác thực mỗi lần)
+- Kết nối nhàn rỗi lâu được kiểm tra (SELECT 1) trước khi dùng, hỏng thì mở lại;
+  kết nối rảnh chưa tới lúc kiểm tra mà lỗi khi dùng thì người gọi thử lại trên kết nối mới (fresh=True)
+- statement_timeout mặc định cho mọi câu lệnh, có thể nới cho từng thao tác (báo cáo)
+- Thống kê độ trễ theo thao tác (check_in, check_out, report...)
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+from camera_stats import RollingHistogram
+
+
+class ConnectionPool:
+    """Pool kết nối psycopg2 an toàn khi dùng từ nhiều thread"""
+
+    IDLE_CLOSE_AFTER = 300.0  # Đóng kết nối vượt min_connections sau N giây không dùng
+
+    def __init__(self, db_config: dict, min_connections: int = 1, max_connections: int = 4,
+                 connect_timeout: int = 3, statement_timeout_ms: int = 3000,
+                 health_check_interval: float = 30.0, stats_window: float = 300.0):
+        """
+        Args:
+            db_config: Tham số psycopg2.connect (host, port, user, password, dbname)
+            min_connections: Số kết nối giữ sẵn sau khi dùng (LIFO: luôn lấy kết nối vừa dùng)
+            max_connections: Số kết nối đồng thời tối đa
+            connect_timeout: Thời gian tối đa mở kết nối / chờ kết nối rảnh (giây)
+            statement_timeout_ms: Thời gian tối đa mỗi câu lệnh SQL (0 = không giới hạn)
+            health_check_interval: Kiểm tra kết nối nhàn rỗi quá N giây trước khi dùng
+        """
+        self.params = dict(db_config)
+        self.params.setdefault("connect_timeout", connect_timeout)
+        # Phát hiện kết nối chết (mất mạng) thay vì treo chờ TCP
+        self.params.setdefault("keepalives", 1)
+        self.params.setdefault("keepalives_idle", 30)
+        self.params.setdefault("keepalives_interval", 10)
+        self.params.setdefault("keepalives_count", 3)
+        if statement_timeout_ms:
+            options = self.params.get("options", "")
+            self.params["options"] = f"{options} -c statement_timeout={int(statement_timeout_ms)}".strip()
+        self.min_connections = min_connections
+        self.connect_timeout = connect_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        self.health_check_interval = health_check_interval
+        self.stats_window = stats_window
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._idle: List[Tuple[object, float]] = []       # (kết nối, thời điểm trả về pool)
+        # id(kết nối) -> (thao tác, bắt đầu, đã đổi timeout, lấy từ danh sách rảnh)
+        self._in_use: Dict[int, Tuple[str, float, bool, bool]] = {}
+        self._latency: Dict[str, RollingHistogram] = {}
+        self._errors: Dict[str, int] = {}
+        self.connects = 0
+        self.discarded = 0
+
+    def getconn(self, operation: str = "db", statement_timeout_ms: Optional[int] = None, fresh: bool = False):
+        """
+        Lấy kết nối cho một thao tác, None nếu không kết nối được DB.
+        Phải trả lại bằng putconn() (kể cả khi lỗi).
+        fresh=True: mở kết nối mới, không lấy từ danh sách rảnh (thử lại sau khi kết nối rảnh bị lỗi)
+        """
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.connect_timeout):
+            print(f"Database Pool Error: hết kết nối rảnh ({operation})")
+            self._count_error(operation)
+            return None
+        try:
+            conn = None if fresh else self._take_idle()
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect()
+        except Exception as e:
+            self._slots.release()
+            print(f"Database Connect Error: {e}")
+            self._count_error(operation)
+            return None
+
+        timeout_changed = False
+        if statement_timeout_ms is not None and statement_timeout_ms != self.statement_timeout_ms:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET statement_timeout = %s", (int(statement_timeout_ms),))
+                conn.commit()
+                timeout_changed = True
+            except Exception as e:
+                self._discard(conn)
+                self._slots.release()
+                print(f"Database Connect Error: {e}")
+                self._count_error(operation)
+                return None
+        with self._lock:
+            self._in_use[id(conn)] = (operation, start, timeout_changed, reused)
+        return conn
+
+    def is_reused(self, conn) -> bool:
+        """Kết nối đang dùng được lấy từ danh sách rảnh (có thể đã chết mà chưa tới lúc kiểm tra)"""
+        with self._lock:
+            entry = self._in_use.get(id(conn))
+        return bool(entry and entry[3])
+
+    def _take_idle(self):
+        """Kết nối nhàn rỗi còn dùng được (kiểm tra nếu đã nằm lâu), None nếu không có"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                conn, returned = self._idle.pop()
+            if conn.closed:
+                self._discard(conn)
+                continue
+            if time.monotonic() - returned < self.health_check_interval:
+                return conn
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+                return conn
+            except Exception:
+                self._discard(conn)
+
+    def _connect(self):
+        start = time.monotonic()
+        conn = psycopg2.connect(**self.params)
+        self._record("connect", start)
+        self.connects += 1
+        return conn
+
+    def _discard(self, conn):
+        self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def putconn(self, conn, discard: bool = False):
+        """Trả kết nối về pool (hủy nếu hỏng hoặc discard=True), ghi nhận độ trễ thao tác"""
+        if conn is None:
+            return
+        with self._lock:
+            operation, start, timeout_changed, _ = self._in_use.pop(id(conn), ("db", None, False, False))
+        if start is not None:
+            self._record(operation, start)
+        try:
+            if discard or conn.closed:
+                self._discard(conn)
+                return
+            # Không trả về pool kết nối đang dở transaction (lỗi giữa chừng)
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if timeout_changed:
+                with conn.cursor() as cursor:
+                    cursor.execute("RESET statement_timeout")
+                conn.commit()
+            now = time.monotonic()
+            with self._lock:
+                self._idle.append((conn, now))
+                # Kết nối ít dùng nhất nằm đầu danh sách: đóng bớt khi rảnh lâu, giữ lại min_connections
+                surplus = []
+                while len(self._idle) > self.min_connections and now - self._idle[0][1] > self.IDLE_CLOSE_AFTER:
+                    surplus.append(self._idle.pop(0)[0])
+            for idle_conn in surplus:
+                self._discard(idle_conn)
+        except Exception:
+            self._count_error(operation)
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def _record(self, operation: str, start: float):
+        elapsed_ms = (time.monotonic() - start) * 1000.0
+        with self._lock:
+            histogram = self._latency.get(operation)
+            if histogram is None:
+                histogram = self._latency[operation] = RollingHistogram(self.stats_window)
+            histogram.add(elapsed_ms)
+
+    def _count_error(self, operation: str):
+        with self._lock:
+            self._errors[operation] = self._errors.get(operation, 0) + 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """{thao tác: {"count", "mean", "p50", "p95", "max", "errors"}} (ms, trong cửa sổ thống kê)"""
+        with self._lock:
+            result = {}
+            for operation in sorted(set(self._latency) | set(self._errors)):
+                histogram = self._latency.get(operation) or RollingHistogram(self.stats_window)
+                summary = histogram.summary()
+                summary["errors"] = self._errors.get(operation, 0)
+                result[operation] = summary
+        return result
+
+    def format_stats(self) -> str:
+        """Một dòng log tóm tắt độ trễ DB"""
+        with self._lock:
+            idle = len(self._idle)
+            in_use = len(self._in_use)
+        parts = [f"DB pool: {in_use} đang dùng, {idle} rảnh, {self.connects} lần kết nối, {self.discarded} hủy"]
+        for operation, s in self.stats().items():
+            parts.append(f"{operation} n={s['count']} p50={s['p50']:.0f}ms p95={s['p95']:.0f}ms "
+                         f"max={s['max']:.0f}ms lỗi={s['errors']}")
+        return " | ".join(parts)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
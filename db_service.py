@@ -0,0 +1,141 @@
+"""
+Gọi ParkingDatabase ngoài GUI thread: DB chậm / mất kết nối không làm đơ cửa sổ và camera preview
+- Mỗi hàng đợi (mỗi làn, "background" cho báo cáo/nhập thẻ, "query" cho tra cứu) có 1 thread riêng:
+  lệnh cùng làn chạy đúng thứ tự, làn này chậm không chặn làn kia
+- Mỗi yêu cầu có thời hạn: quá hạn thì giao diện nhận kết quả lỗi ngay, lệnh còn nằm trong hàng đợi bị bỏ
+- Kết quả trả về GUI thread qua signal
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+_SKIPPED = object()  # Lệnh bị bỏ vì đã quá hạn trước khi tới lượt chạy
+TIMEOUT_MESSAGE = "Máy chủ dữ liệu phản hồi chậm, vui lòng thử lại"
+SKIPPED_MESSAGE = "Máy chủ dữ liệu phản hồi chậm, lệnh chưa được ghi, vui lòng thử lại"
+
+
+class DbService(QObject):
+    """Hàng đợi lệnh DB chạy nền, gọi callback trong GUI thread"""
+
+    # (mã yêu cầu, kết quả) - phát từ thread nền, nhận trong GUI thread
+    _completed = pyqtSignal(int, object)
+    # (thao tác, kết quả) - lệnh vẫn chạy xong sau khi đã báo quá hạn
+    late_result = pyqtSignal(str, object)
+
+    def __init__(self, db, request_timeout: float = 5.0, parent=None, logger=None):
+        """
+        Args:
+            db: ParkingDatabase
+            request_timeout: Thời hạn mặc định mỗi yêu cầu (giây), tính từ lúc gửi
+            logger: ParkingLogger (None = không ghi log)
+        """
+        super().__init__(parent)
+        self.db = db
+        self.request_timeout = request_timeout
+        self.logger = logger
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._pending: Dict[int, tuple] = {}  # mã yêu cầu -> (thao tác, callback, failure, still_pending)
+        self._late: Dict[int, tuple] = {}     # Yêu cầu đã báo quá hạn, lệnh có thể vẫn đang chạy
+        self._next_id = 0
+        self._closing = False
+        self.timeouts = 0
+        self.late = 0
+        self.skipped = 0
+        self._completed.connect(self._on_completed)
+
+    def submit(self, queue: str, operation: str, fn: Callable, *args,
+               callback: Optional[Callable] = None, failure: Optional[Callable[[str], object]] = None,
+               still_pending: Optional[Callable[[], object]] = None, timeout: Optional[float] = None) -> int:
+        """
+        Gửi lệnh fn(*args) vào hàng đợi queue (gọi từ GUI thread).
+
+        Args:
+            callback: Nhận kết quả trong GUI thread. Quá hạn thì nhận failure("..."), nếu lệnh
+                      đang chạy dở vẫn xong sau đó thì được gọi thêm 1 lần với kết quả thật
+            failure: Dựng kết quả lỗi từ thông báo (quá hạn, exception), ví dụ lambda msg: (False, msg)
+            still_pending: Gọi khi quá hạn mà lệnh có thể vẫn ghi xong (check-in/check-out): giao diện báo
+                           "đang chờ" thay vì lỗi để người dùng không quẹt lại; lệnh bị bỏ hẳn thì
+                           callback vẫn nhận failure("...")
+            timeout: Thời hạn (giây), None = request_timeout, 0 = không giới hạn
+        Trả về: mã yêu cầu
+        """
+        self._next_id += 1
+        request_id = self._next_id
+        timeout = self.request_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout if timeout else None
+        self._pending[request_id] = (operation, callback, failure, still_pending)
+
+        executor = self._executors.get(queue)
+        if executor is None:
+            executor = self._executors[queue] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-{queue}")
+        executor.submit(self._run, request_id, deadline, operation, fn, args, failure)
+        if deadline is not None:
+            QTimer.singleShot(int(timeout * 1000), lambda: self._expire(request_id))
+        return request_id
+
+    def _run(self, request_id: int, deadline: Optional[float], operation: str, fn: Callable, args: tuple,
+             failure: Optional[Callable[[str], object]]):
+        """Chạy trong thread của hàng đợi"""
+        if self._closing or (deadline is not None and time.monotonic() > deadline):
+            # Giao diện đã báo quá hạn: không ghi phiên mà người dùng không còn chờ
+            self._completed.emit(request_id, _SKIPPED)
+            return
+        try:
+            result = fn(*args)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Lỗi lệnh DB {operation}: {e}")
+            result = failure(str(e)) if failure else None
+        self._completed.emit(request_id, result)
+
+    def _on_completed(self, request_id: int, result):
+        if result is _SKIPPED:
+            self.skipped += 1
+            entry = self._late.pop(request_id, None)
+            if entry is None:
+                # Thread nền thấy quá hạn trước khi QTimer kịp chạy
+                self._expire(request_id, may_finish=False)
+            elif entry[3] and entry[1] and entry[2]:
+                # Giao diện đang báo "đang chờ": giờ chắc chắn lệnh không chạy
+                entry[1](entry[2](SKIPPED_MESSAGE))
+            return
+        entry = self._pending.pop(request_id, None)
+        if entry is None:
+            # Đã báo quá hạn nhưng lệnh vẫn chạy xong: kết quả thật mới là đúng
+            entry = self._late.pop(request_id, None)
+            if entry is None:
+                return
+            self.late += 1
+            self.late_result.emit(entry[0], result)
+        callback = entry[1]
+        if callback:
+            callback(result)
+
+    def _expire(self, request_id: int, may_finish: bool = True):
+        entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return
+        operation, callback, failure, still_pending = entry
+        self.timeouts += 1
+        if self.logger:
+            self.logger.warning(f"Lệnh DB {operation} quá hạn")
+        if may_finish:
+            self._late[request_id] = entry
+            if still_pending:
+                still_pending()
+                return
+        if callback and failure:
+            callback(failure(SKIPPED_MESSAGE if not may_finish else TIMEOUT_MESSAGE))
+
+    def format_stats(self) -> str:
+        return (f"DB service: {len(self._pending)} đang chờ, {self.timeouts} quá hạn, "
+                f"{self.late} xong muộn, {self.skipped} bỏ qua")
+
+    def stop(self):
+        """Bỏ các lệnh còn trong hàng đợi, chờ lệnh đang chạy xong (giới hạn bởi statement_timeout)"""
+        self._closing = True
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        self._executors.clear()
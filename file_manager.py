@@ -1,27 +1,48 @@
+import json
 import os
-from datetime import datetime
-from typing import Tuple
-from PyQt5.QtGui import QImage
+import re
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+from image_pack import PackReader, is_pack_reference, make_reference, parse_reference
+from image_writer import ImageWriter, make_thumbnail, thumbnail_path
 from logger import ParkingLogger
 
+INDEX_FILENAME = "index.jsonl"
+
 class FileManager:
     """
     Quản lý lưu file ảnh từ Camera.
     - Lưu tại: D:\DuLieuBaiXe\YYYY-MM-DD\
-    - Tên file: HH-MM-SS_dd-mm-yyyy_LAN_Truoc/Sau.jpg
+    - Tên file: HH-MM-SS-mmm_dd-mm-yyyy_LAN_SốThứTự_MãThẻ_Front/Rear.jpg
+    - Mỗi ngày có file index.jsonl: mã lượt chụp -> thẻ, thời điểm, đường dẫn ảnh
+    - Encode/ghi file ở nền qua ImageWriter, save_capture trả đường dẫn ngay
+    - Chế độ pack (writer.pack_mode): ảnh nằm trong images.pack của ngày,
+      DB lưu tham chiếu pack://YYYY-MM-DD/<tên ảnh> thay cho đường dẫn
+    - Ảnh thu nhỏ nằm trong thư mục con thumbs/ của ngày (file rời hoặc pack riêng)
     """
-    
-    def __init__(self, save_directory: str, logger: ParkingLogger = None):
+
+    def __init__(self, save_directory: str, logger: ParkingLogger = None, writer: Optional[ImageWriter] = None):
         """
         Khởi tạo FileManager
         args:
             save_directory: Thư mục gốc (Ví dụ: D:\DuLieuBaiXe)
+            writer: Nhóm thread ghi ảnh (None = tạo mặc định)
         """
         self.save_directory = save_directory
         self.logger = logger
+        self.writer = writer or ImageWriter(logger=logger)
+        self.pack_reader = PackReader(save_directory)
         # Đảm bảo thư mục gốc tồn tại
         self._ensure_directory_exists(save_directory)
-    
+        # Số thứ tự lượt chụp theo làn, đánh lại từ 1 mỗi ngày.
+        # Khôi phục từ chỉ mục hôm nay lúc khởi động, để save_capture (GUI thread) không phải đọc file
+        self._sequence_lock = threading.Lock()
+        self._sequence_day = date.today()
+        self._sequences: Dict[str, int] = self._load_sequences(self._sequence_day)
+
     def _ensure_directory_exists(self, directory: str):
         """Tạo thư mục nếu chưa có"""
         try:
@@ -29,49 +50,168 @@ class FileManager:
         except OSError as e:
             if self.logger:
                 self.logger.error(f"Không thể tạo thư mục {directory}: {str(e)}")
-    
-    def save_capture(self, lane: str, card_code: str, front_image: QImage, rear_image: QImage) -> Tuple[bool, str, str]:
+
+    def _day_directory(self, day: date) -> str:
+        # Format: YYYY-MM-DD để dễ sort
+        return os.path.join(self.save_directory, day.strftime("%Y-%m-%d"))
+
+    def reference_for(self, path: str) -> str:
+        """Giá trị lưu trong DB cho ảnh: đường dẫn file, hoặc tham chiếu pack:// ở chế độ pack"""
+        if not self.writer.pack_mode or not path:
+            return path
+        return make_reference(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+
+    def read_image(self, reference: str) -> Optional[bytes]:
+        """Đọc dữ liệu JPEG từ đường dẫn file hoặc tham chiếu pack://, None nếu không có"""
+        if is_pack_reference(reference):
+            return self.pack_reader.read(reference)
+        try:
+            with open(reference, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def read_thumbnail(self, reference: str, width: int = 320) -> Optional[bytes]:
+        """
+        Dữ liệu JPEG ảnh thu nhỏ của một ảnh (đường dẫn hoặc pack://), None nếu không có ảnh gốc.
+        Ảnh chụp trước khi bật thumbnail_width được thu nhỏ khi xem lần đầu rồi lưu lại ở nền.
         """
-        Lưu ảnh chụp từ 2 camera.
-        Trả về: (Success, Path_Front, Path_Rear)
+        if not reference:
+            return None
+        if is_pack_reference(reference):
+            day_folder, name = parse_reference(reference)
+            path = os.path.join(self.save_directory, day_folder, name)
+            data = self.pack_reader.read_entry(os.path.dirname(thumbnail_path(path)), name)
+        else:
+            path = reference
+            try:
+                with open(thumbnail_path(path), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+        if data is not None:
+            return data
+
+        original = self.read_image(reference)
+        if original is None:
+            return None
+        frame = cv2.imdecode(np.frombuffer(original, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return None
+        thumbnail = make_thumbnail(frame, width)
+        ok, encoded = cv2.imencode(".jpg", thumbnail, [cv2.IMWRITE_JPEG_QUALITY, self.writer.jpeg_quality])
+        if not ok:
+            return None
+        # Lưu cho lần xem sau, bỏ qua nếu hàng đợi ghi đang bận với ảnh chụp trực tiếp
+        self.writer.submit(thumbnail_path(path), thumbnail, timeout=0)
+        return encoded.tobytes()
+
+    def _load_sequences(self, day: date) -> Dict[str, int]:
+        """Số thứ tự lớn nhất theo làn trong file chỉ mục của ngày (chỉ gọi lúc khởi động)"""
+        sequences: Dict[str, int] = {}
+        for entry in self.read_index(day):
+            entry_lane = entry.get("lane", "")
+            sequences[entry_lane] = max(sequences.get(entry_lane, 0), int(entry.get("seq", 0)))
+        return sequences
+
+    def _next_sequence(self, day: date, lane: str) -> int:
+        """Số thứ tự kế tiếp của làn trong ngày (không đọc file: sang ngày mới thì đánh lại từ 1)"""
+        with self._sequence_lock:
+            if self._sequence_day != day:
+                # Chỉ mục của ngày mới chỉ do chính process này ghi, không cần đọc lại
+                self._sequence_day = day
+                self._sequences = {}
+            self._sequences[lane] = self._sequences.get(lane, 0) + 1
+            return self._sequences[lane]
+
+    @staticmethod
+    def _safe_card(card_code: str) -> str:
+        """Mã thẻ dùng trong tên file (bỏ ký tự không hợp lệ trên Windows)"""
+        return re.sub(r"[^0-9A-Za-z_-]", "", card_code or "")[:32] or "NOCARD"
+
+    def save_capture(self, lane: str, card_code: str, front_frame: np.ndarray, rear_frame: np.ndarray) -> Tuple[bool, str, str]:
+        """
+        Lưu ảnh chụp (BGR) từ 2 camera: đưa vào hàng đợi ghi và trả về ngay.
+        Lỗi ghi file xảy ra sau đó được báo qua self.writer.write_failed.
+        Trả về: (Success, Path_Front, Path_Rear); False nếu hàng đợi ghi đầy
+        (ở chế độ pack, Path_Front/Path_Rear là tham chiếu pack://)
         """
         now = datetime.now()
-        
-        # 1. Tạo tên thư mục theo ngày (Format: YYYY-MM-DD để dễ sort)
-        # Ví dụ: D:\DuLieuBaiXe\2025-12-04
-        folder_date = now.strftime("%Y-%m-%d")
-        day_directory = os.path.join(self.save_directory, folder_date)
-        self._ensure_directory_exists(day_directory)
-        
-        # 2. Tạo tên file theo yêu cầu: Giờ-Phút-Giây_Ngày-Tháng-Năm
+
+        # 1. Thư mục theo ngày, ví dụ: D:\DuLieuBaiXe\2025-12-04 (tạo trong thread ghi)
+        day_directory = self._day_directory(now.date())
+
+        # 2. Tên file: thời gian tới mili giây + số thứ tự theo làn -> không trùng dù quẹt liên tục
         # Lưu ý: Windows không cho phép dấu hai chấm (:) trong tên file
-        time_str = now.strftime("%H-%M-%S") 
+        time_str = now.strftime("%H-%M-%S-") + f"{now.microsecond // 1000:03d}"
         date_str = now.strftime("%d-%m-%Y")
-        
         lane_prefix = lane.upper() # RA hoặc VAO
-        
-        # Format: 12-30-05_04-12-2025_RA_Front.jpg
-        # Thêm Lane và Front/Rear để tránh trùng tên nếu 2 xe vào cùng lúc
-        front_filename = f"{time_str}_{date_str}_{lane_prefix}_Front.jpg"
-        rear_filename = f"{time_str}_{date_str}_{lane_prefix}_Rear.jpg"
-        
-        # Đường dẫn đầy đủ
-        front_path = os.path.join(day_directory, front_filename)
-        rear_path = os.path.join(day_directory, rear_filename)
-        
+        sequence = self._next_sequence(now.date(), lane_prefix)
+
+        # Format: 12-30-05-123_04-12-2025_RA_000042_E200123456_Front.jpg
+        base_name = f"{time_str}_{date_str}_{lane_prefix}_{sequence:06d}_{self._safe_card(card_code)}"
+        front_path = os.path.join(day_directory, f"{base_name}_Front.jpg")
+        rear_path = os.path.join(day_directory, f"{base_name}_Rear.jpg")
+
+        # 3. Chỉ mục ngày (tra ảnh của một lượt quẹt không cần quét thư mục)
+        entry = {
+            "id": f"{now:%Y%m%d}-{lane_prefix}-{sequence:06d}",
+            "seq": sequence,
+            "lane": lane_prefix,
+            "card": card_code,
+            "time": now.isoformat(timespec="milliseconds"),
+            "front": os.path.basename(front_path) if front_frame is not None else "",
+            "rear": os.path.basename(rear_path) if rear_frame is not None else "",
+        }
+
+        # 4. Đưa ảnh trước, ảnh sau (encode song song) và dòng chỉ mục vào hàng đợi cùng lúc, không chờ:
+        # GUI thread không bị chặn khi ổ cứng chậm, và không có ảnh nào được ghi nếu thiếu chỗ cho cả lượt
+        items = [(path, frame) for path, frame in ((front_path, front_frame), (rear_path, rear_frame))
+                 if frame is not None]
+        items.append((os.path.join(day_directory, INDEX_FILENAME), json.dumps(entry, ensure_ascii=False)))
+        if not self.writer.submit_all(items):
+            if self.logger:
+                self.logger.error(f"Hàng đợi ghi ảnh đầy ({self.writer.pending()} ảnh), bỏ lượt chụp {entry['id']}")
+            return False, "", ""
+        return True, self.reference_for(front_path), self.reference_for(rear_path)
+
+    def read_index(self, day: date) -> List[dict]:
+        """Đọc file chỉ mục của một ngày (bỏ qua dòng hỏng, ví dụ ghi dở khi mất điện)"""
+        entries = []
+        index_path = os.path.join(self._day_directory(day), INDEX_FILENAME)
         try:
-            # Lưu ảnh Camera Trước
-            if front_image:
-                # Quality 85 là đủ đẹp và nhẹ
-                front_image.save(front_path, "JPG", quality=85)
-            
-            # Lưu ảnh Camera Sau
-            if rear_image:
-                rear_image.save(rear_path, "JPG", quality=85)
-                
-            return True, front_path, rear_path
-            
-        except Exception as e:
+            with open(index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        except OSError as e:
             if self.logger:
-                self.logger.error(f"Lỗi lưu file ảnh: {e}")
-            return False, "", ""
\ No newline at end of file
+                self.logger.error(f"Không đọc được chỉ mục ảnh {index_path}: {e}")
+        return entries
+
+    def find_captures(self, day: date, card_code: Optional[str] = None, lane: Optional[str] = None) -> List[dict]:
+        """
+        Tra các lượt chụp trong ngày theo mã thẻ/làn qua file chỉ mục.
+        Mỗi kết quả có thêm "front_path"/"rear_path" là đường dẫn đầy đủ (hoặc tham chiếu pack://).
+        """
+        day_directory = self._day_directory(day)
+        results = []
+        for entry in self.read_index(day):
+            if card_code is not None and entry.get("card") != card_code:
+                continue
+            if lane is not None and entry.get("lane") != lane.upper():
+                continue
+            for side in ("front", "rear"):
+                name = entry.get(side)
+                entry[f"{side}_path"] = self.reference_for(os.path.join(day_directory, name)) if name else ""
+            results.append(entry)
+        return results
+
+    def close(self):
+        """Ghi nốt các ảnh đang chờ (gọi khi tắt ứng dụng)"""
+        self.writer.stop()
+        self.pack_reader.close()
@@ -0,0 +1,126 @@
+"""
+Ring buffer cấp phát sẵn cho frame camera (numpy BGR)
+Giữ N frame gần nhất kèm timestamp, chỉ chuyển đổi khi thật sự cần hiển thị/lưu ảnh
+"""
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class FrameRingBuffer:
+    """Vòng đệm N frame thô, cấp phát một lần và ghi đè xoay vòng"""
+
+    def __init__(self, capacity: int = 8):
+        """
+        Khởi tạo FrameRingBuffer
+
+        Args:
+            capacity: Số frame tối đa được giữ lại
+        """
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._frames: Optional[np.ndarray] = None  # (capacity, h, w, c), cấp phát khi có frame đầu tiên
+        self._timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self._seqs = np.full(self.capacity, -1, dtype=np.int64)
+        self._next_seq = 0
+
+    def begin_write(self) -> Optional[np.ndarray]:
+        """
+        Lấy slot kế tiếp để decoder ghi thẳng vào (zero-copy).
+        Trả về None nếu buffer chưa được cấp phát (chưa biết kích thước frame).
+        Sau khi ghi xong phải gọi commit() hoặc push().
+        """
+        with self._lock:
+            if self._frames is None:
+                return None
+            idx = self._next_seq % self.capacity
+            self._seqs[idx] = -1  # Slot đang được ghi, bỏ qua khi đọc
+            return self._frames[idx]
+
+    def commit(self, timestamp: Optional[float] = None) -> int:
+        """Xác nhận slot lấy từ begin_write() đã chứa frame hợp lệ, trả về sequence"""
+        with self._lock:
+            idx = self._next_seq % self.capacity
+            return self._publish(idx, timestamp)
+
+    def push(self, frame: np.ndarray, timestamp: Optional[float] = None) -> int:
+        """
+        Copy frame vào slot kế tiếp (dùng khi decoder không ghi trực tiếp vào slot,
+        ví dụ frame đầu tiên hoặc camera đổi độ phân giải)
+        """
+        with self._lock:
+            if self._frames is None or self._frames.shape[1:] != frame.shape or self._frames.dtype != frame.dtype:
+                self._allocate(frame.shape, frame.dtype)
+            idx = self._next_seq % self.capacity
+            np.copyto(self._frames[idx], frame)
+            return self._publish(idx, timestamp)
+
+    def _allocate(self, shape, dtype):
+        """Cấp phát lại toàn bộ vòng đệm theo kích thước frame mới"""
+        self._frames = np.empty((self.capacity,) + tuple(shape), dtype=dtype)
+        self._seqs.fill(-1)
+
+    def _publish(self, idx: int, timestamp: Optional[float]) -> int:
+        seq = self._next_seq
+        self._timestamps[idx] = time.monotonic() if timestamp is None else timestamp
+        self._seqs[idx] = seq
+        self._next_seq += 1
+        return seq
+
+    def latest(self) -> Optional[Tuple[np.ndarray, float, int]]:
+        """Lấy bản copy của frame mới nhất: (frame, timestamp, sequence)"""
+        with self._lock:
+            if self._next_seq == 0 or self._frames is None:
+                return None
+            idx = (self._next_seq - 1) % self.capacity
+            if self._seqs[idx] < 0:
+                return None
+            return self._frames[idx].copy(), float(self._timestamps[idx]), int(self._seqs[idx])
+
+    def latest_timestamp(self) -> Optional[float]:
+        """Timestamp (monotonic) của frame mới nhất, None nếu chưa có frame"""
+        with self._lock:
+            if self._next_seq == 0:
+                return None
+            idx = (self._next_seq - 1) % self.capacity
+            if self._seqs[idx] < 0:
+                return None
+            return float(self._timestamps[idx])
+
+    def window(self, since: Optional[float] = None, until: Optional[float] = None) -> List[Tuple[float, int]]:
+        """
+        Timestamp và sequence các frame trong khoảng [since, until], sắp xếp cũ -> mới.
+        Không copy frame: người gọi đọc từng frame bằng read(seq) trong giới hạn thời gian của mình
+
+        Args:
+            since: Timestamp nhỏ nhất (monotonic), None = không giới hạn
+            until: Timestamp lớn nhất (monotonic), None = không giới hạn
+        """
+        with self._lock:
+            if self._frames is None:
+                return []
+            valid = self._seqs >= 0
+            if since is not None:
+                valid &= self._timestamps >= since
+            if until is not None:
+                valid &= self._timestamps <= until
+            order = np.argsort(self._seqs[valid])
+            indices = np.flatnonzero(valid)[order]
+            return [(float(self._timestamps[i]), int(self._seqs[i])) for i in indices]
+
+    def read(self, seq: int) -> Optional[np.ndarray]:
+        """Bản copy frame có sequence seq, None nếu đã bị ghi đè"""
+        with self._lock:
+            if self._frames is None:
+                return None
+            idx = seq % self.capacity
+            if self._seqs[idx] != seq:
+                return None
+            return self._frames[idx].copy()
+
+    def clear(self):
+        """Đánh dấu toàn bộ frame là không hợp lệ (khi mất kết nối)"""
+        with self._lock:
+            self._seqs.fill(-1)
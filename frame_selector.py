@@ -0,0 +1,136 @@
+"""
+Chọn ảnh tốt nhất trong cửa sổ thời gian quanh lúc quẹt thẻ
+Chấm điểm độ nét (phương sai Laplacian) và độ sáng bằng numpy, trong giới hạn thời gian,
+ghép cặp ảnh trước/sau theo timestamp (loại cặp lệch nhau hoặc ảnh cũ)
+"""
+import time
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def prepare_gray(frame: np.ndarray, analysis_width: int = 320) -> np.ndarray:
+    """Thu nhỏ frame về analysis_width và chuyển sang ảnh xám float32"""
+    h, w = frame.shape[:2]
+    if w > analysis_width:
+        new_h = max(3, int(h * analysis_width / w))
+        frame = cv2.resize(frame, (analysis_width, new_h), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return gray.astype(np.float32)
+
+
+def score_frames(grays: np.ndarray) -> np.ndarray:
+    """
+    Chấm điểm cả lô ảnh xám cùng kích thước (n, h, w) trong một lượt tính
+
+    Điểm = phương sai Laplacian (độ nét) x hệ số phơi sáng.
+    Hệ số phơi sáng giảm khi ảnh quá tối/quá sáng hoặc nhiều điểm bị cháy/đen.
+    """
+    center = grays[:, 1:-1, 1:-1]
+    laplacian = (grays[:, :-2, 1:-1] + grays[:, 2:, 1:-1] +
+                 grays[:, 1:-1, :-2] + grays[:, 1:-1, 2:] - 4.0 * center)
+    sharpness = laplacian.reshape(len(grays), -1).var(axis=1)
+
+    flat = grays.reshape(len(grays), -1)
+    brightness = flat.mean(axis=1)
+    clipped = ((flat < 8) | (flat > 247)).mean(axis=1)
+    exposure = np.clip(1.0 - np.abs(brightness - 128.0) / 128.0, 0.05, 1.0) * (1.0 - clipped)
+    return sharpness * exposure
+
+
+def score_window(frames: List[Tuple[float, int]], read_frame: Callable[[int], Optional[np.ndarray]],
+                 trigger: float, budget: float = 0.08,
+                 analysis_width: int = 320) -> List[Tuple[np.ndarray, float, float]]:
+    """
+    Chấm điểm các frame trong cửa sổ, giới hạn thời gian xử lý
+
+    Frame gần thời điểm quẹt thẻ được xử lý trước; mỗi frame được copy, thu nhỏ và chấm điểm
+    trong budget, hết budget thì dừng (ít nhất luôn có frame gần nhất còn đọc được).
+
+    Args:
+        frames: Danh sách (timestamp monotonic, sequence), ví dụ FrameRingBuffer.window()
+        read_frame: Đọc frame BGR theo sequence (None nếu frame đã bị ghi đè)
+        trigger: Thời điểm quẹt thẻ (monotonic)
+        budget: Thời gian xử lý tối đa (giây), tính cả thời gian copy frame
+        analysis_width: Độ rộng ảnh dùng để chấm điểm
+
+    Returns:
+        Danh sách (frame, timestamp, điểm), frame gần lúc quẹt thẻ đứng trước
+    """
+    deadline = time.monotonic() + budget
+    scored = []
+    for timestamp, seq in sorted(frames, key=lambda item: abs(item[0] - trigger)):
+        if scored and time.monotonic() > deadline:
+            break
+        frame = read_frame(seq)
+        if frame is None:
+            continue  # Bị ghi đè sau khi lấy danh sách
+        score = score_frames(prepare_gray(frame, analysis_width)[None])[0]
+        scored.append((frame, timestamp, float(score)))
+    return scored
+
+
+def select_best_frame(frames: List[Tuple[np.ndarray, float, int]], trigger: float,
+                      budget: float = 0.08, analysis_width: int = 320) -> Optional[Tuple[np.ndarray, float, float]]:
+    """
+    Chọn frame tốt nhất trong danh sách (frame BGR, timestamp, sequence) (xem score_window)
+
+    Returns:
+        (frame, timestamp, điểm) hoặc None nếu không có frame
+    """
+    entries = [(timestamp, index) for index, (_, timestamp, _) in enumerate(frames)]
+    scored = score_window(entries, lambda index: frames[index][0], trigger, budget, analysis_width)
+    if not scored:
+        return None
+    return max(scored, key=lambda item: item[2])
+
+
+def select_pair(front: List[Tuple[np.ndarray, float, float]], rear: List[Tuple[np.ndarray, float, float]],
+                trigger: float, max_skew: float = 0.15, max_age: float = 1.0):
+    """
+    Ghép cặp ảnh trước/sau chụp gần cùng thời điểm và gần lúc quẹt thẻ
+
+    Trong các cặp có độ lệch giữa 2 camera <= max_skew và tuổi so với lúc quẹt thẻ
+    <= max_age, chọn cặp nét nhất (điểm chuẩn hóa theo từng camera), ưu tiên cặp gần lúc quẹt thẻ.
+
+    Args:
+        front, rear: Kết quả score_window() của camera trước/sau
+        trigger: Thời điểm quẹt thẻ (monotonic)
+        max_skew: Độ lệch thời gian tối đa giữa ảnh trước và sau (giây)
+        max_age: Độ lệch tối đa của mỗi ảnh so với lúc quẹt thẻ (giây)
+
+    Returns:
+        (ảnh trước, ảnh sau, lỗi): lỗi là None nếu cặp hợp lệ; nếu không có cặp hợp lệ
+        thì trả về cặp lệch ít nhất (để log) kèm mô tả lỗi
+    """
+    if not front or not rear:
+        missing = "trước" if not front else "sau"
+        return (front[0] if front else None), (rear[0] if rear else None), f"Không có ảnh camera {missing}"
+
+    front_ts = np.array([item[1] for item in front])
+    rear_ts = np.array([item[1] for item in rear])
+    front_age = np.abs(front_ts - trigger)
+    rear_age = np.abs(rear_ts - trigger)
+    skew = np.abs(front_ts[:, None] - rear_ts[None, :])
+    valid = (skew <= max_skew) & (front_age[:, None] <= max_age) & (rear_age[None, :] <= max_age)
+
+    if not valid.any():
+        i, j = np.unravel_index(np.argmin(skew + front_age[:, None] + rear_age[None, :]), skew.shape)
+        if front_age.min() > max_age:
+            error = f"Ảnh camera trước cũ {front_age.min() * 1000:.0f} ms"
+        elif rear_age.min() > max_age:
+            error = f"Ảnh camera sau cũ {rear_age.min() * 1000:.0f} ms"
+        else:
+            error = f"Ảnh trước/sau lệch nhau {skew[i, j] * 1000:.0f} ms"
+        return front[i], rear[j], error
+
+    front_score = np.array([item[2] for item in front])
+    rear_score = np.array([item[2] for item in rear])
+    front_score = front_score / max(front_score.max(), 1e-6)
+    rear_score = rear_score / max(rear_score.max(), 1e-6)
+    objective = (front_score[:, None] + rear_score[None, :]
+                 - 0.5 * (front_age[:, None] + rear_age[None, :]) / max(max_age, 1e-6))
+    objective[~valid] = -np.inf
+    i, j = np.unravel_index(np.argmax(objective), objective.shape)
+    return front[i], rear[j], None
@@ -0,0 +1,229 @@
+"""
+Nguồn frame thay thế camera RTSP (chạy CameraThread không cần DVR)
+Giao diện giống cv2.VideoCapture (isOpened/grab/retrieve/read/get/set/release).
+
+URL hỗ trợ (dùng thay URL RTSP trong config.json):
+- file:///duong/dan/video.mp4?fps=25&size=1280x720&loop=1   Phát lại file video
+- images:///thu/muc/anh?fps=10&size=1920x1080&loop=1         Phát lần lượt các ảnh trong thư mục
+- synthetic://?fps=25&size=1920x1080&period=20&duration=4    Frame sinh tự động (xe đi qua theo chu kỳ)
+Module này không import PyQt5 (dùng được trong process decode).
+"""
+import glob
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource(ABC):
+    """Lớp cơ sở: giữ nhịp FPS theo deadline, resize về kích thước yêu cầu"""
+
+    def __init__(self, fps: float = 25.0, size: Optional[Tuple[int, int]] = None, loop: bool = True):
+        self.fps = fps if fps > 0 else 25.0
+        self.size = size
+        self.loop = loop
+        self._interval = 1.0 / self.fps
+        self._next_deadline = None
+        self._frame: Optional[np.ndarray] = None
+        self._opened = True
+
+    @abstractmethod
+    def _next_frame(self) -> Optional[np.ndarray]:
+        """Frame kế tiếp (BGR), None khi hết nguồn"""
+
+    def _fit(self, frame: np.ndarray) -> np.ndarray:
+        if self.size and (frame.shape[1], frame.shape[0]) != self.size:
+            return cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def grab(self) -> bool:
+        """Chờ tới deadline của frame kế tiếp (như stream thật) rồi lấy frame"""
+        if not self._opened:
+            return False
+        now = time.monotonic()
+        if self._next_deadline is None:
+            self._next_deadline = now
+        delay = self._next_deadline - now
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self._interval:
+            self._next_deadline = time.monotonic()  # Bị trễ: bắt nhịp lại thay vì phát dồn
+        self._next_deadline += self._interval
+
+        frame = self._next_frame()
+        if frame is None:
+            self._opened = False
+            return False
+        self._frame = self._fit(frame)
+        return True
+
+    def retrieve(self, image: Optional[np.ndarray] = None):
+        """Trả frame vừa grab (copy vào image nếu cùng kích thước, như cv2.VideoCapture)"""
+        frame = self._frame
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+
+    def read(self, image: Optional[np.ndarray] = None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if self._frame is not None:
+            if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+                return float(self._frame.shape[1])
+            if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+                return float(self._frame.shape[0])
+        return 0.0
+
+    def set(self, prop_id: int, value: float) -> bool:
+        return False
+
+    def release(self):
+        self._opened = False
+        self._frame = None
+
+
+class VideoFileSource(FrameSource):
+    """Phát lại file video theo FPS chọn trước (mặc định FPS của file)"""
+
+    def __init__(self, path: str, fps: float = 0, size: Optional[Tuple[int, int]] = None, loop: bool = True):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        file_fps = self.cap.get(cv2.CAP_PROP_FPS)
+        super().__init__(fps or (file_fps if 0 < file_fps <= 120 else 25.0), size, loop)
+        self._opened = self.cap.isOpened()
+
+    def _next_frame(self) -> Optional[np.ndarray]:
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def release(self):
+        super().release()
+        self.cap.release()
+
+
+class ImageSequenceSource(FrameSource):
+    """Phát lần lượt các ảnh trong thư mục (sắp xếp theo tên)"""
+
+    def __init__(self, directory: str, fps: float = 10.0, size: Optional[Tuple[int, int]] = None,
+                 loop: bool = True):
+        super().__init__(fps, size, loop)
+        self.files: List[str] = sorted(f for f in glob.glob(os.path.join(directory, "*"))
+                                       if f.lower().endswith(IMAGE_EXTENSIONS))
+        self._index = 0
+        self._opened = bool(self.files)
+
+    def _next_frame(self) -> Optional[np.ndarray]:
+        if self._index >= len(self.files):
+            if not self.loop:
+                return None
+            self._index = 0
+        frame = cv2.imread(self.files[self._index])
+        self._index += 1
+        return frame
+
+
+class SyntheticSource(FrameSource):
+    """
+    Frame sinh tự động: nền tĩnh có nhiễu nhẹ, cứ mỗi period giây có một "xe"
+    chạy ngang khung hình trong duration giây (để thử phát hiện chuyển động và chụp ảnh)
+    """
+
+    def __init__(self, fps: float = 25.0, size: Optional[Tuple[int, int]] = None,
+                 period: float = 20.0, duration: float = 4.0, seed: int = 0):
+        super().__init__(fps, size or (1920, 1080), loop=True)
+        width, height = self.size
+        rng = np.random.default_rng(seed)
+        # Nền: dải sáng tối + họa tiết ngẫu nhiên (có chi tiết để chấm độ nét)
+        gradient = np.linspace(60, 160, width, dtype=np.float32)[None, :, None]
+        texture = rng.integers(0, 40, (height, width, 1), dtype=np.uint8)
+        self._background = np.clip(gradient + texture, 0, 255).astype(np.uint8).repeat(3, axis=2)
+        self._frame_buffer = np.empty_like(self._background)
+        self.period = period
+        self.duration = duration
+        self._start = None
+        self._count = 0
+
+    def _next_frame(self) -> Optional[np.ndarray]:
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now
+        frame = self._frame_buffer
+        np.copyto(frame, self._background)
+
+        height, width = frame.shape[:2]
+        phase = (now - self._start) % self.period if self.period > 0 else 0
+        if self.period > 0 and phase < self.duration:
+            # "Xe" là khối chữ nhật có viền, đi từ trái sang phải
+            car_w, car_h = width // 4, height // 3
+            x = int((phase / self.duration) * (width + car_w)) - car_w
+            y = height // 2 - car_h // 2
+            cv2.rectangle(frame, (x, y), (x + car_w, y + car_h), (40, 40, 200), -1)
+            cv2.rectangle(frame, (x, y), (x + car_w, y + car_h), (255, 255, 255), 4)
+
+        self._count += 1
+        cv2.putText(frame, f"#{self._count}", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+        return frame
+
+    def _fit(self, frame: np.ndarray) -> np.ndarray:
+        return frame  # Đã sinh đúng kích thước
+
+
+def _parse_size(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not value:
+        return None
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def open_frame_source(url: str) -> Optional[FrameSource]:
+    """
+    Tạo nguồn frame từ URL file://, images://, synthetic://
+    Trả về None với các URL khác (RTSP...) để dùng cv2.VideoCapture như bình thường
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("file", "images", "synthetic"):
+        return None
+    params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+    fps = float(params.get("fps", 0))
+    size = _parse_size(params.get("size"))
+    loop = params.get("loop", "1") not in ("0", "false")
+    path = (parsed.netloc + parsed.path) if parsed.netloc not in ("", "localhost") else parsed.path
+    if len(path) > 2 and path[0] == "/" and path[2] == ":":
+        path = path[1:]  # file:///D:/video.mp4 trên Windows
+
+    if parsed.scheme == "file":
+        return VideoFileSource(path, fps, size, loop)
+    if parsed.scheme == "images":
+        return ImageSequenceSource(path, fps or 10.0, size, loop)
+    return SyntheticSource(fps or 25.0, size,
+                           period=float(params.get("period", 20)),
+                           duration=float(params.get("duration", 4)),
+                           seed=int(params.get("seed", 0)))
+
+
+def open_capture(url: str, params: Optional[List[int]] = None):
+    """Mở nguồn video: nguồn giả lập nếu URL là file/images/synthetic, ngược lại cv2.VideoCapture (FFMPEG)"""
+    source = open_frame_source(url)
+    if source is not None:
+        return source
+    return cv2.VideoCapture(url, cv2.CAP_FFMPEG, params or [])
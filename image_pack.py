@@ -0,0 +1,231 @@
+"""
+Lưu ảnh dạng pack: mỗi ngày một file images.pack chỉ ghi thêm (append-only) + images.idx
+thay cho hàng nghìn file JPEG nhỏ (sao lưu, quét virus, liệt kê thư mục nhanh hơn nhiều).
+
+Bố cục:
+- images.pack: chuỗi bản ghi [magic "IMGP" | độ dài tên (H) | độ dài dữ liệu (I) | tên | JPEG]
+- images.idx:  bản ghi cố định 108 byte [offset dữ liệu (Q) | độ dài (I) | tên (96 byte)]
+  tên dài hơn 96 byte: trường tên là [0x00 | độ dài tên (H)], tên đầy đủ đọc từ bản ghi trong pack
+Tham chiếu lưu trong DB: "pack://YYYY-MM-DD/<tên file>" (tương đối với thư mục lưu ảnh)
+
+Xuất pack ra file JPEG rời:
+    python image_pack.py export D:\\DuLieuBaiXe\\2025-12-04 D:\\XuatAnh
+    python image_pack.py ls D:\\DuLieuBaiXe\\2025-12-04
+"""
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+
+PACK_FILENAME = "images.pack"
+INDEX_FILENAME = "images.idx"
+PACK_SCHEME = "pack://"
+
+RECORD_MAGIC = b"IMGP"
+RECORD_HEADER = struct.Struct("<4sHI")   # magic, độ dài tên, độ dài dữ liệu
+INDEX_RECORD = struct.Struct("<QI96s")   # offset dữ liệu, độ dài, tên (UTF-8, đệm 0)
+INDEX_NAME_SIZE = 96
+LONG_NAME = struct.Struct("<xH")         # trường tên của tên dài: byte 0 + độ dài tên
+
+
+def make_reference(day_folder: str, name: str) -> str:
+    """Tham chiếu ảnh trong pack, ví dụ pack://2025-12-04/12-30-05-123_..._Front.jpg"""
+    return f"{PACK_SCHEME}{day_folder}/{name}"
+
+
+def is_pack_reference(value: str) -> bool:
+    return bool(value) and value.startswith(PACK_SCHEME)
+
+
+def parse_reference(reference: str) -> Tuple[str, str]:
+    """pack://<ngày>/<tên> -> (thư mục ngày, tên ảnh)"""
+    day_folder, _, name = reference[len(PACK_SCHEME):].partition("/")
+    return day_folder, name
+
+
+def fsync_file(path: str):
+    with open(path, "rb+") as f:  # Windows cần quyền ghi để fsync
+        os.fsync(f.fileno())
+
+
+def fsync_directory(directory: str):
+    """Ghi bền thao tác tạo / đổi tên / xóa file trong thư mục (chỉ POSIX, Windows không hỗ trợ)"""
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+class PackWriter:
+    """Ghi thêm ảnh vào pack của từng thư mục ngày (an toàn khi gọi từ nhiều thread)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def append(self, day_directory: str, name: str, data: bytes) -> Tuple[str, str]:
+        """
+        Ghi 1 ảnh vào cuối pack, rồi mới ghi chỉ mục (mất điện giữa chừng thì
+        chỉ mục thiếu bản ghi cuối, PackReader quét bù từ pack).
+        Trả về (đường dẫn pack, đường dẫn chỉ mục) để fsync theo lô.
+        """
+        encoded_name = name.encode("utf-8")
+        if len(encoded_name) > 0xFFFF:
+            raise ValueError(f"Tên ảnh quá dài cho pack: {name}")
+        # Tên dài (thẻ dài + key làn) không vừa chỉ mục: chỉ ghi độ dài, tên đầy đủ nằm ngay trước dữ liệu
+        index_name = encoded_name if len(encoded_name) <= INDEX_NAME_SIZE else LONG_NAME.pack(len(encoded_name))
+        pack_path = os.path.join(day_directory, PACK_FILENAME)
+        index_path = os.path.join(day_directory, INDEX_FILENAME)
+        with self._lock:
+            with open(pack_path, "ab") as pack:
+                offset = pack.seek(0, os.SEEK_END)
+                pack.write(RECORD_HEADER.pack(RECORD_MAGIC, len(encoded_name), len(data)))
+                pack.write(encoded_name)
+                pack.write(data)
+            data_offset = offset + RECORD_HEADER.size + len(encoded_name)
+            with open(index_path, "ab") as index:
+                index.write(INDEX_RECORD.pack(data_offset, len(data), index_name))
+        return pack_path, index_path
+
+
+def scan_pack(pack_path: str, start: int = 0) -> Iterator[Tuple[str, int, int]]:
+    """Duyệt bản ghi trong pack từ offset start: (tên, offset dữ liệu, độ dài), dừng ở bản ghi dở"""
+    size = os.path.getsize(pack_path)
+    with open(pack_path, "rb") as pack:
+        offset = start
+        while offset + RECORD_HEADER.size <= size:
+            pack.seek(offset)
+            magic, name_len, data_len = RECORD_HEADER.unpack(pack.read(RECORD_HEADER.size))
+            data_offset = offset + RECORD_HEADER.size + name_len
+            if magic != RECORD_MAGIC or data_offset + data_len > size:
+                return
+            name = pack.read(name_len).decode("utf-8", errors="replace")
+            yield name, data_offset, data_len
+            offset = data_offset + data_len
+
+
+class PackReader:
+    """Đọc ảnh trong pack bằng mmap (truy cập ngẫu nhiên, không đọc cả file)"""
+
+    def __init__(self, save_directory: str):
+        self.save_directory = save_directory
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, Tuple[Tuple[int, int], Dict[str, Tuple[int, int]]]] = {}
+        self._maps: Dict[str, mmap.mmap] = {}
+
+    def load_index(self, day_directory: str) -> Dict[str, Tuple[int, int]]:
+        """{tên: (offset, độ dài)} của một ngày, đọc lại khi pack lớn thêm hoặc bị thay (nén lại)"""
+        pack_path = os.path.join(day_directory, PACK_FILENAME)
+        index_path = os.path.join(day_directory, INDEX_FILENAME)
+        try:
+            stat = os.stat(pack_path)
+        except OSError:
+            return {}
+        identity = (stat.st_ino, stat.st_size)
+        with self._lock:
+            cached = self._indexes.get(day_directory)
+            if cached and cached[0] == identity:
+                return cached[1]
+            if cached and cached[0][0] != stat.st_ino:
+                # Pack đã được thay bằng file mới: bỏ mmap của file cũ
+                mapped = self._maps.pop(pack_path, None)
+                if mapped is not None:
+                    mapped.close()
+
+        entries: Dict[str, Tuple[int, int]] = {}
+        indexed_end = 0
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                raw = f.read()
+            usable = len(raw) - len(raw) % INDEX_RECORD.size
+            with open(pack_path, "rb") as pack:
+                for offset, length, name in INDEX_RECORD.iter_unpack(raw[:usable]):
+                    if name[0] == 0:
+                        # Tên dài: đọc từ bản ghi trong pack (tên đứng ngay trước dữ liệu)
+                        name_len, = LONG_NAME.unpack_from(name)
+                        pack.seek(offset - name_len)
+                        name = pack.read(name_len)
+                    entries[name.rstrip(b"\0").decode("utf-8", errors="replace")] = (offset, length)
+                    indexed_end = max(indexed_end, offset + length)
+        # Bản ghi đã vào pack nhưng chưa kịp vào chỉ mục (tắt máy đột ngột)
+        for name, offset, length in scan_pack(pack_path, indexed_end):
+            entries[name] = (offset, length)
+
+        with self._lock:
+            self._indexes[day_directory] = (identity, entries)
+        return entries
+
+    def _map(self, pack_path: str, needed: int) -> mmap.mmap:
+        with self._lock:
+            mapped = self._maps.get(pack_path)
+            if mapped is None or len(mapped) < needed:
+                if mapped is not None:
+                    mapped.close()
+                with open(pack_path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[pack_path] = mapped
+            return mapped
+
+    def read(self, reference: str) -> Optional[bytes]:
+        """Dữ liệu JPEG của tham chiếu pack://..., None nếu không tìm thấy"""
+        day_folder, name = parse_reference(reference)
+        return self.read_entry(os.path.join(self.save_directory, day_folder), name)
+
+    def read_entry(self, day_directory: str, name: str) -> Optional[bytes]:
+        """Dữ liệu JPEG của ảnh name trong pack của thư mục day_directory"""
+        location = self.load_index(day_directory).get(name)
+        if location is None:
+            return None
+        offset, length = location
+        mapped = self._map(os.path.join(day_directory, PACK_FILENAME), offset + length)
+        return mapped[offset:offset + length]
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+
+def export_pack(day_directory: str, output_directory: str) -> int:
+    """Xuất mọi ảnh trong pack của một ngày ra file JPEG rời, trả về số file"""
+    reader = PackReader(os.path.dirname(day_directory.rstrip("\\/")))
+    day_folder = os.path.basename(day_directory.rstrip("\\/"))
+    os.makedirs(output_directory, exist_ok=True)
+    count = 0
+    try:
+        for name in sorted(reader.load_index(day_directory)):
+            data = reader.read(make_reference(day_folder, name))
+            if data is None:
+                continue
+            with open(os.path.join(output_directory, name), "wb") as f:
+                f.write(data)
+            count += 1
+    finally:
+        reader.close()
+    return count
+
+
+def main(argv):
+    if len(argv) == 3 and argv[0] == "export":
+        count = export_pack(argv[1], argv[2])
+        print(f"Đã xuất {count} ảnh ra {argv[2]}")
+        return 0
+    if len(argv) == 2 and argv[0] == "ls":
+        reader = PackReader(os.path.dirname(argv[1].rstrip("\\/")))
+        for name, (offset, length) in sorted(reader.load_index(argv[1]).items()):
+            print(f"{name}\t{offset}\t{length}")
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
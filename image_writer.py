@@ -0,0 +1,237 @@
+"""
+Ghi ảnh JPEG ở nền (không chặn GUI thread khi ổ cứng chậm)
+- Hàng đợi giới hạn + nhóm thread worker, cv2.imencode nhả GIL nên ảnh trước/sau encode song song
+- fsync theo lô (định kỳ) thay vì từng file
+- Lỗi ghi ảnh bằng chứng được báo bất đồng bộ qua signal write_failed để đánh dấu phiên trong DB
+  (lỗi ghi file chỉ mục / ảnh thu nhỏ chỉ ghi log: không ứng với ảnh nào của phiên)
+- pack_mode: ghi thêm vào images.pack của thư mục ngày thay vì từng file JPEG (xem image_pack.py)
+- thumbnail_width: tạo kèm ảnh thu nhỏ trong thư mục con thumbs/ của ngày (tra cứu nhanh)
+"""
+import os
+import queue
+import threading
+import time
+from typing import List
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from image_pack import PackWriter, fsync_directory, fsync_file
+
+THUMBNAIL_FOLDER = "thumbs"
+
+
+def thumbnail_path(path: str) -> str:
+    """Đường dẫn ảnh thu nhỏ của 1 ảnh: <thư mục ngày>/thumbs/<tên ảnh>"""
+    return os.path.join(os.path.dirname(path), THUMBNAIL_FOLDER, os.path.basename(path))
+
+
+def is_thumbnail_path(path: str) -> bool:
+    return os.path.basename(os.path.dirname(path)) == THUMBNAIL_FOLDER
+
+
+def make_thumbnail(frame: np.ndarray, width: int) -> np.ndarray:
+    """Thu nhỏ frame BGR về chiều rộng width (giữ tỉ lệ)"""
+    h, w = frame.shape[:2]
+    if w <= width:
+        return frame
+    return cv2.resize(frame, (width, max(1, int(h * width / w))), interpolation=cv2.INTER_AREA)
+
+
+class ImageWriter(QObject):
+    """Nhóm thread ghi ảnh, dùng chung cho mọi làn"""
+
+    # Signal: (đường dẫn ảnh bằng chứng, thông báo lỗi), emit từ thread worker
+    write_failed = pyqtSignal(str, str)
+
+    def __init__(self, workers: int = 2, queue_size: int = 32, jpeg_quality: int = 85,
+                 fsync_interval: float = 1.0, pack_mode: bool = False, thumbnail_width: int = 0,
+                 logger=None):
+        """
+        Args:
+            workers: Số thread encode/ghi file
+            queue_size: Số ảnh tối đa chờ ghi (đầy thì save từ chối thay vì chặn GUI)
+            jpeg_quality: Chất lượng JPEG (0-100)
+            fsync_interval: Chu kỳ fsync các file đã ghi (giây, 0 = không fsync)
+            pack_mode: Ghi ảnh vào pack theo ngày (đường dẫn submit = thư mục ngày/tên ảnh)
+            thumbnail_width: Chiều rộng ảnh thu nhỏ tạo kèm khi ghi (0 = không tạo, tạo khi xem)
+        """
+        super().__init__()
+        self.jpeg_quality = jpeg_quality
+        self.fsync_interval = fsync_interval
+        self.pack_mode = pack_mode
+        self.thumbnail_width = thumbnail_width
+        self._pack_writer = PackWriter() if pack_mode else None
+        self.logger = logger
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._submit_lock = threading.Lock()  # submit_all kiểm tra chỗ trống rồi mới đưa vào hàng đợi
+        self._pending_sync: List[str] = []
+        self._sync_lock = threading.Lock()
+        self._append_lock = threading.Lock()
+        self._created_dirs = set()
+        self._stop_event = threading.Event()
+        self.written = 0
+        self.failed = 0
+        self.thumbnail_failed = 0
+
+        self._workers = [threading.Thread(target=self._work, name=f"image-writer-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+        self._syncer = None
+        if fsync_interval > 0:
+            self._syncer = threading.Thread(target=self._sync_loop, name="image-fsync", daemon=True)
+            self._syncer.start()
+
+    def submit(self, path: str, frame: np.ndarray, timeout: float = 0.2) -> bool:
+        """
+        Đưa ảnh (BGR) vào hàng đợi ghi, trả về ngay.
+        Trả về False nếu hàng đợi đầy quá timeout giây (ổ cứng không theo kịp).
+        frame phải là bản copy riêng (không dùng lại sau khi submit).
+        """
+        return self._put((path, frame), timeout)
+
+    def append_line(self, path: str, line: str, timeout: float = 0.2) -> bool:
+        """Ghi thêm 1 dòng văn bản (UTF-8) vào cuối file ở nền (file chỉ mục)"""
+        return self._put((path, line), timeout)
+
+    def submit_all(self, items: List[tuple]) -> bool:
+        """
+        Đưa nhiều mục (path, frame BGR hoặc dòng chỉ mục) vào hàng đợi cùng lúc, không chờ:
+        hàng đợi không đủ chỗ cho tất cả thì không nhận mục nào (không để ảnh trước mồ côi khi ảnh sau bị từ chối)
+        """
+        with self._submit_lock:
+            if self._queue.maxsize and self._queue.maxsize - self._queue.qsize() < len(items):
+                return False
+            # Chỉ worker lấy ra trong lúc giữ lock: chỗ trống vừa kiểm tra không bị mục khác chiếm
+            for item in items:
+                self._queue.put_nowait(item)
+        return True
+
+    def _put(self, item: tuple, timeout: float) -> bool:
+        with self._submit_lock:
+            try:
+                self._queue.put(item, timeout=timeout)
+                return True
+            except queue.Full:
+                return False
+
+    def pending(self) -> int:
+        """Số ảnh đang chờ ghi"""
+        return self._queue.qsize()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            path, data = item
+            try:
+                if isinstance(data, str):
+                    self._append(path, data)
+                else:
+                    self._write(path, data)
+                    self.written += 1
+            except Exception as e:
+                if isinstance(data, str):
+                    self.failed += 1
+                    if self.logger:
+                        self.logger.error(f"Lỗi ghi chỉ mục {path}: {e}")
+                elif is_thumbnail_path(path):
+                    # Ảnh thu nhỏ tạo bù lúc xem: không thuộc phiên nào, lần xem sau tạo lại
+                    self.thumbnail_failed += 1
+                    if self.logger:
+                        self.logger.error(f"Lỗi ghi ảnh thu nhỏ {path}: {e}")
+                else:
+                    self.failed += 1
+                    if self.logger:
+                        self.logger.error(f"Lỗi ghi ảnh {path}: {e}")
+                    self.write_failed.emit(path, str(e))
+            finally:
+                self._queue.task_done()
+
+    def _ensure_directory(self, directory: str):
+        if directory not in self._created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._created_dirs.add(directory)
+
+    def _append(self, path: str, line: str):
+        self._ensure_directory(os.path.dirname(path))
+        with self._append_lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line.rstrip("\n") + "\n")
+        if self.fsync_interval > 0:
+            with self._sync_lock:
+                self._pending_sync.append(path)
+
+    def _write(self, path: str, frame: np.ndarray):
+        self._store(path, frame)
+        # Ảnh thu nhỏ (trừ khi chính path đã là ảnh thu nhỏ, ví dụ tạo bù lúc xem)
+        if self.thumbnail_width and not is_thumbnail_path(path):
+            try:
+                self._store(thumbnail_path(path), make_thumbnail(frame, self.thumbnail_width))
+            except Exception as e:
+                # Ảnh gốc đã ghi xong: không đánh dấu phiên lỗi, ảnh thu nhỏ được tạo bù khi xem
+                self.thumbnail_failed += 1
+                if self.logger:
+                    self.logger.error(f"Lỗi ghi ảnh thu nhỏ {path}: {e}")
+
+    def _store(self, path: str, frame: np.ndarray):
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("Không encode được ảnh JPEG")
+
+        self._ensure_directory(os.path.dirname(path))
+
+        if self._pack_writer is not None:
+            synced = self._pack_writer.append(os.path.dirname(path), os.path.basename(path), encoded.tobytes())
+        else:
+            # Ghi ra file tạm rồi đổi tên: không bao giờ để lại file JPEG ghi dở
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encoded.tobytes())
+            os.replace(tmp_path, path)
+            synced = (path,)
+        if self.fsync_interval > 0:
+            with self._sync_lock:
+                self._pending_sync.extend(synced)
+
+    def _sync_loop(self):
+        while not self._stop_event.wait(self.fsync_interval):
+            self._sync_pending()
+        self._sync_pending()
+
+    def _sync_pending(self):
+        """fsync các file đã ghi từ lần trước và thư mục chứa chúng"""
+        with self._sync_lock:
+            paths, self._pending_sync = self._pending_sync, []
+        directories = set()
+        for path in dict.fromkeys(paths):  # File chỉ mục có thể xuất hiện nhiều lần
+            try:
+                fsync_file(path)
+                directories.add(os.path.dirname(path))
+            except OSError as e:
+                self.failed += 1
+                if self.logger:
+                    self.logger.error(f"Lỗi fsync {path}: {e}")
+                # Chỉ file JPEG rời là ảnh bằng chứng; pack / chỉ mục / ảnh thu nhỏ không ứng với 1 phiên
+                if not self.pack_mode and path.lower().endswith(".jpg") and not is_thumbnail_path(path):
+                    self.write_failed.emit(path, f"fsync: {e}")
+        for directory in directories:
+            fsync_directory(directory)
+
+    def stop(self, timeout: float = 10.0):
+        """Ghi nốt các ảnh đang chờ, fsync rồi dừng các thread"""
+        deadline = time.monotonic() + timeout
+        for _ in self._workers:
+            try:
+                self._queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        self._stop_event.set()
+        if self._syncer is not None:
+            self._syncer.join(max(0.0, deadline - time.monotonic()))
@@ -0,0 +1,331 @@
+"""
+Spool cục bộ (SQLite WAL) để làn xe vẫn hoạt động khi PostgreSQL mất kết nối
+- Check-in/check-out được quyết định (chống quẹt 2 lần, tính phí) và ghi bền vào SQLite trước
+- Thread nền đẩy nhật ký sang PostgreSQL theo lô; mỗi sự kiện có event_id nên phát lại
+  sau sự cố không tạo bản ghi trùng
+- Bản sao danh sách thẻ tháng (CardRegistry) lưu trong SQLite để khởi động được khi mất mạng
+- Lần đầu bật spool: chỉ nhận quẹt thẻ sau khi đã nạp các phiên đang mở từ PostgreSQL
+- Chưa có danh sách thẻ tháng: lượt vào ghi là chưa phân loại, phân loại lại khi quẹt ra / khi đồng bộ
+Giả định: máy này là nơi duy nhất ghi phiên gửi xe vào DB.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from connection_supervisor import compute_backoff
+
+UNCLASSIFIED = ""  # vehicle_type của phiên vào khi chưa có danh sách thẻ tháng
+NOT_SEEDED_MESSAGE = "Đang tải phiên gửi xe từ máy chủ, vui lòng quẹt lại sau"
+
+
+class LocalSpool:
+    """Trạng thái bãi xe + nhật ký sự kiện trong SQLite (an toàn khi gọi từ nhiều thread)"""
+
+    def __init__(self, path: str, fee_calculator: Callable[[datetime, datetime, str], int],
+                 card_classifier: Callable[[str], Optional[bool]]):
+        """
+        Args:
+            path: File SQLite (ví dụ spool.db cạnh file .exe)
+            fee_calculator: Hàm tính phí (checkin_time, checkout_time, vehicle_type) -> số tiền
+            card_classifier: Hàm mã thẻ -> True nếu là thẻ tháng còn hiệu lực,
+                None nếu chưa có danh sách thẻ (CardRegistry.classify)
+        """
+        self.path = path
+        self.fee_calculator = fee_calculator
+        self.card_classifier = card_classifier
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # Quẹt thẻ đã báo thành công thì không mất khi mất điện
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS open_sessions (
+                card_id TEXT PRIMARY KEY,
+                event_id TEXT NOT NULL,
+                vehicle_type TEXT NOT NULL,
+                checkin_time TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                state INTEGER NOT NULL DEFAULT 0,  -- 0 = chờ đồng bộ, 1 = đã đồng bộ, -1 = lỗi dữ liệu
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS journal_pending_idx ON journal (state, id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        # Phiên mở tạo trước khi bật spool chỉ có trong PostgreSQL: chưa nạp thì không quyết định được
+        # chống quẹt 2 lần / tính phí, lượt "in" phát lại sẽ trùng phiên đang mở (sessions_open_card_key)
+        self.seeded = self.get_meta("seeded") is not None
+
+    def _append(self, kind: str, payload: dict, now: datetime):
+        self._conn.execute("INSERT INTO journal (kind, payload, created_at) VALUES (?, ?, ?)",
+                           (kind, json.dumps(payload, ensure_ascii=False), now.isoformat()))
+
+    # --- Nghiệp vụ (cùng kết quả như ParkingDatabase.check_in/check_out) ---
+    def check_in(self, card_id, img_front, img_rear):
+        if not self.seeded:
+            return False, NOT_SEEDED_MESSAGE
+        now = datetime.now()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                # 1. Anti-Passback (khóa chính card_id: không thể có 2 phiên mở)
+                if self._conn.execute("SELECT 1 FROM open_sessions WHERE card_id = ?", (card_id,)).fetchone():
+                    self._conn.execute("ROLLBACK")
+                    return False, f"Thẻ {card_id} chưa quẹt ra!"
+
+                # 2. Kiểm tra Thẻ Tháng (danh sách thẻ trong bộ nhớ, không truy vấn DB)
+                monthly = self.card_classifier(card_id)
+                if monthly is None:
+                    # Chưa có danh sách: không ghi nhầm xe tháng thành vãng lai, phân loại lại sau
+                    vehicle_type = UNCLASSIFIED
+                    msg_extra = "CHƯA PHÂN LOẠI THẺ"
+                else:
+                    vehicle_type = 'MONTH' if monthly else 'DAY'
+                    msg_extra = "XE THÁNG" if monthly else "VÃNG LAI"
+
+                # 3. Lưu trạng thái + nhật ký trong cùng 1 transaction
+                event_id = uuid.uuid4().hex
+                self._conn.execute("INSERT INTO open_sessions VALUES (?, ?, ?, ?)",
+                                   (card_id, event_id, vehicle_type, now.isoformat()))
+                self._append("in", {
+                    "event_id": event_id, "card_id": card_id, "vehicle_type": vehicle_type or None,
+                    "checkin_time": now.isoformat(), "img_front": img_front, "img_rear": img_rear,
+                }, now)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._rollback()
+                return False, f"Lỗi spool: {e}"
+        return True, f"Mời vào ({msg_extra})"
+
+    def check_out(self, card_id, img_front, img_rear):
+        if not self.seeded:
+            return False, NOT_SEEDED_MESSAGE, None
+        now = datetime.now()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                session = self._conn.execute("SELECT * FROM open_sessions WHERE card_id = ?",
+                                             (card_id,)).fetchone()
+                if not session:
+                    self._conn.execute("ROLLBACK")
+                    return False, f"Thẻ {card_id} chưa check-in!", None
+
+                checkin_time = datetime.fromisoformat(session["checkin_time"])
+                v_type = session["vehicle_type"]
+                if v_type == UNCLASSIFIED:
+                    monthly = self.card_classifier(card_id)
+                    if monthly is None:
+                        self._conn.execute("ROLLBACK")
+                        return False, f"Thẻ {card_id}: chưa có danh sách thẻ tháng, không tính được phí", None
+                    v_type = 'MONTH' if monthly else 'DAY'
+                fee = self.fee_calculator(checkin_time, now, v_type)
+
+                self._conn.execute("DELETE FROM open_sessions WHERE card_id = ?", (card_id,))
+                self._append("out", {
+                    "event_id": uuid.uuid4().hex, "checkin_event_id": session["event_id"],
+                    "card_id": card_id, "checkout_time": now.isoformat(),
+                    "img_front": img_front, "img_rear": img_rear, "price": fee, "vehicle_type": v_type,
+                }, now)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._rollback()
+                return False, f"Lỗi spool: {e}", None
+
+        info = {
+            "checkin_time": checkin_time.strftime("%d/%m %H:%M"),
+            "price": fee,
+            "type": v_type
+        }
+        return True, f"Phí: {fee}", info
+
+    def mark_image_error(self, image_path, error):
+        with self._lock:
+            try:
+                self._append("img_error", {"image_path": image_path, "error": error}, datetime.now())
+            except sqlite3.Error as e:
+                return False, f"Lỗi spool: {e}"
+        return True, "Đã ghi nhận lỗi ảnh (chờ đồng bộ)"
+
+    def _rollback(self):
+        try:
+            self._conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+    # --- Đồng bộ ---
+    def pending_events(self, limit: int) -> List[Tuple[int, str, dict]]:
+        """Các sự kiện chưa đồng bộ (cũ trước): [(id, kind, payload)]"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, kind, payload FROM journal WHERE state = 0 ORDER BY id LIMIT ?",
+                                      (limit,)).fetchall()
+        return [(row["id"], row["kind"], json.loads(row["payload"])) for row in rows]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM journal WHERE state = 0").fetchone()[0]
+
+    def mark_replicated(self, ids: List[int]):
+        with self._lock:
+            self._conn.execute(f"UPDATE journal SET state = 1 WHERE id IN ({','.join('?' * len(ids))})", ids)
+
+    def mark_failed(self, event_id: int, error: str):
+        """Sự kiện bị PostgreSQL từ chối (lỗi dữ liệu): giữ lại để kiểm tra, không chặn các sự kiện sau"""
+        with self._lock:
+            self._conn.execute("UPDATE journal SET state = -1, error = ? WHERE id = ?", (error, event_id))
+
+    def purge(self, keep_days: int):
+        """Xóa sự kiện đã đồng bộ cũ hơn keep_days ngày"""
+        cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat()
+        with self._lock:
+            self._conn.execute("DELETE FROM journal WHERE state = 1 AND created_at < ?", (cutoff,))
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def seed_open_sessions(self, sessions: List[dict]):
+        """Nạp phiên đang mở từ PostgreSQL (lần đầu bật spool), không ghi đè phiên đã có"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO open_sessions VALUES (?, ?, ?, ?)",
+                [(s["card_id"], s["checkin_event_id"], s["vehicle_type"], s["checkin_time"].isoformat())
+                 for s in sessions])
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('seeded', ?)", (datetime.now().isoformat(),))
+            self._conn.execute("COMMIT")
+            self.seeded = True
+
+    def save_cards(self, cards: List[dict]):
+        """Lưu bản sao danh sách thẻ tháng (CardRegistry.snapshot)"""
+        self.set_meta("cards", json.dumps(cards, ensure_ascii=False))
+
+    def load_cards(self) -> Optional[List[dict]]:
+        """Bản sao danh sách thẻ tháng đã lưu, None nếu chưa có"""
+        value = self.get_meta("cards")
+        return json.loads(value) if value else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SpoolReplicator(threading.Thread):
+    """Thread đẩy nhật ký spool sang PostgreSQL, thử lại với backoff khi mất kết nối"""
+
+    def __init__(self, db, spool: LocalSpool, batch_size: int = 200, sync_interval: float = 2.0,
+                 keep_days: int = 7, logger=None):
+        """
+        Args:
+            db: ParkingDatabase (replay_events, fetch_open_sessions)
+            sync_interval: Chu kỳ kiểm tra nhật ký khi không có sự kiện mới (giây)
+            keep_days: Số ngày giữ sự kiện đã đồng bộ trong spool
+            logger: ParkingLogger (sự kiện bị loại cần người vận hành xử lý tay)
+        """
+        super().__init__(name="db-spool-replicator", daemon=True)
+        self.db = db
+        self.spool = spool
+        self.batch_size = batch_size
+        self.sync_interval = sync_interval
+        self.keep_days = keep_days
+        self.logger = logger
+        self.parked = 0  # Số sự kiện bị loại vì lỗi dữ liệu (nằm trong journal với trạng thái lỗi)
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._next_purge = 0.0
+        self._failures = 0
+        self.online = None  # None = chưa thử kết nối lần nào
+
+    def wake(self):
+        """Có sự kiện mới: đồng bộ ngay thay vì chờ hết chu kỳ"""
+        self._wake.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self._wake.clear()
+            try:
+                synced = self._sync_once()
+            except Exception as e:
+                synced = False
+                self._log("error", f"Lỗi đồng bộ spool: {e}")
+            if synced:
+                self._set_online(True)
+                self._failures = 0
+                delay = self.sync_interval
+            else:
+                self._set_online(False)
+                self._failures += 1
+                delay = compute_backoff(self._failures, self.sync_interval, 60.0, 0.3)
+            self._wake.wait(delay)
+
+    def _set_online(self, online: bool):
+        if online != self.online:
+            if online:
+                self._log("info", f"PostgreSQL đã kết nối, còn {self.spool.pending_count()} sự kiện chờ đồng bộ")
+            else:
+                self._log("warning", "Mất kết nối PostgreSQL: check-in/check-out ghi tạm vào spool cục bộ")
+            self.online = online
+
+    def _sync_once(self) -> bool:
+        """Một lượt: nạp phiên mở (lần đầu) -> đẩy nhật ký. False nếu mất kết nối"""
+        if self.spool.get_meta("seeded") is None:
+            success, sessions = self.db.fetch_open_sessions()
+            if not success:
+                return False
+            self.spool.seed_open_sessions(sessions)
+
+        now = time.monotonic()
+        while not self._stop_event.is_set():
+            events = self.spool.pending_events(self.batch_size)
+            if not events:
+                break
+            success, msg, data_error = self.db.replay_events(events)
+            if success:
+                self.spool.mark_replicated([event[0] for event in events])
+                continue
+            if not data_error:
+                return False
+            # Có sự kiện lỗi dữ liệu trong lô: phát lại từng sự kiện để tách ra
+            for event in events:
+                success, msg, data_error = self.db.replay_events([event])
+                if success:
+                    self.spool.mark_replicated([event[0]])
+                elif data_error:
+                    self.parked += 1
+                    self._log("error", f"Spool: sự kiện {event[0]} ({event[1]}) không ghi được vào PostgreSQL, "
+                                       f"cần kiểm tra tay: {msg} - dữ liệu: {event[2]}")
+                    self.spool.mark_failed(event[0], str(msg))
+                else:
+                    return False
+
+        if now >= self._next_purge:
+            self.spool.purge(self.keep_days)
+            self._next_purge = now + 3600
+        return True
+
+    def _log(self, level: str, message: str):
+        if self.logger:
+            getattr(self.logger, level)(message)
+        else:
+            print(message)
+
+    def stop(self, timeout: float = 5.0):
+        """Dừng thread (sự kiện chưa đồng bộ vẫn nằm trong spool, đẩy tiếp khi khởi động lại)"""
+        self._stop_event.set()
+        self._wake.set()
+        self.join(timeout)
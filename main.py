@@ -2,9 +2,11 @@ import sys
 import os
 import ctypes
 import logging
+import multiprocessing
 from PyQt5.QtWidgets import QApplication, QMessageBox
 
 from config_manager import ConfigManager
+from db_migrations import MigrationError
 from logger import ParkingLogger
 from main_window import MainWindow
 
@@ -45,10 +47,17 @@ def main():
         window.show()
         sys.exit(app.exec_())
     
+    except MigrationError as e:
+        # Schema cũ/dở dang: không chạy tiếp để tránh ghi phiên sai cấu trúc (lỗi đã ghi log trong init_db)
+        QMessageBox.critical(None, "Lỗi cơ sở dữ liệu",
+                             f"{e}\n\nỨng dụng sẽ thoát. Kiểm tra kết nối/quyền trên PostgreSQL rồi khởi động lại.")
+        sys.exit(1)
     except Exception as e:
         logger.error(f"Crash: {str(e)}")
         QMessageBox.critical(None, "Lỗi nghiêm trọng", str(e))
         sys.exit(1)
 
 if __name__ == "__main__":
+    # Cần cho process decode camera khi đóng gói .exe (PyInstaller)
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
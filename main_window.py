@@ -1,20 +1,31 @@
-import time
+import logging
+import os
+from collections import OrderedDict
 from datetime import datetime
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QLabel, QFrame, QAction, QFileDialog, QMessageBox, QMenuBar)
 from PyQt5.QtCore import Qt, pyqtSlot, QTimer
-from PyQt5.QtGui import QFont, QKeyEvent
+from PyQt5.QtGui import QFont, QKeyEvent, QKeySequence
 
-from camera_widget import CameraWidget
-from camera_thread import CameraThread
+from camera_manager import CameraManager
+from capture_worker import CaptureWorker
 from config_manager import ConfigManager
 from file_manager import FileManager
+from image_writer import ImageWriter
 from logger import ParkingLogger
 from sound_player import SoundPlayer
+from storage_maintenance import StorageMaintenance
 
 # Import module Database & Serial
 from database import ParkingDatabase
+from db_service import DbService
 from serial_manager import SerialThread
+from report_dialog import ReportDialog
+from session_viewer import SessionViewerDialog
+from thumbnail_cache import ThumbnailCache
+
+# DB quá hạn nhưng lệnh check-in/check-out có thể vẫn ghi xong: không mời quẹt lại (tránh ghi 2 lần)
+STILL_PENDING_TEXT = "Máy chủ chậm, vẫn đang chờ ghi..."
 
 class MainWindow(QMainWindow):
     """
@@ -32,19 +43,45 @@ class MainWindow(QMainWindow):
         
         # 1. Kết nối Database PostgreSQL
         db_config = config_manager.get_database_config()
-        self.db = ParkingDatabase(db_config)
+        self.db = ParkingDatabase(db_config, config_manager.get_spool_config(),
+                                  config_manager.get_database_pool_config(),
+                                  config_manager.get_card_registry_config(),
+                                  config_manager.get_report_config(),
+                                  logger)
+        # Mọi lệnh DB chạy ngoài GUI thread (mỗi làn 1 hàng đợi)
+        pool_cfg = config_manager.get_database_pool_config()
+        self.db_service = DbService(self.db, pool_cfg["request_timeout"], self, logger)
+        self.db_service.late_result.connect(
+            lambda operation, result: self.logger.warning(f"Lệnh DB {operation} xong sau khi đã báo quá hạn: {result}"))
+        self.query_timeout = pool_cfg["query_timeout"]
         
         # 2. Khởi tạo tiện ích
         sound_file = config_manager.get("sound_file")
         self.sound_player = SoundPlayer(sound_file)
         
         save_dir = config_manager.get_save_directory()
-        self.file_manager = FileManager(save_dir, logger)
-        
-        # 3. Quản lý Thread
-        self.camera_threads = {}
-        self.camera_widgets = {}
+        storage_cfg = config_manager.get_storage_config()
+        image_writer = ImageWriter(workers=storage_cfg["writer_threads"],
+                                   queue_size=storage_cfg["write_queue_size"],
+                                   jpeg_quality=storage_cfg["jpeg_quality"],
+                                   fsync_interval=storage_cfg["fsync_interval"],
+                                   pack_mode=storage_cfg["backend"] == "pack",
+                                   thumbnail_width=storage_cfg["thumbnail_width"] if storage_cfg["thumbnail_on_save"] else 0,
+                                   logger=logger)
+        image_writer.write_failed.connect(self.on_image_write_failed)
+        self.file_manager = FileManager(save_dir, logger, image_writer)
+        # Nén lại / xóa ảnh cũ, giữ dung lượng trống (thread nền ưu tiên thấp)
+        self.storage_maintenance = StorageMaintenance(save_dir, storage_cfg, logger, image_writer)
+        self.storage_maintenance.start()
+        self.thumbnail_cache = ThumbnailCache(self.file_manager, storage_cfg["thumbnail_cache_mb"],
+                                              storage_cfg["thumbnail_width"])
+        
+        # 3. Quản lý Thread (topology làn/camera/đầu đọc lấy từ config)
+        self.lanes = {lane["key"]: lane for lane in config_manager.get_lanes()}
+        self.camera_manager = CameraManager(config_manager, logger)
         self.serial_threads = []
+        self.capture_workers = set()  # Giữ tham chiếu tới CaptureWorker đang chạy
+        self.image_lanes = OrderedDict()  # Tham chiếu ảnh (lưu trong DB) -> làn (báo lỗi ghi ảnh theo hàng đợi của làn)
         
         # Biến UI
         self.info_labels = {} 
@@ -56,6 +93,16 @@ class MainWindow(QMainWindow):
         self.clock_timer.start(1000) # Check mỗi giây
         
         self.last_report_date = None # Tránh xuất lặp lại
+        
+        # 5. Timer ghi telemetry camera + độ trễ DB ra log
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(self.camera_manager.log_stats)
+        self.stats_timer.timeout.connect(lambda: self.logger.info(self.db.pool.format_stats()))
+        self.stats_timer.timeout.connect(lambda: self.logger.info(self.db.card_registry.format_stats()))
+        self.stats_timer.timeout.connect(lambda: self.logger.info(self.db_service.format_stats()))
+        stats_interval = config_manager.get_camera_config()["stats_log_interval"]
+        if stats_interval:
+            self.stats_timer.start(int(stats_interval * 1000))
 
         self.init_ui()
         self.init_cameras()
@@ -74,9 +121,18 @@ class MainWindow(QMainWindow):
         
         sys_menu = menubar.addMenu('Hệ Thống')
         
-        import_action = QAction('Nhập danh sách thẻ tháng (CSV)', self)
-        import_action.triggered.connect(self.import_cards)
-        sys_menu.addAction(import_action)
+        self.import_action = QAction('Nhập danh sách thẻ tháng (CSV)', self)
+        self.import_action.triggered.connect(self.import_cards)
+        sys_menu.addAction(self.import_action)
+
+        self.report_action = QAction('Xuất báo cáo (ngày / tuần / tháng / ca)', self)
+        self.report_action.triggered.connect(self.export_report)
+        sys_menu.addAction(self.report_action)
+
+        viewer_action = QAction('Tra cứu ảnh phiên gửi xe', self)
+        viewer_action.setShortcut(QKeySequence("Ctrl+F"))
+        viewer_action.triggered.connect(self.open_session_viewer)
+        sys_menu.addAction(viewer_action)
         
         # === GIAO DIỆN CHÍNH ===
         central_widget = QWidget()
@@ -92,26 +148,65 @@ class MainWindow(QMainWindow):
         content_layout.setSpacing(10)
         content_layout.setContentsMargins(10, 10, 10, 10)
         
-        # LÀN RA (Trái)
-        self.lane_ra_ui = self.create_lane_panel("RA", "LÀN XE RA", "#FF4444")
-        content_layout.addWidget(self.lane_ra_ui, 1)
-        
-        # LÀN VÀO (Phải)
-        self.lane_vao_ui = self.create_lane_panel("VAO", "LÀN XE VÀO", "#4488FF")
-        content_layout.addWidget(self.lane_vao_ui, 1)
+        # Các làn xe theo thứ tự khai báo trong config (mặc định: RA trái, VÀO phải)
+        self.camera_manager.build(list(self.lanes.values()), self)
+        for lane in self.lanes.values():
+            content_layout.addWidget(self.create_lane_panel(lane), 1)
         
         main_layout.addWidget(content_widget, 1)
 
     def import_cards(self):
         """Nhập thẻ tháng từ CSV"""
         fname, _ = QFileDialog.getOpenFileName(self, 'Chọn file CSV', '', 'CSV Files (*.csv)')
-        if fname:
-            success, msg = self.db.import_from_csv(fname)
-            if success:
-                QMessageBox.information(self, "Thành công", msg)
-                self.logger.info(f"Import CSV thành công: {fname}")
-            else:
-                QMessageBox.critical(self, "Lỗi", msg)
+        if not fname:
+            return
+        answer = QMessageBox.question(
+            self, "Nhập thẻ tháng",
+            "File là danh sách thẻ tháng ĐẦY ĐỦ?\n"
+            "Chọn Yes để khóa các thẻ đang hoạt động không có trong file.",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+
+        self.import_action.setEnabled(False)
+        self.db_service.submit("background", "import_csv", self.db.import_from_csv, fname, answer == QMessageBox.Yes,
+                               callback=lambda result: self.on_cards_imported(fname, *result),
+                               failure=lambda msg: (False, msg), timeout=0)
+
+    def on_cards_imported(self, fname, success, msg):
+        self.import_action.setEnabled(True)
+        if success:
+            QMessageBox.information(self, "Thành công", msg)
+            self.logger.info(f"Import CSV thành công: {fname} - {msg}")
+        else:
+            QMessageBox.critical(self, "Lỗi", msg)
+
+    def export_report(self):
+        """Xuất báo cáo theo kỳ chọn trong hộp thoại (chạy nền, không chặn làn xe)"""
+        report_cfg = self.config_manager.get_report_config()
+        dialog = ReportDialog(report_cfg["shifts"], report_cfg["format"], self)
+        if not dialog.exec_():
+            return
+        kind, day, shift, fmt = dialog.selection()
+        self.report_action.setEnabled(False)
+        self.db_service.submit("background", "report", self.db.export_report, kind, day, shift, fmt,
+                               callback=lambda result: self.on_manual_report_done(*result),
+                               failure=lambda msg: (False, msg), timeout=0)
+
+    def on_manual_report_done(self, success, msg):
+        self.report_action.setEnabled(True)
+        self.on_report_done(success, msg)
+        if success:
+            QMessageBox.information(self, "Xuất báo cáo", msg)
+        else:
+            QMessageBox.critical(self, "Lỗi", msg)
+
+    def open_session_viewer(self):
+        """Tra cứu ảnh vào/ra của phiên gửi xe (khi khách khiếu nại lúc ra)"""
+        dialog = SessionViewerDialog(self.db_service, self.file_manager, self.thumbnail_cache,
+                                     self.query_timeout, self)
+        dialog.exec_()
+        stats = self.thumbnail_cache.stats()
+        self.logger.info(f"Cache ảnh thu nhỏ: {stats['count']} ảnh, {stats['memory_mb']:.1f} MB, "
+                         f"tỉ lệ trúng {stats['hit_rate'] * 100:.0f}%")
 
     def create_header(self):
         header = QFrame()
@@ -133,7 +228,9 @@ class MainWindow(QMainWindow):
         
         return header
 
-    def create_lane_panel(self, lane_key, title, color_code):
+    def create_lane_panel(self, lane):
+        lane_key = lane["key"]
+        color_code = lane["color"]
         panel = QFrame()
         panel.setFrameStyle(QFrame.Box)
         self.status_frames[lane_key] = panel 
@@ -141,20 +238,14 @@ class MainWindow(QMainWindow):
         
         layout = QVBoxLayout(panel)
         
-        lbl_title = QLabel(title)
+        lbl_title = QLabel(lane["title"])
         lbl_title.setAlignment(Qt.AlignCenter)
         lbl_title.setFont(QFont("Arial", 16, QFont.Bold))
         lbl_title.setStyleSheet(f"background-color: {color_code}; color: white; padding: 5px;")
         layout.addWidget(lbl_title)
         
-        cam_front = CameraWidget(f"{lane_key.lower()}_front", "CAM TRƯỚC", self)
-        cam_rear = CameraWidget(f"{lane_key.lower()}_rear", "CAM SAU", self)
-        
-        self.camera_widgets[f"{lane_key.lower()}_front"] = cam_front
-        self.camera_widgets[f"{lane_key.lower()}_rear"] = cam_rear
-        
-        layout.addWidget(cam_front, 1)
-        layout.addWidget(cam_rear, 1)
+        for cam_widget in self.camera_manager.get_lane_widgets(lane_key):
+            layout.addWidget(cam_widget, 1)
         
         # Khu vực thông tin
         info_group = QFrame()
@@ -175,6 +266,7 @@ class MainWindow(QMainWindow):
         info_layout.addWidget(lbl_card_code)
         info_layout.addWidget(lbl_status)
         info_layout.addWidget(lbl_price)
+        layout.addWidget(info_group)
         
         self.info_labels[lane_key] = {
             "code": lbl_card_code,
@@ -183,7 +275,8 @@ class MainWindow(QMainWindow):
         }
         
         # Nút bấm thủ công (Backup)
-        btn_manual = QPushButton(f"CHỤP THỦ CÔNG ({'SPACE' if lane_key == 'RA' else 'ENTER'})")
+        hotkey_text = f" ({lane['hotkey'].upper()})" if lane["hotkey"] else ""
+        btn_manual = QPushButton(f"CHỤP THỦ CÔNG{hotkey_text}")
         btn_manual.setStyleSheet(f"background-color: {color_code}; font-weight: bold; padding: 10px;")
         btn_manual.clicked.connect(lambda: self.process_transaction(lane_key, "MANUAL_TRIGGER"))
         layout.addWidget(btn_manual)
@@ -191,32 +284,18 @@ class MainWindow(QMainWindow):
         return panel
 
     def init_cameras(self):
-        camera_keys = ["ra_front", "ra_rear", "vao_front", "vao_rear"]
-        for key in camera_keys:
-            url = self.config_manager.get_rtsp_url(key)
-            if url:
-                thread = CameraThread(url, key)
-                thread.status_changed.connect(lambda status, k=key: self.on_camera_status(status, k))
-                self.camera_threads[key] = thread
-                if key in self.camera_widgets:
-                    self.camera_widgets[key].set_camera_thread(thread)
-                thread.start()
+        for key, thread in self.camera_manager.camera_threads.items():
+            thread.status_changed.connect(lambda status, k=key: self.on_camera_status(status, k))
+        self.camera_manager.start()
 
     def init_serial_readers(self):
-        serial_cfg = self.config_manager.get_serial_config()
-        if serial_cfg.get("port_in"):
-            t_in = SerialThread(serial_cfg["port_in"], serial_cfg["baud_rate"], "VAO")
-            t_in.rfid_scanned.connect(self.on_rfid_scanned)
-            t_in.error_occurred.connect(lambda msg: self.logger.error(msg))
-            self.serial_threads.append(t_in)
-            t_in.start()
-            
-        if serial_cfg.get("port_out"):
-            t_out = SerialThread(serial_cfg["port_out"], serial_cfg["baud_rate"], "RA")
-            t_out.rfid_scanned.connect(self.on_rfid_scanned)
-            t_out.error_occurred.connect(lambda msg: self.logger.error(msg))
-            self.serial_threads.append(t_out)
-            t_out.start()
+        for lane in self.lanes.values():
+            for reader in lane["readers"]:
+                thread = SerialThread(reader["port"], reader.get("baud_rate", 19200), lane["key"])
+                thread.rfid_scanned.connect(self.on_rfid_scanned)
+                thread.error_occurred.connect(lambda msg: self.logger.error(msg))
+                self.serial_threads.append(thread)
+                thread.start()
 
     @pyqtSlot(str, str)
     def on_rfid_scanned(self, lane, card_code):
@@ -227,32 +306,89 @@ class MainWindow(QMainWindow):
     def process_transaction(self, lane, card_code):
         """Xử lý logic chính: Chụp ảnh -> Lưu File -> Gọi Database -> Hiện Popup"""
         
-        # 1. Chụp ảnh từ Camera
-        front_key = f"{lane.lower()}_front"
-        rear_key = f"{lane.lower()}_rear"
-        img_front = self.camera_widgets[front_key].get_current_frame()
-        img_rear = self.camera_widgets[rear_key].get_current_frame()
-        
-        if not img_front or not img_rear:
+        # 1. Chọn ảnh nét nhất quanh lúc quẹt thẻ (chạy ngoài GUI thread)
+        if lane not in self.lanes:
+            self.logger.warning(f"Làn không có trong cấu hình: {lane}")
+            return
+        camera_cfg = self.config_manager.get_camera_config()
+        front_thread, rear_thread = self.camera_manager.get_capture_threads(lane)
+        worker = CaptureWorker(
+            lane, card_code,
+            front_thread,
+            rear_thread,
+            pre_trigger=camera_cfg["pre_trigger"],
+            post_trigger=camera_cfg["post_trigger"],
+            budget=camera_cfg["selection_budget_ms"] / 1000.0,
+            analysis_width=camera_cfg["analysis_width"],
+            max_skew=camera_cfg["max_pair_skew_ms"] / 1000.0,
+            max_age=camera_cfg["max_frame_age_ms"] / 1000.0
+        )
+        worker.capture_done.connect(self.on_capture_done)
+        worker.finished.connect(lambda w=worker: self.capture_workers.discard(w))
+        self.capture_workers.add(worker)
+        worker.start()
+
+    @pyqtSlot(str, str, float, object, object, str)
+    def on_capture_done(self, lane, card_code, trigger, front, rear, error):
+        """Nhận ảnh đã chọn từ CaptureWorker -> Lưu File -> Gọi Database"""
+        if front is None or rear is None:
+            self.logger.warning(f"Thẻ {card_code}: {error}", lane)
             self.show_message(lane, "LỖI CAMERA", "Mất tín hiệu hình ảnh!", False)
             return
+        if error:
+            # Không lưu ảnh cũ/lệch thời gian: báo để quẹt lại khi camera ổn định
+            self.logger.warning(f"Thẻ {card_code}: {error} (trước {(front[1] - trigger) * 1000:+.0f} ms, "
+                                f"sau {(rear[1] - trigger) * 1000:+.0f} ms)", lane)
+            self.show_message(lane, "ẢNH KHÔNG HỢP LỆ", f"{error}. Vui lòng quẹt lại!", False)
+            return
+        
+        self.logger.info(f"Ảnh chụp lệch so với lúc quẹt thẻ: trước {(front[1] - trigger) * 1000:+.0f} ms "
+                         f"(điểm nét {front[2]:.0f}), sau {(rear[1] - trigger) * 1000:+.0f} ms "
+                         f"(điểm nét {rear[2]:.0f})", lane)
 
-        # 2. Lưu ảnh (Format tên file: HH-MM-SS_DD-MM-YYYY...)
-        success, path_front, path_rear = self.file_manager.save_capture(lane, card_code, img_front, img_rear)
+        # 2. Lưu ảnh (tên file: HH-MM-SS-mmm_DD-MM-YYYY_LÀN_STT_THẺ...), ghi file ở nền
+        success, path_front, path_rear = self.file_manager.save_capture(lane, card_code, front[0], rear[0])
         if not success:
             self.show_message(lane, "LỖI Ổ CỨNG", "Không lưu được file ảnh", False)
             return
 
         # 3. Xử lý nghiệp vụ
-        if lane == "VAO":
-            self.handle_check_in(card_code, path_front, path_rear)
+        for path in (path_front, path_rear):
+            self.image_lanes[path] = lane
+        while len(self.image_lanes) > 256:
+            self.image_lanes.popitem(last=False)
+        if self.lanes[lane]["direction"] == "in":
+            self.handle_check_in(lane, card_code, path_front, path_rear)
         else:
-            self.handle_check_out(card_code, path_front, path_rear)
+            self.handle_check_out(lane, card_code, path_front, path_rear)
+
+    @pyqtSlot(str, str)
+    def on_image_write_failed(self, path, error):
+        """Thread ghi ảnh báo lỗi (sau khi phiên đã ghi DB): đánh dấu phiên để kiểm tra lại"""
+        self.logger.log_file_error(f"Không ghi được ảnh {path}: {error}")
+        # Cùng hàng đợi với làn chụp ảnh: chạy sau lệnh check-in/check-out tạo phiên.
+        # Writer báo đường dẫn file, image_lanes giữ tham chiếu (pack:// ở chế độ pack)
+        reference = self.file_manager.reference_for(path)
+        lane = self.image_lanes.pop(reference, "background")
+        self.db_service.submit(lane, "mark_image_error", self.db.mark_image_error,
+                               reference, error,
+                               callback=lambda result: self.on_image_error_marked(path, *result),
+                               failure=lambda msg: (False, msg), timeout=0)
 
-    def handle_check_in(self, card_code, img_front, img_rear):
-        """Xử lý xe vào"""
-        success, msg = self.db.check_in(card_code, img_front, img_rear)
-        self.show_message("VAO", card_code, msg, success)
+    def on_image_error_marked(self, path, success, msg):
+        if not success:
+            self.logger.warning(f"Không đánh dấu được lỗi ảnh {path}: {msg}")
+
+    def handle_check_in(self, lane, card_code, img_front, img_rear):
+        """Xử lý xe vào (gọi DB ở nền, hiện trạng thái chờ)"""
+        self.show_pending(lane, card_code)
+        self.db_service.submit(lane, "check_in", self.db.check_in, card_code, img_front, img_rear,
+                               callback=lambda result: self.on_check_in_done(lane, card_code, *result),
+                               failure=lambda msg: (False, msg),
+                               still_pending=lambda: self.show_pending(lane, card_code, STILL_PENDING_TEXT))
+
+    def on_check_in_done(self, lane, card_code, success, msg):
+        self.show_message(lane, card_code, msg, success)
         
         if success:
             # Phát loa Bíp xác nhận
@@ -262,10 +398,15 @@ class MainWindow(QMainWindow):
             # self.sound_player.play_error() 
             pass
 
-    def handle_check_out(self, card_code, img_front, img_rear):
-        """Xử lý xe ra - Có Popup thu tiền"""
-        success, msg, info = self.db.check_out(card_code, img_front, img_rear)
-        
+    def handle_check_out(self, lane, card_code, img_front, img_rear):
+        """Xử lý xe ra - Có Popup thu tiền (gọi DB ở nền, hiện trạng thái chờ)"""
+        self.show_pending(lane, card_code)
+        self.db_service.submit(lane, "check_out", self.db.check_out, card_code, img_front, img_rear,
+                               callback=lambda result: self.on_check_out_done(lane, card_code, *result),
+                               failure=lambda msg: (False, msg, None),
+                               still_pending=lambda: self.show_pending(lane, card_code, STILL_PENDING_TEXT))
+
+    def on_check_out_done(self, lane, card_code, success, msg, info):
         if success:
             price = info.get('price', 0)
             v_type = info.get('type', 'DAY')
@@ -273,7 +414,7 @@ class MainWindow(QMainWindow):
             
             # Hiển thị thông tin lên giao diện trước
             msg_full = f"{type_display}\nVào: {info['checkin_time']}"
-            self.show_message("RA", card_code, msg_full, True, price)
+            self.show_message(lane, card_code, msg_full, True, price)
             self.sound_player.play_capture_sound()
             
             # === LOGIC POPUP THU TIỀN ===
@@ -282,7 +423,7 @@ class MainWindow(QMainWindow):
                 self.show_payment_popup(price, card_code)
             
         else:
-            self.show_message("RA", card_code, msg, False)
+            self.show_message(lane, card_code, msg, False)
 
     def show_payment_popup(self, price, card_code):
         """Hiển thị hộp thoại thu tiền bắt buộc"""
@@ -330,11 +471,22 @@ class MainWindow(QMainWindow):
         # Reset màu sau 5s (hoặc giữ nguyên nếu muốn)
         QTimer.singleShot(10000, lambda: self.reset_ui(lane))
 
+    def show_pending(self, lane, code, status="Đang xử lý..."):
+        """Đang chờ kết quả DB: viền vàng, không tự reset"""
+        labels = self.info_labels.get(lane)
+        frame = self.status_frames.get(lane)
+        if not labels or not frame: return
+        labels["code"].setText(f"Mã: {code}")
+        labels["status"].setText(status)
+        labels["status"].setStyleSheet("color: #FFD700;")
+        labels["price"].setText("")
+        frame.setStyleSheet("border: 4px solid #FFD700; background-color: #252525;")
+
     def reset_ui(self, lane):
         frame = self.status_frames.get(lane)
         labels = self.info_labels.get(lane)
         if frame:
-            color = "#FF4444" if lane == "RA" else "#4488FF"
+            color = self.lanes[lane]["color"]
             frame.setStyleSheet(f"border: 2px solid {color}; background-color: #252525;")
         if labels:
             labels["code"].setText("Mã thẻ: ---")
@@ -355,27 +507,53 @@ class MainWindow(QMainWindow):
             # Chỉ xuất 1 lần mỗi ngày
             if self.last_report_date != current_date_str:
                 self.logger.info("Bắt đầu xuất báo cáo tự động...")
-                success, msg = self.db.export_daily_report()
-                if success:
-                    self.logger.info(msg)
-                else:
-                    self.logger.error(msg)
+                self.db_service.submit("background", "report", self.db.export_daily_report,
+                                       callback=lambda result: self.on_report_done(*result),
+                                       failure=lambda msg: (False, msg), timeout=0)
                 
                 self.last_report_date = current_date_str
+
+    def on_report_done(self, success, msg):
+        if success:
+            self.logger.info(msg)
+        else:
+            self.logger.error(msg)
     
     def on_camera_status(self, status, key):
-        pass
+        if status == "connected":
+            self.logger.log_rtsp_connection(key, True)
+        elif status in ("disconnected", "error"):
+            stats = self.camera_manager.camera_threads[key].stats
+            self.logger.log_rtsp_connection(key, False, f"{status}, đã reconnect {stats.reconnects} lần")
 
     def keyPressEvent(self, event: QKeyEvent):
-        # Phím tắt thủ công (dự phòng)
-        if event.key() == Qt.Key_Space:
-            self.process_transaction("RA", "TEST_KEY_RA")
-        elif event.key() == Qt.Key_Return or event.key() == Qt.Key_Enter:
-            self.process_transaction("VAO", "TEST_KEY_VAO")
-        else:
-            super().keyPressEvent(event)
+        # Phím tắt thủ công (dự phòng), khai báo bằng "hotkey" của từng làn
+        for lane in self.lanes.values():
+            if self._matches_hotkey(event, lane["hotkey"]):
+                self.process_transaction(lane["key"], f"TEST_KEY_{lane['key']}")
+                return
+        super().keyPressEvent(event)
+
+    @staticmethod
+    def _matches_hotkey(event: QKeyEvent, hotkey):
+        if not hotkey:
+            return False
+        if hotkey.lower() == "enter":
+            return event.key() in (Qt.Key_Return, Qt.Key_Enter)
+        return event.key() == QKeySequence(hotkey)[0]
 
     def closeEvent(self, event):
         for t in self.serial_threads: t.stop()
-        for t in self.camera_threads.values(): t.stop()
-        event.accept()
\ No newline at end of file
+        stuck_cameras = self.camera_manager.stop()
+        self.storage_maintenance.stop()
+        self.thumbnail_cache.stop()
+        self.file_manager.close()
+        self.db_service.stop()  # Lệnh đang chạy (nhập CSV, báo cáo) xong trước khi đóng pool
+        self.db.close()
+        event.accept()
+        if stuck_cameras:
+            # Đường thoát cuối: ảnh/DB/log đã ghi xong; QThread camera còn chạy sẽ làm Qt abort khi bị hủy,
+            # nên kết thúc process ngay thay vì để Python dọn dẹp
+            self.logger.error(f"Thoát cưỡng bức: camera {', '.join(stuck_cameras)} không dừng được")
+            logging.shutdown()
+            os._exit(1)
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+Điều chỉnh tốc độ decode preview theo chuyển động trong khung hình
+Làn xe trống (ban đêm) thì giảm về idle_fps, có chuyển động hoặc quẹt thẻ thì trở lại tốc độ đầy đủ.
+Module này không import PyQt5 (dùng chung cho thread và process decode).
+"""
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Phát hiện chuyển động trên ảnh xám thu nhỏ (absdiff 2 frame preview liên tiếp)"""
+
+    def __init__(self, active_fps: float, idle_fps: float = 2.0, idle_after: float = 10.0,
+                 pixel_threshold: int = 15, area_ratio: float = 0.005, analysis_width: int = 64):
+        """
+        Args:
+            active_fps: Tốc độ preview khi có chuyển động
+            idle_fps: Tốc độ preview khi khung hình tĩnh
+            idle_after: Số giây không có chuyển động trước khi giảm tốc độ
+            pixel_threshold: Chênh lệch độ sáng (0-255) để coi 1 điểm ảnh là thay đổi
+            area_ratio: Tỉ lệ điểm ảnh thay đổi tối thiểu để coi là có chuyển động
+            analysis_width: Độ rộng (xấp xỉ) ảnh xám dùng để so sánh
+        """
+        self.active_interval = 1.0 / active_fps if active_fps > 0 else 0
+        self.idle_interval = 1.0 / idle_fps if idle_fps > 0 else self.active_interval
+        self.idle_after = idle_after
+        self.pixel_threshold = pixel_threshold
+        self.area_ratio = area_ratio
+        self.analysis_width = analysis_width
+        self.last_motion = 0.0
+        self.motion_level = 0.0
+        self._previous = None
+
+    def _small_gray(self, frame: np.ndarray) -> np.ndarray:
+        # Lấy mẫu cách bước (view, không copy toàn frame) rồi mới chuyển xám
+        step = max(1, frame.shape[1] // self.analysis_width)
+        small = np.ascontiguousarray(frame[::step, ::step])
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.int16)
+
+    def update(self, frame: np.ndarray, now: float) -> bool:
+        """Đưa frame preview mới vào, trả về True nếu phát hiện chuyển động"""
+        gray = self._small_gray(frame)
+        previous, self._previous = self._previous, gray
+        if previous is None or previous.shape != gray.shape:
+            self.last_motion = now
+            return True
+        self.motion_level = float((np.abs(gray - previous) > self.pixel_threshold).mean())
+        if self.motion_level >= self.area_ratio:
+            self.last_motion = now
+            return True
+        return False
+
+    def wake(self, now: float):
+        """Quẹt thẻ/yêu cầu chụp: trở lại tốc độ đầy đủ ngay"""
+        self.last_motion = max(self.last_motion, now)
+
+    def is_idle(self, now: float) -> bool:
+        return now - self.last_motion > self.idle_after
+
+    def interval(self, now: float) -> float:
+        """Chu kỳ preview hiện tại (giây)"""
+        return self.idle_interval if self.is_idle(now) else self.active_interval
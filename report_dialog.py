@@ -0,0 +1,63 @@
+"""
+Hộp thoại chọn báo cáo cần xuất: theo ngày, tuần, tháng hoặc ca làm việc (xem report_engine.py)
+"""
+from typing import List
+
+from PyQt5.QtCore import QDate
+from PyQt5.QtWidgets import (QDialog, QFormLayout, QComboBox, QDateEdit, QDialogButtonBox)
+
+KIND_LABELS = [
+    ("day", "Ngày"),
+    ("week", "Tuần (thứ Hai - Chủ Nhật)"),
+    ("month", "Tháng"),
+    ("shift", "Ca làm việc"),
+]
+
+
+class ReportDialog(QDialog):
+    """Chọn loại báo cáo, ngày, ca và định dạng file"""
+
+    def __init__(self, shifts: List[dict], default_format: str = "xlsx", parent=None):
+        super().__init__(parent)
+        self.shifts = shifts
+        self.setWindowTitle("Xuất báo cáo")
+
+        layout = QFormLayout(self)
+        self.cmb_kind = QComboBox()
+        for kind, label in KIND_LABELS:
+            if kind == "shift" and not shifts:
+                continue
+            self.cmb_kind.addItem(label, kind)
+        self.cmb_kind.currentIndexChanged.connect(self._update_shift_enabled)
+        layout.addRow("Loại báo cáo:", self.cmb_kind)
+
+        self.date_edit = QDateEdit(QDate.currentDate())
+        self.date_edit.setCalendarPopup(True)
+        self.date_edit.setDisplayFormat("dd/MM/yyyy")
+        layout.addRow("Ngày (thuộc kỳ báo cáo):", self.date_edit)
+
+        self.cmb_shift = QComboBox()
+        for shift in shifts:
+            self.cmb_shift.addItem(f"{shift['name']} ({shift['start']} - {shift['end']})")
+        layout.addRow("Ca:", self.cmb_shift)
+
+        self.cmb_format = QComboBox()
+        self.cmb_format.addItem("Excel (.xlsx)", "xlsx")
+        self.cmb_format.addItem("CSV", "csv")
+        self.cmb_format.setCurrentIndex(max(0, self.cmb_format.findData(default_format)))
+        layout.addRow("Định dạng:", self.cmb_format)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+        self._update_shift_enabled()
+
+    def _update_shift_enabled(self):
+        self.cmb_shift.setEnabled(self.cmb_kind.currentData() == "shift")
+
+    def selection(self):
+        """(loại, ngày, ca hoặc None, định dạng)"""
+        kind = self.cmb_kind.currentData()
+        shift = self.shifts[self.cmb_shift.currentIndex()] if kind == "shift" else None
+        return kind, self.date_edit.date().toPyDate(), shift, self.cmb_format.currentData()
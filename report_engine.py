@@ -0,0 +1,190 @@
+"""
+Xuất báo cáo doanh thu / lưu lượng cho khoảng thời gian bất kỳ (ngày, tuần, tháng, ca)
+- Lọc theo khoảng nửa mở [bắt đầu, kết thúc) trên cột timestamp: dùng được index checkin_time / checkout_time
+- Đọc bằng server-side cursor theo từng lô, ghi xlsx (workbook write-only) hoặc CSV từng dòng:
+  RAM không tăng theo số phiên
+"""
+import csv
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from openpyxl import Workbook
+
+REPORT_KINDS = ("day", "week", "month", "shift")
+FETCH_SIZE = 2000  # Số dòng mỗi lần lấy từ server-side cursor
+
+SHEET_OUT = "Xe Ra (Doanh Thu)"
+SHEET_IN = "Xe Vào (Lưu Lượng)"
+HEADERS_OUT = ["Mã Thẻ", "Loại Xe", "Giờ Vào", "Giờ Ra", "Số Tiền"]
+HEADERS_IN = ["Mã Thẻ", "Loại Xe", "Giờ Vào", "Trạng Thái"]
+
+# status = 0 khớp index riêng phần sessions_checkout_time_idx
+QUERY_OUT = """
+    SELECT card_id,
+           CASE WHEN vehicle_type = 'MONTH' THEN 'Xe Tháng' ELSE 'Vãng Lai' END,
+           to_char(checkin_time, 'DD/MM/YYYY HH24:MI:SS'),
+           to_char(checkout_time, 'DD/MM/YYYY HH24:MI:SS'),
+           price
+    FROM sessions
+    WHERE status = 0 AND checkout_time >= %s AND checkout_time < %s
+    ORDER BY checkout_time ASC
+"""
+# status = 2: phiên mở trùng thẻ bị đóng tự động khi nâng cấp DB (không có giờ ra / phí, xem db_migrations.py)
+QUERY_IN = """
+    SELECT card_id,
+           CASE WHEN vehicle_type = 'MONTH' THEN 'Xe Tháng' ELSE 'Vãng Lai' END,
+           to_char(checkin_time, 'DD/MM/YYYY HH24:MI:SS'),
+           CASE status WHEN 1 THEN 'Đang gửi' WHEN 2 THEN 'Phiên trùng (đã đóng)' ELSE 'Đã ra' END
+    FROM sessions
+    WHERE checkin_time >= %s AND checkin_time < %s
+    ORDER BY checkin_time ASC
+"""
+
+
+def _parse_clock(value: str) -> time:
+    hour, minute = str(value).split(":")[:2]
+    return time(int(hour), int(minute))
+
+
+def report_range(kind: str, day: date, shift: Optional[dict] = None) -> Tuple[datetime, datetime, str]:
+    """
+    Khoảng thời gian [bắt đầu, kết thúc) và nhãn (dùng đặt tên file) của báo cáo chứa ngày day.
+
+    Args:
+        kind: "day" | "week" (thứ Hai - Chủ Nhật) | "month" | "shift"
+        shift: {"name", "start": "HH:MM", "end": "HH:MM"} khi kind = "shift";
+               end <= start nghĩa là ca qua đêm, kết thúc vào ngày hôm sau
+    """
+    if kind == "day":
+        start = datetime.combine(day, time.min)
+        return start, start + timedelta(days=1), day.strftime("%d-%m-%Y")
+    if kind == "week":
+        monday = day - timedelta(days=day.weekday())
+        start = datetime.combine(monday, time.min)
+        sunday = monday + timedelta(days=6)
+        return start, start + timedelta(days=7), f"Tuan_{monday:%d-%m-%Y}_{sunday:%d-%m-%Y}"
+    if kind == "month":
+        first = day.replace(day=1)
+        next_month = (first + timedelta(days=32)).replace(day=1)
+        return datetime.combine(first, time.min), datetime.combine(next_month, time.min), f"Thang_{first:%m-%Y}"
+    if kind == "shift":
+        if not shift:
+            raise ValueError("Chưa chọn ca làm việc")
+        start = datetime.combine(day, _parse_clock(shift["start"]))
+        end = datetime.combine(day, _parse_clock(shift["end"]))
+        if end <= start:
+            end += timedelta(days=1)
+        name = "".join(c if c.isalnum() else "_" for c in shift.get("name", "Ca"))
+        return start, end, f"{day:%d-%m-%Y}_{name}"
+    raise ValueError(f"Loại báo cáo không hợp lệ: {kind}")
+
+
+def _stream(conn, name: str, query: str, params: tuple, fetch_size: int) -> Iterable[tuple]:
+    """Đọc từng lô bằng server-side cursor (named cursor), không nạp hết vào RAM"""
+    with conn.cursor(name=name) as cursor:
+        cursor.itersize = fetch_size
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+
+
+class XlsxReportWriter:
+    """Workbook write-only: mỗi dòng được ghi thẳng ra file tạm, không giữ trong RAM"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+
+    def begin(self, title: str, headers: List[str]):
+        self.sheet = self.workbook.create_sheet(title)
+        self.sheet.append(headers)
+
+    def write(self, row):
+        self.sheet.append(list(row))
+
+    def close(self):
+        self.workbook.save(self.file_path)
+        return [self.file_path]
+
+    def discard(self):
+        """Lỗi giữa chừng: không lưu file (chưa có gì trên đĩa)"""
+        self.workbook = None
+
+
+class CsvReportWriter:
+    """Mỗi sheet 1 file CSV (<tên>_xe_ra.csv, <tên>_xe_vao.csv), mã hóa utf-8-sig để Excel mở đúng tiếng Việt"""
+
+    SUFFIXES = {SHEET_OUT: "xe_ra", SHEET_IN: "xe_vao"}
+
+    def __init__(self, file_path: str):
+        self.base_path = os.path.splitext(file_path)[0]
+        self.paths = []
+        self._file = None
+        self._writer = None
+
+    def begin(self, title: str, headers: List[str]):
+        self._close_file()
+        path = f"{self.base_path}_{self.SUFFIXES.get(title, len(self.paths))}.csv"
+        self._file = open(path, "w", newline="", encoding="utf-8-sig")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(headers)
+        self.paths.append(path)
+
+    def write(self, row):
+        self._writer.writerow(row)
+
+    def _close_file(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self._close_file()
+        return self.paths
+
+    def discard(self):
+        """Lỗi giữa chừng: xóa các file CSV dở dang"""
+        self._close_file()
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def write_report(conn, start: datetime, end: datetime, file_path: str, fmt: str = "xlsx",
+                 fetch_size: int = FETCH_SIZE) -> dict:
+    """
+    Ghi báo cáo 2 phần (Doanh Thu theo giờ ra, Lưu Lượng theo giờ vào) trong khoảng [start, end).
+    Trả về: {"out": số xe ra, "in": số xe vào, "revenue": tổng tiền, "files": [đường dẫn]}
+    """
+    writer = CsvReportWriter(file_path) if fmt == "csv" else XlsxReportWriter(file_path)
+    try:
+        writer.begin(SHEET_OUT, HEADERS_OUT)
+        count_out = 0
+        revenue = 0
+        for row in _stream(conn, "report_out", QUERY_OUT, (start, end), fetch_size):
+            writer.write(row)
+            count_out += 1
+            revenue += row[4] or 0
+        if count_out:
+            writer.write(["TỔNG CỘNG", "", "", "", revenue])
+        else:
+            writer.write(["Không có dữ liệu"])
+
+        writer.begin(SHEET_IN, HEADERS_IN)
+        count_in = 0
+        for row in _stream(conn, "report_in", QUERY_IN, (start, end), fetch_size):
+            writer.write(row)
+            count_in += 1
+        if not count_in:
+            writer.write(["Không có dữ liệu"])
+        files = writer.close()
+    except Exception:
+        writer.discard()
+        raise
+    finally:
+        conn.rollback()  # Đóng transaction của server-side cursor (chỉ đọc)
+    return {"out": count_out, "in": count_in, "revenue": revenue, "files": files}
@@ -0,0 +1,210 @@
+"""
+Hộp thoại tra cứu ảnh phiên gửi xe (giải quyết khiếu nại khi xe ra)
+Hiển thị ảnh vào/ra cạnh nhau từ cache ảnh thu nhỏ, nhấp đúp để mở ảnh gốc.
+"""
+from datetime import datetime
+from typing import Dict, List
+
+from PyQt5.QtCore import Qt, QDate, pyqtSignal
+from PyQt5.QtGui import QFont, QPixmap
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel, QLineEdit,
+                             QPushButton, QTableWidget, QTableWidgetItem, QAbstractItemView,
+                             QCheckBox, QDateEdit, QScrollArea, QHeaderView)
+
+from db_service import DbService
+from file_manager import FileManager
+from thumbnail_cache import ThumbnailCache
+
+IMAGE_COLUMNS = [
+    ("checkin_img_front", "VÀO - TRƯỚC"),
+    ("checkin_img_rear", "VÀO - SAU"),
+    ("checkout_img_front", "RA - TRƯỚC"),
+    ("checkout_img_rear", "RA - SAU"),
+]
+PREFETCH_ROWS = 20  # Đọc trước ảnh thu nhỏ của N phiên đầu danh sách
+
+
+class ThumbnailLabel(QLabel):
+    """Ô hiển thị 1 ảnh thu nhỏ, nhấp đúp để mở ảnh gốc"""
+
+    double_clicked = pyqtSignal(str)
+
+    def __init__(self, title: str, parent=None):
+        super().__init__(parent)
+        self.title = title
+        self.reference = ""
+        self.setMinimumSize(320, 180)
+        self.setAlignment(Qt.AlignCenter)
+        self.setStyleSheet("background-color: black; border: 1px solid gray; color: #aaa;")
+        self.setText(title)
+
+    def mouseDoubleClickEvent(self, event):
+        if self.reference:
+            self.double_clicked.emit(self.reference)
+
+
+class SessionViewerDialog(QDialog):
+    """Tra cứu phiên theo mã thẻ/ngày, xem ảnh vào và ra cạnh nhau"""
+
+    def __init__(self, db_service: DbService, file_manager: FileManager, cache: ThumbnailCache,
+                 query_timeout: float = 30.0, parent=None):
+        super().__init__(parent)
+        self.db_service = db_service
+        self.query_timeout = query_timeout
+        self.file_manager = file_manager
+        self.cache = cache
+        self.sessions: List[dict] = []
+        self.image_labels: Dict[str, ThumbnailLabel] = {}
+
+        self.setWindowTitle("Tra cứu ảnh phiên gửi xe")
+        self.setMinimumSize(1200, 750)
+        self.init_ui()
+        self.cache.thumbnail_ready.connect(self.on_thumbnail_ready)
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        # === Ô tìm kiếm ===
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(QLabel("Mã thẻ:"))
+        self.txt_card = QLineEdit()
+        self.txt_card.returnPressed.connect(self.search)
+        search_layout.addWidget(self.txt_card, 1)
+        self.chk_day = QCheckBox("Ngày vào:")
+        search_layout.addWidget(self.chk_day)
+        self.date_edit = QDateEdit(QDate.currentDate())
+        self.date_edit.setCalendarPopup(True)
+        self.date_edit.setDisplayFormat("dd/MM/yyyy")
+        search_layout.addWidget(self.date_edit)
+        self.btn_search = QPushButton("Tìm")
+        self.btn_search.clicked.connect(self.search)
+        search_layout.addWidget(self.btn_search)
+        layout.addLayout(search_layout)
+
+        # === Danh sách phiên ===
+        self.table = QTableWidget(0, 6)
+        self.table.setHorizontalHeaderLabels(["Mã Thẻ", "Loại Xe", "Giờ Vào", "Giờ Ra", "Số Tiền", "Ghi chú"])
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.itemSelectionChanged.connect(self.show_selected)
+        layout.addWidget(self.table, 1)
+
+        # === Ảnh vào/ra ===
+        grid = QGridLayout()
+        for index, (column, title) in enumerate(IMAGE_COLUMNS):
+            lbl_title = QLabel(title)
+            lbl_title.setFont(QFont("Arial", 10, QFont.Bold))
+            grid.addWidget(lbl_title, 0, index, alignment=Qt.AlignCenter)
+            label = ThumbnailLabel(title)
+            label.double_clicked.connect(self.open_full_image)
+            grid.addWidget(label, 1, index)
+            self.image_labels[column] = label
+        layout.addLayout(grid, 1)
+
+        self.lbl_status = QLabel("")
+        layout.addWidget(self.lbl_status)
+
+    def search(self):
+        if not self.btn_search.isEnabled():
+            return  # Đang chờ kết quả lần tìm trước
+        card_id = self.txt_card.text().strip() or None
+        day = self.date_edit.date().toPyDate() if self.chk_day.isChecked() else None
+        self.btn_search.setEnabled(False)
+        self.lbl_status.setText("Đang tìm...")
+        self.db_service.submit("query", "search_sessions", self.db_service.db.search_sessions, card_id, day,
+                               callback=lambda result: self.on_search_done(*result),
+                               failure=lambda msg: (False, msg), timeout=self.query_timeout)
+
+    def on_search_done(self, success, result):
+        self.btn_search.setEnabled(True)
+        if not success:
+            self.lbl_status.setText(f"Lỗi tra cứu: {result}")
+            return
+        self.sessions = result
+        self.table.setRowCount(len(result))
+        for row, session in enumerate(result):
+            values = [
+                session["card_id"],
+                "Xe Tháng" if session["vehicle_type"] == "MONTH" else "Vãng Lai",
+                _format_time(session["checkin_time"]),
+                _format_status(session),
+                f"{session['price'] or 0:,}",
+                session.get("img_error") or "",
+            ]
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, QTableWidgetItem(str(value)))
+        # Đọc trước ảnh của các phiên đầu danh sách để chuyển phiên không phải chờ
+        for session in result[:PREFETCH_ROWS]:
+            for column, _ in IMAGE_COLUMNS:
+                self.cache.prefetch(session.get(column) or "")
+        self.lbl_status.setText(f"Tìm thấy {len(result)} phiên")
+        if result:
+            self.table.selectRow(0)
+
+    def show_selected(self):
+        rows = self.table.selectionModel().selectedRows()
+        if not rows:
+            return
+        session = self.sessions[rows[0].row()]
+        for column, _ in IMAGE_COLUMNS:
+            label = self.image_labels[column]
+            label.reference = session.get(column) or ""
+            self._update_label(label)
+
+    def on_thumbnail_ready(self, reference: str):
+        for label in self.image_labels.values():
+            if label.reference == reference:
+                self._update_label(label)
+
+    def _update_label(self, label: ThumbnailLabel):
+        if not label.reference:
+            label.clear()
+            label.setText(f"{label.title}\n(Không có ảnh)")
+            return
+        pixmap = self.cache.get(label.reference)
+        if pixmap is not None:
+            label.setPixmap(pixmap.scaled(label.contentsRect().size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        elif self.cache.is_missing(label.reference):
+            label.clear()
+            label.setText(f"{label.title}\n(Không tìm thấy ảnh)")
+        else:
+            label.clear()
+            label.setText(f"{label.title}\nĐang tải...")
+
+    def done(self, result):
+        # Cache dùng chung với MainWindow, sống lâu hơn hộp thoại
+        self.cache.thumbnail_ready.disconnect(self.on_thumbnail_ready)
+        super().done(result)
+
+    def open_full_image(self, reference: str):
+        """Mở ảnh gốc (kích thước đầy đủ) trong cửa sổ riêng"""
+        data = self.file_manager.read_image(reference)
+        pixmap = QPixmap()
+        if not data or not pixmap.loadFromData(data, "JPG"):
+            self.lbl_status.setText(f"Không mở được ảnh {reference}")
+            return
+        dialog = QDialog(self)
+        dialog.setWindowTitle(reference)
+        dialog_layout = QVBoxLayout(dialog)
+        scroll = QScrollArea()
+        image_label = QLabel()
+        image_label.setPixmap(pixmap)
+        scroll.setWidget(image_label)
+        dialog_layout.addWidget(scroll)
+        dialog.resize(min(pixmap.width() + 40, 1600), min(pixmap.height() + 40, 950))
+        dialog.exec_()
+
+
+def _format_status(session: dict) -> str:
+    """Cột Giờ Ra: giờ ra, đang gửi, hoặc phiên trùng đã đóng khi nâng cấp DB (status = 2)"""
+    if session["status"] == 1:
+        return "Đang gửi"
+    if session["status"] == 0:
+        return _format_time(session["checkout_time"])
+    return "Phiên trùng (đã đóng)"
+
+
+def _format_time(value) -> str:
+    return value.strftime("%d/%m/%Y %H:%M:%S") if isinstance(value, datetime) else ""
@@ -0,0 +1,269 @@
+"""
+Bảo trì thư mục lưu ảnh chạy nền (độ ưu tiên thấp, giới hạn tốc độ)
+- Nén lại ảnh cũ hơn N ngày (chất lượng/độ phân giải thấp hơn)
+- Xóa ảnh quá thời hạn lưu trữ
+- Giữ dung lượng trống trên mức tối thiểu (xóa ngày cũ nhất trước)
+Hỗ trợ cả file JPEG rời và pack theo ngày (image_pack.py).
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PyQt5.QtCore import QThread
+
+from image_pack import (INDEX_FILENAME as PACK_INDEX_FILENAME, PACK_FILENAME, PackWriter, fsync_directory,
+                        fsync_file, scan_pack)
+from image_writer import ImageWriter
+from logger import ParkingLogger
+
+DAY_FOLDER_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+RECOMPRESSED_MARKER = ".recompressed"
+
+
+class StorageMaintenance(QThread):
+    """Thread bảo trì kho ảnh, chạy định kỳ ở độ ưu tiên thấp"""
+
+    def __init__(self, save_directory: str, storage_cfg: dict, logger: ParkingLogger,
+                 writer: Optional[ImageWriter] = None):
+        """
+        Args:
+            save_directory: Thư mục gốc lưu ảnh
+            storage_cfg: ConfigManager.get_storage_config()
+            writer: ImageWriter đang ghi ảnh trực tiếp (tạm dừng khi nó còn hàng đợi)
+        """
+        super().__init__()
+        self.save_directory = save_directory
+        self.logger = logger
+        self.writer = writer
+        self.recompress_after_days = storage_cfg["recompress_after_days"]
+        self.recompress_quality = storage_cfg["recompress_quality"]
+        self.recompress_max_width = storage_cfg["recompress_max_width"]
+        self.retention_days = storage_cfg["retention_days"]
+        self.min_free_bytes = int(storage_cfg["min_free_gb"] * 1024 ** 3)
+        self.interval = storage_cfg["maintenance_interval_minutes"] * 60
+        self.file_delay = 1.0 / storage_cfg["maintenance_files_per_second"] \
+            if storage_cfg["maintenance_files_per_second"] > 0 else 0
+        self._stop_event = threading.Event()
+
+    def start(self, priority=QThread.LowestPriority):
+        super().start(priority)
+
+    def run(self):
+        # Chờ ứng dụng khởi động xong rồi mới chạy lượt đầu
+        if self._stop_event.wait(60):
+            return
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"Lỗi bảo trì kho ảnh: {e}")
+            if self._stop_event.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self.wait(5000)
+
+    def run_once(self, today: Optional[date] = None):
+        """Một lượt bảo trì: xóa quá hạn -> giữ dung lượng trống -> nén lại ảnh cũ"""
+        today = today or date.today()
+        start = time.monotonic()
+        deleted = self._apply_retention(today)
+        freed = self._ensure_free_space(today)
+        recompressed = self._recompress_old_days(today)
+        total = deleted + freed + recompressed
+        if total:
+            self.logger.info(f"Bảo trì kho ảnh: giải phóng {_format_bytes(total)} "
+                             f"(xóa quá hạn {_format_bytes(deleted)}, giữ chỗ trống {_format_bytes(freed)}, "
+                             f"nén lại {_format_bytes(recompressed)}) trong {time.monotonic() - start:.0f}s")
+
+    # --- Danh sách ngày ---
+    def _day_folders(self) -> List[Tuple[date, str]]:
+        """Các thư mục ngày (cũ -> mới)"""
+        days = []
+        try:
+            names = os.listdir(self.save_directory)
+        except OSError:
+            return days
+        for name in names:
+            if not DAY_FOLDER_PATTERN.match(name):
+                continue
+            try:
+                day = datetime.strptime(name, "%Y-%m-%d").date()
+            except ValueError:
+                continue
+            days.append((day, os.path.join(self.save_directory, name)))
+        return sorted(days)
+
+    # --- Xóa ---
+    def _apply_retention(self, today: date) -> int:
+        if not self.retention_days:
+            return 0
+        cutoff = today - timedelta(days=self.retention_days)
+        reclaimed = 0
+        for day, directory in self._day_folders():
+            if day >= cutoff or self._stop_event.is_set():
+                break
+            reclaimed += self._delete_day(directory, "quá hạn lưu trữ")
+        return reclaimed
+
+    def _ensure_free_space(self, today: date) -> int:
+        if not self.min_free_bytes:
+            return 0
+        reclaimed = 0
+        for day, directory in self._day_folders():
+            if day >= today or self._stop_event.is_set():
+                break  # Không bao giờ xóa ảnh của ngày hiện tại
+            free = shutil.disk_usage(self.save_directory).free
+            if free >= self.min_free_bytes:
+                break
+            self.logger.warning(f"Ổ lưu ảnh còn {_format_bytes(free)}, "
+                                f"dưới mức tối thiểu {_format_bytes(self.min_free_bytes)}")
+            reclaimed += self._delete_day(directory, "thiếu dung lượng trống")
+        return reclaimed
+
+    def _delete_day(self, directory: str, reason: str) -> int:
+        size = _directory_size(directory)
+        try:
+            shutil.rmtree(directory)
+        except OSError as e:
+            self.logger.error(f"Không xóa được {directory}: {e}")
+            return 0
+        self.logger.info(f"Đã xóa {directory} ({reason}), giải phóng {_format_bytes(size)}")
+        return size
+
+    # --- Nén lại ---
+    def _recompress_old_days(self, today: date) -> int:
+        if not self.recompress_after_days:
+            return 0
+        cutoff = today - timedelta(days=self.recompress_after_days)
+        reclaimed = 0
+        for day, directory in self._day_folders():
+            if day >= cutoff or self._stop_event.is_set():
+                break
+            marker = os.path.join(directory, RECOMPRESSED_MARKER)
+            if os.path.exists(marker):
+                continue
+            before = _directory_size(directory)
+            if os.path.exists(os.path.join(directory, PACK_FILENAME)):
+                done = self._recompress_pack(directory)
+            else:
+                done = self._recompress_files(directory)
+            if not done:
+                continue  # Bị dừng giữa chừng: lượt sau làm tiếp
+            open(marker, "w").close()
+            saved = before - _directory_size(directory)
+            reclaimed += max(0, saved)
+            self.logger.info(f"Đã nén lại ảnh {os.path.basename(directory)}, giảm {_format_bytes(saved)}")
+        return reclaimed
+
+    def _recompress(self, data: bytes) -> Optional[bytes]:
+        """Nén lại 1 ảnh JPEG, None nếu không nhỏ hơn bản gốc"""
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return None
+        h, w = frame.shape[:2]
+        if self.recompress_max_width and w > self.recompress_max_width:
+            scale = self.recompress_max_width / w
+            frame = cv2.resize(frame, (self.recompress_max_width, int(h * scale)), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.recompress_quality])
+        if not ok or len(encoded) >= len(data):
+            return None
+        return encoded.tobytes()
+
+    def _throttle(self) -> bool:
+        """Nhường tài nguyên cho ảnh chụp trực tiếp, trả về False nếu được yêu cầu dừng"""
+        while self.writer is not None and self.writer.pending() > 0:
+            if self._stop_event.wait(0.5):
+                return False
+        return not self._stop_event.wait(self.file_delay) if self.file_delay else not self._stop_event.is_set()
+
+    def _recompress_files(self, directory: str) -> bool:
+        try:
+            for name in sorted(os.listdir(directory)):
+                if not name.lower().endswith(".jpg"):
+                    continue
+                if not self._throttle():
+                    return False
+                path = os.path.join(directory, name)
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    smaller = self._recompress(data)
+                    if smaller is None:
+                        continue
+                    # Thay bản duy nhất của ảnh: dữ liệu mới phải nằm trên đĩa trước khi đổi tên
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(smaller)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    self.logger.error(f"Lỗi nén lại {path}: {e}")
+        finally:
+            fsync_directory(directory)
+        return True
+
+    def _recompress_pack(self, directory: str) -> bool:
+        """Ghi pack mới với ảnh đã nén lại rồi thay thế pack cũ (ngày cũ không còn được ghi thêm)"""
+        pack_path = os.path.join(directory, PACK_FILENAME)
+        index_path = os.path.join(directory, PACK_INDEX_FILENAME)
+        work_directory = os.path.join(directory, ".recompress")
+        shutil.rmtree(work_directory, ignore_errors=True)
+        os.makedirs(work_directory)
+        writer = PackWriter()
+        try:
+            with open(pack_path, "rb") as pack:
+                for name, offset, length in scan_pack(pack_path):
+                    if not self._throttle():
+                        return False
+                    pack.seek(offset)
+                    data = pack.read(length)
+                    writer.append(work_directory, name, self._recompress(data) or data)
+            work_pack = os.path.join(work_directory, PACK_FILENAME)
+            work_index = os.path.join(work_directory, PACK_INDEX_FILENAME)
+            fsync_file(work_pack)
+            fsync_file(work_index)
+            fsync_directory(work_directory)
+            # Xóa chỉ mục cũ trước khi thay pack: mất điện ở bất kỳ bước nào thì hoặc pack và chỉ mục
+            # khớp nhau, hoặc không có chỉ mục (PackReader quét lại pack), không bao giờ chỉ mục cũ + pack mới
+            if os.path.exists(index_path):
+                os.remove(index_path)
+                fsync_directory(directory)
+            os.replace(work_pack, pack_path)
+            fsync_directory(directory)
+            os.replace(work_index, index_path)
+            fsync_directory(directory)
+        except OSError as e:
+            # Windows: pack đang được mmap để xem ảnh thì không thay được, lượt sau thử lại
+            self.logger.error(f"Lỗi nén lại pack {pack_path}: {e}")
+            return False
+        finally:
+            shutil.rmtree(work_directory, ignore_errors=True)
+        return True
+
+
+def _directory_size(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
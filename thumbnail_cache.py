@@ -0,0 +1,167 @@
+"""
+Cache ảnh thu nhỏ (QPixmap) cho tra cứu ảnh phiên gửi xe
+- LRU giới hạn theo dung lượng RAM (ảnh ít dùng nhất bị bỏ trước)
+- Đọc/giải mã ở thread nền, GUI nhận signal thumbnail_ready khi ảnh sẵn sàng
+"""
+import collections
+import threading
+import time
+from typing import Dict, Optional
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+from file_manager import FileManager
+
+
+class ThumbnailLoader(QThread):
+    """Thread đọc ảnh thu nhỏ theo yêu cầu: ảnh đang hiển thị trước, đọc trước (prefetch) theo thứ tự gửi"""
+
+    # Signal: (tham chiếu ảnh, QImage - rỗng nếu không đọc được)
+    loaded = pyqtSignal(str, QImage)
+
+    def __init__(self, file_manager: FileManager, width: int):
+        super().__init__()
+        self.file_manager = file_manager
+        self.width = width
+        self._requests = collections.deque()
+        self._cond = threading.Condition()
+        self._running = True
+
+    def request(self, reference: str, urgent: bool = False):
+        """urgent: ảnh đang hiển thị, đọc trước mọi ảnh prefetch"""
+        with self._cond:
+            if urgent:
+                self._requests.appendleft(reference)
+            else:
+                self._requests.append(reference)
+            self._cond.notify()
+
+    def promote(self, reference: str):
+        """Ảnh đã nằm trong hàng đợi (do prefetch) vừa được hiển thị: đưa lên đầu hàng đợi"""
+        with self._cond:
+            try:
+                self._requests.remove(reference)
+            except ValueError:
+                return  # Đang đọc hoặc đã đọc xong
+            self._requests.appendleft(reference)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._requests:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                reference = self._requests.popleft()
+            image = QImage()
+            try:
+                data = self.file_manager.read_thumbnail(reference, self.width)
+                if data:
+                    image.loadFromData(data, "JPG")
+            except Exception as e:
+                if self.file_manager.logger:
+                    self.file_manager.logger.error(f"Lỗi đọc ảnh thu nhỏ {reference}: {e}")
+            self.loaded.emit(reference, image)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self.wait(2000)
+
+
+class ThumbnailCache(QObject):
+    """Cache LRU QPixmap ảnh thu nhỏ, chỉ dùng từ GUI thread"""
+
+    # Signal: tham chiếu ảnh vừa có trong cache (hoặc không đọc được: get() vẫn trả None)
+    thumbnail_ready = pyqtSignal(str)
+
+    def __init__(self, file_manager: FileManager, memory_mb: int = 64, width: int = 320,
+                 retry_after: float = 30.0):
+        """
+        Args:
+            memory_mb: Dung lượng RAM tối đa cho các QPixmap trong cache
+            width: Chiều rộng ảnh thu nhỏ
+            retry_after: Ảnh đọc lỗi được thử đọc lại sau N giây (ảnh đang ghi dở, ổ mạng chập chờn...)
+        """
+        super().__init__()
+        self.file_manager = file_manager
+        self.budget = memory_mb * 1024 * 1024
+        self._pixmaps: "collections.OrderedDict[str, QPixmap]" = collections.OrderedDict()
+        self._used = 0
+        self._requested = set()
+        self.retry_after = retry_after
+        self._failed: Dict[str, float] = {}  # tham chiếu -> thời điểm (monotonic) đọc lỗi
+        self.hits = 0
+        self.misses = 0
+
+        self._loader = ThumbnailLoader(file_manager, width)
+        self._loader.loaded.connect(self._on_loaded)
+        self._loader.start(QThread.LowPriority)
+
+    @staticmethod
+    def _cost(pixmap: QPixmap) -> int:
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
+
+    def get(self, reference: str) -> Optional[QPixmap]:
+        """Ảnh thu nhỏ nếu đã có trong cache; chưa có thì đọc ở nền và trả None (chờ thumbnail_ready)"""
+        if not reference:
+            return None
+        pixmap = self._pixmaps.get(reference)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(reference)
+            self.hits += 1
+            return pixmap
+        self.misses += 1
+        self._request(reference, urgent=True)
+        return None
+
+    def prefetch(self, reference: str):
+        """Đọc trước ảnh vào cache, sau các ảnh đang hiển thị (không làm gì nếu đã có hoặc đang đọc)"""
+        if reference and reference not in self._pixmaps and reference not in self._requested:
+            self._request(reference, urgent=False)
+
+    def _request(self, reference: str, urgent: bool):
+        if reference in self._requested:
+            if urgent:
+                self._loader.promote(reference)
+            return
+        if self.is_missing(reference):
+            return
+        self._requested.add(reference)
+        self._loader.request(reference, urgent)
+
+    def is_missing(self, reference: str) -> bool:
+        """Ảnh không đọc được (đã bị xóa hoặc lỗi ghi) trong retry_after giây gần đây"""
+        failed_at = self._failed.get(reference)
+        if failed_at is None:
+            return False
+        if time.monotonic() - failed_at >= self.retry_after:
+            del self._failed[reference]
+            return False
+        return True
+
+    def _on_loaded(self, reference: str, image: QImage):
+        self._requested.discard(reference)
+        if image.isNull():
+            self._failed[reference] = time.monotonic()
+        elif reference not in self._pixmaps:
+            pixmap = QPixmap.fromImage(image)
+            self._pixmaps[reference] = pixmap
+            self._used += self._cost(pixmap)
+            while self._used > self.budget and len(self._pixmaps) > 1:
+                _, evicted = self._pixmaps.popitem(last=False)
+                self._used -= self._cost(evicted)
+        self.thumbnail_ready.emit(reference)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "count": len(self._pixmaps),
+            "memory_mb": self._used / (1024 * 1024),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def stop(self):
+        self._loader.stop()